@@ -0,0 +1,206 @@
+"""
+Approximate-nearest-neighbor index types for the log index, chosen by corpus size
+"""
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+# Index types selectable via ``indexing.index_type`` in config.yaml ("auto" picks by size)
+ANN_INDEX_TYPES = {
+    "flat": "Exact search; memory and query time grow linearly with the log",
+    "hnsw": "Graph index; fast, high recall, ~1.1x flat memory, no native deletes",
+    "ivfpq": "Inverted lists with product-quantized vectors; ~30x smaller, lower recall",
+}
+
+ANN_DEFAULTS = {
+    "index_type": "auto",
+    # "auto" keeps exact search below this many vectors...
+    "flat_max_vectors": 50_000,
+    # ...uses HNSW up to this many, and IVF-PQ beyond
+    "hnsw_max_vectors": 1_000_000,
+    "hnsw_m": 32,
+    "ef_construction": 80,
+    "ef_search": 64,
+    "nprobe": 16,
+}
+
+# Query-time settings tried when reporting the recall/latency tradeoff
+TRADEOFF_EF_SEARCH = (16, 32, 64, 128, 256)
+TRADEOFF_NPROBE = (1, 4, 16, 64, 256)
+
+
+def ann_settings(indexing_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """ANN defaults overridden by the ``indexing`` section of config.yaml."""
+    settings = dict(ANN_DEFAULTS)
+    settings.update({k: v for k, v in (indexing_config or {}).items() if k in ANN_DEFAULTS and v is not None})
+    index_type = str(settings["index_type"]).lower()
+    if index_type != "auto" and index_type not in ANN_INDEX_TYPES:
+        raise ValueError(
+            f"Unsupported index type: {index_type}. Choose auto or one of: {', '.join(ANN_INDEX_TYPES)}"
+        )
+    settings["index_type"] = index_type
+    return settings
+
+
+def choose_index_type(vector_count: int, settings: Dict[str, Any]) -> str:
+    if settings["index_type"] != "auto":
+        return settings["index_type"]
+    if vector_count < settings["flat_max_vectors"]:
+        return "flat"
+    if vector_count < settings["hnsw_max_vectors"]:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    return "flat"
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW graphs cannot drop vectors; callers tombstone them instead."""
+    return index_type_of(index) != "hnsw"
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest sub-vector count dividing ``dimension`` with at least 4 dims per sub-vector."""
+    for m in (96, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def build_index(index_type: str, vectors: np.ndarray, ids: np.ndarray, settings: Dict[str, Any]) -> faiss.Index:
+    """Build an L2 index of ``index_type`` holding ``vectors`` under the int64 ``ids``.
+
+    Flat and HNSW indexes are wrapped in an IndexIDMap2; IVF-PQ stores ids
+    natively and keeps a hash table from id to list entry so vectors can be
+    removed and reconstructed.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    count, dimension = vectors.shape
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, settings["hnsw_m"])
+        hnsw.hnsw.efConstruction = settings["ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    elif index_type == "ivfpq":
+        # ~4 * sqrt(n) lists, with enough training points per list
+        nlist = int(min(max(4 * math.sqrt(count), 16), max(count // 39, 1), 65536))
+        # 8-bit codes need ~10k training points; small corpora get fewer centroids per sub-vector
+        nbits = int(min(8, max(1, math.log2(max(count // 39, 2)))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, _pq_subquantizers(dimension), nbits)
+        rng = np.random.default_rng(0)
+        sample_size = min(count, 256 * nlist)
+        sample = vectors if sample_size == count else vectors[np.sort(rng.choice(count, sample_size, replace=False))]
+        index.train(sample)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    if count:
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def reconstruct_all(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Stored vectors for ``ids`` (approximate for IVF-PQ)."""
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(ids)
+
+
+def search_parameters(
+    index: faiss.Index,
+    settings: Dict[str, Any],
+    excluded: Optional[np.ndarray] = None,
+    allowed: Optional[np.ndarray] = None,
+    **overrides: Any,
+) -> faiss.SearchParameters:
+    """Per-query search parameters: nprobe/efSearch from settings, skipping ``excluded`` ids.
+
+    With ``allowed`` only those ids are considered (they must all be live,
+    so ``excluded`` is then ignored).
+    """
+    index_type = index_type_of(index)
+    if index_type == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(overrides.get("ef_search", settings["ef_search"]))
+    elif index_type == "ivfpq":
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(overrides.get("nprobe", settings["nprobe"]))
+    else:
+        params = faiss.SearchParameters()
+    if allowed is not None:
+        allowed = np.ascontiguousarray(allowed, dtype=np.int64)
+        params._batch = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(allowed))
+        params.sel = params._batch
+    elif excluded is not None and len(excluded):
+        # Keep the selectors referenced by the params so SWIG does not free them
+        params._batch = faiss.IDSelectorBatch(len(excluded), faiss.swig_ptr(excluded))
+        params._not = faiss.IDSelectorNot(params._batch)
+        params.sel = params._not
+    return params
+
+
+def measure_tradeoff(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    settings: Dict[str, Any],
+    queries: int = 100,
+    k: int = 10,
+) -> List[Dict[str, Any]]:
+    """Recall@k against exact search and mean query latency for a range of nprobe/efSearch values.
+
+    ``vectors`` are the exact vectors stored in ``index`` under ``ids``;
+    queries are a sample of them, like a user quoting a log line.
+    """
+    index_type = index_type_of(index)
+    count = len(vectors)
+    if index_type == "flat" or count == 0:
+        return [{"recall": 1.0}]
+    rng = np.random.default_rng(0)
+    sample = np.ascontiguousarray(vectors[rng.choice(count, min(queries, count), replace=False)], dtype=np.float32)
+    k = min(k, count)
+    exact = build_index("flat", vectors, ids, settings)
+    _, truth = exact.search(sample, k)
+
+    name, values = ("ef_search", TRADEOFF_EF_SEARCH) if index_type == "hnsw" else ("nprobe", TRADEOFF_NPROBE)
+    if index_type == "ivfpq":
+        values = [v for v in values if v <= _unwrap(index).nlist]
+    report = []
+    for value in values:
+        params = search_parameters(index, settings, **{name: value})
+        started = time.perf_counter()
+        _, found = index.search(sample, k, params=params)
+        seconds = time.perf_counter() - started
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found.tolist(), truth.tolist())])
+        report.append({name: value, "recall": round(float(recall), 4), "latency_ms": round(1000 * seconds / len(sample), 3)})
+    return report
+
+
+def describe_index(index: faiss.Index, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Index type and the query-time settings it is searched with."""
+    index_type = index_type_of(index)
+    description = {"type": index_type, "vectors": int(index.ntotal), "dimension": int(index.d)}
+    if index_type == "hnsw":
+        description.update(m=settings["hnsw_m"], ef_search=settings["ef_search"])
+    elif index_type == "ivfpq":
+        ivf = _unwrap(index)
+        description.update(nlist=int(ivf.nlist), pq_m=int(ivf.pq.M), nprobe=settings["nprobe"])
+    return description
@@ -0,0 +1,174 @@
+"""
+Persistent cache of answers, keyed by index version, retrieved chunks and question
+"""
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+
+ANSWER_CACHE_FILE = "answers.sqlite"
+
+# Least recently used answers beyond this many are dropped
+ANSWER_CACHE_MAX_ENTRIES = 2000
+# Questions whose embeddings are at least this similar (cosine) share an answer
+ANSWER_SIMILARITY = 0.95
+
+_PUNCTUATION = re.compile(r"[^\w\s/\\.:\-]+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, trimmed, single-spaced question without decorative punctuation ("Any errors?!" -> "any errors")."""
+    return " ".join(_PUNCTUATION.sub(" ", question.lower()).split()).rstrip(".")
+
+
+def answer_scope(
+    index_version: str, model: str, documents: Sequence[Document], history: Sequence[BaseMessage] = ()
+) -> bytes:
+    """Key of everything an answer depends on besides the question: index state, LLM, retrieved context and conversation.
+
+    Follow-ups such as "why?" only mean something given the messages before
+    them, so those are part of the key: an answer is only reused for the
+    same conversation so far.
+    """
+    parts = []
+    for doc in documents:
+        meta = doc.metadata
+        if "start_index" in meta:
+            parts.append(f"{meta['start_index']}-{meta.get('end_index')}")
+        else:
+            # Generated documents (e.g. /regex/ matches) have no byte range
+            parts.append(hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest())
+    conversation = hashlib.sha256()
+    for message in history:
+        content = normalize_question(message.content) if message.type == "human" else message.content
+        conversation.update(f"{message.type}\0{content}\0".encode("utf-8"))
+    # The same chunks ranked differently make the same context
+    key = "\0".join([index_version, model, conversation.hexdigest()] + sorted(parts))
+    return hashlib.sha256(key.encode("utf-8")).digest()[:16]
+
+
+class AnswerCache:
+    """SQLite table of answers shared by all sessions and logs.
+
+    An answer is reused for a question when it was given over the same index
+    version and LLM with the same retrieved chunks after the same prior
+    messages, and the question is the same once normalized or, given
+    embeddings, nearly the same in meaning.
+    Any change to the log's index changes its version, so stale answers are
+    never served; they age out of the table instead, and are evicted least
+    recently used first to keep the cache within ``cache.max_size``.
+    """
+
+    name = "answer"
+
+    def __init__(self, path: Path, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY, scope BLOB NOT NULL, question TEXT NOT NULL, vector BLOB, "
+                "answer TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS answers_scope ON answers (scope, question)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used_at)")
+
+    def get(self, scope: bytes, question: str, vector: Optional[Iterable[float]] = None) -> Optional[str]:
+        """The cached answer to ``question`` (with its embedding ``vector``, if known) in ``scope``, or None."""
+        question = normalize_question(question)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, question, vector, answer FROM answers WHERE scope = ?", (scope,)
+            ).fetchall()
+            best = next((row for row in rows if row[1] == question), None)
+            if best is None and vector is not None:
+                query = np.asarray(vector, dtype=np.float32)
+                best_similarity = ANSWER_SIMILARITY
+                for row in rows:
+                    if row[2] is None:
+                        continue
+                    stored = np.frombuffer(row[2], dtype="<f4")
+                    if stored.shape != query.shape:
+                        continue
+                    similarity = float(stored @ query) / (float(np.linalg.norm(stored) * np.linalg.norm(query)) or 1.0)
+                    if similarity >= best_similarity:
+                        best, best_similarity = row, similarity
+            if best is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE answers SET used_at = ? WHERE id = ?", (time.time(), best[0]))
+            return best[3]
+
+    def put(self, scope: bytes, question: str, answer: str, vector: Optional[Iterable[float]] = None) -> None:
+        now = time.time()
+        blob = np.asarray(vector, dtype="<f4").tobytes() if vector is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (scope, question, vector, answer, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, normalize_question(question), blob, answer, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        return sum(
+            p.stat().st_size for p in self.path.parent.glob(f"{self.path.name}*") if p.is_file()
+        )
+
+    def oldest_use(self) -> Optional[float]:
+        """When the least recently used answer was last used; None if the cache is empty."""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(used_at) FROM answers").fetchone()[0]
+
+    def evict(self, excess_bytes: int, before: float) -> Tuple[int, int]:
+        """Drop least recently used answers not used since ``before`` until about ``excess_bytes`` are freed.
+
+        Returns the number of answers dropped and the bytes they took.
+        """
+        count = self.count()
+        if not count or excess_bytes <= 0:
+            return 0, 0
+        row_bytes = self.size_bytes() / count
+        with self._lock, self._conn:
+            dropped = self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers WHERE used_at < ? ORDER BY used_at LIMIT ?)",
+                (before, math.ceil(excess_bytes / row_bytes)),
+            ).rowcount
+        return dropped, int(dropped * row_bytes)
+
+    def compact(self) -> None:
+        """Give the space of evicted answers back to the file system, unless another process is using the cache."""
+        with self._lock:
+            try:
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.OperationalError:
+                # Busy; the free pages are reused by later answers
+                pass
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
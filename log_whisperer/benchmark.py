@@ -0,0 +1,143 @@
+"""
+Throughput benchmark for the embedding backends
+"""
+import multiprocessing
+import queue
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .embeddings import create_embeddings, get_embedding_backend
+from .ingest import batched
+from .records import LogRecordSplitter
+
+BENCHMARK_BATCH_SIZE = 64
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process in MB, if the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def sample_chunks(log_file: Optional[Path], samples: int) -> List[str]:
+    """Take up to ``samples`` chunks from a log, or synthesize log-like chunks."""
+    chunks = []
+    if log_file is not None:
+        for _, text in LogRecordSplitter().iter_chunks(log_file):
+            chunks.append(text)
+            if len(chunks) >= samples:
+                break
+    if not chunks:
+        levels = ["INFO", "DEBUG", "WARN", "ERROR"]
+        for i in range(samples):
+            lines = [
+                f"2024-01-01 00:{(i + j) // 60 % 60:02d}:{(i + j) % 60:02d} {levels[(i + j) % 4]} "
+                f"svc-{j % 7} request id={i * 31 + j} latency={(i * j) % 997}ms status={200 + (i + j) % 4 * 100}\n"
+                for j in range(20)
+            ]
+            chunks.append("".join(lines))
+    return chunks
+
+
+def _top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = vectors / np.maximum(norms, 1e-12)
+    query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = (queries / np.maximum(query_norms, 1e-12)) @ normalized.T
+    return np.argsort(-scores, axis=1)[:, :k].tolist()
+
+
+def _run_backend(backend_name: str, chunks: List[str], queries: List[str], k: int, results) -> None:
+    """Child-process body: measure one backend in isolation so RSS and load time are its own."""
+    try:
+        started = time.perf_counter()
+        embeddings = create_embeddings(backend_name)
+        embeddings.embed_query("warm up")
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectors = []
+        for batch in batched(chunks, BENCHMARK_BATCH_SIZE):
+            vectors.extend(embeddings.embed_documents(batch))
+        embed_seconds = time.perf_counter() - started
+
+        query_vectors = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        results.put({
+            "backend": backend_name,
+            "load_seconds": load_seconds,
+            "chunks_per_second": len(chunks) / embed_seconds if embed_seconds else float("inf"),
+            "peak_rss_mb": _peak_rss_mb(),
+            "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+            "neighbors": _top_k(vectors, query_vectors, k),
+        })
+    except Exception as e:
+        results.put({"backend": backend_name, "error": str(e)})
+
+
+def run_benchmark(
+    backends: List[str],
+    log_file: Optional[Path] = None,
+    samples: int = 256,
+    queries: int = 20,
+    k: int = 10,
+    reference: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Benchmark each backend in its own process.
+
+    Recall is the overlap of each backend's top-``k`` chunks for sample queries
+    with those of the ``reference`` backend (the first one by default), so it
+    shows how much retrieval quality a faster backend gives up.
+    """
+    for name in backends:
+        get_embedding_backend(name)
+    chunks = sample_chunks(log_file, samples)
+    # Queries are the first line of evenly spaced chunks, like a user quoting a log line
+    step = max(len(chunks) // queries, 1)
+    query_texts = [chunks[i].splitlines()[0] for i in range(0, len(chunks), step)][:queries]
+    k = min(k, len(chunks))
+
+    context = multiprocessing.get_context("spawn")
+    reports = []
+    for name in backends:
+        results = context.Queue()
+        process = context.Process(target=_run_backend, args=(name, chunks, query_texts, k, results))
+        process.start()
+        report = None
+        while report is None:
+            try:
+                report = results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    report = {"backend": name, "error": f"benchmark process exited with code {process.exitcode}"}
+        process.join()
+        report["chunks"] = len(chunks)
+        reports.append(report)
+
+    reference = reference or backends[0]
+    ref = next((r for r in reports if r["backend"] == reference and "error" not in r), None)
+    for report in reports:
+        if ref is None or "error" in report:
+            report["recall"] = None
+            continue
+        overlaps = [
+            len(set(mine) & set(theirs)) / max(len(theirs), 1)
+            for mine, theirs in zip(report["neighbors"], ref["neighbors"])
+        ]
+        report["recall"] = float(np.mean(overlaps)) if overlaps else None
+    for report in reports:
+        report.pop("neighbors", None)
+    return reports
@@ -0,0 +1,219 @@
+"""
+Size-capped LRU cache of log indexes under ~/.log-whisperer/indexes and of the shared embedding and answer caches
+"""
+import json
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Optional, Tuple, Union
+
+from .answer_cache import ANSWER_CACHE_FILE, AnswerCache
+from .config import Config
+from .embedding_cache import EMBEDDING_CACHE_FILE, EmbeddingCache
+
+LAST_ACCESS_FILE = ".last_access"
+DEFAULT_MAX_SIZE = "5GB"
+# Indexes used this recently are never evicted: another session may have them open
+IN_USE_GRACE = 15 * 60
+# Open sessions mark their index as used this often, well within IN_USE_GRACE
+LEASE_INTERVAL = IN_USE_GRACE / 3
+
+_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value: Union[int, str]) -> int:
+    """Parse a byte size such as ``1073741824``, ``"500MB"`` or ``"5 GiB"``."""
+    if isinstance(value, int):
+        return value
+    match = _SIZE_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid size: {value!r} (use e.g. 500MB or 5GB)")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def touch_index(index_dir: Path) -> None:
+    """Record that an index was just used, for LRU eviction."""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    (index_dir / LAST_ACCESS_FILE).touch()
+
+
+class IndexLease(threading.Thread):
+    """Daemon thread that keeps marking an index as used while a session has it open.
+
+    Sessions can last far longer than IN_USE_GRACE, so touching the index
+    only when it is loaded would let another process evict it from under
+    them (and a later persist recreate it half written).
+    """
+
+    def __init__(self, index_dir: Path, interval: float = LEASE_INTERVAL):
+        super().__init__(name="index-lease", daemon=True)
+        self.index_dir = Path(index_dir)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            # Never recreate a directory that was removed (e.g. by cache --clear)
+            if self.index_dir.is_dir():
+                try:
+                    touch_index(self.index_dir)
+                except OSError:
+                    pass
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=5)
+
+
+class IndexCacheEntry:
+    """One index directory and what its manifest says about it."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size_bytes = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+        marker = path / LAST_ACCESS_FILE
+        manifest_path = path / "manifest.json"
+        stamp = marker if marker.exists() else manifest_path if manifest_path.exists() else path
+        self.last_access = stamp.stat().st_mtime
+        self.manifest: Dict[str, Any] = {}
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def log_path(self) -> Optional[str]:
+        return (self.manifest.get("log") or {}).get("path")
+
+    @property
+    def log_exists(self) -> bool:
+        return self.log_path is not None and Path(self.log_path).exists()
+
+    @property
+    def chunks(self) -> int:
+        return sum(info.get("chunks", 0) for info in (self.manifest.get("shards") or {}).values())
+
+
+class IndexCacheManager:
+    """Keeps ``config_dir`` under a byte budget by evicting what was least recently used.
+
+    The budget comes from ``cache.max_size`` in config.yaml (default 5GB) and
+    covers the index directories under ``indexes/`` as well as the embedding
+    and answer caches shared by all logs, whose entries are evicted one by
+    one in the same least-recently-used order as whole indexes.
+    """
+
+    def __init__(self, config: Optional[Config] = None, max_bytes: Optional[int] = None):
+        self.config = config or Config()
+        self.base_dir = self.config.config_dir / "indexes"
+        if max_bytes is None:
+            max_bytes = parse_size(self.config.get_cache_config().get("max_size", DEFAULT_MAX_SIZE))
+        self.max_bytes = max_bytes
+        # Entries and bytes evicted from each shared cache by the last prune, by cache name
+        self.evicted_entries: Dict[str, Tuple[int, int]] = {}
+
+    def entries(self) -> List[IndexCacheEntry]:
+        """All cached indexes, most recently used first."""
+        if not self.base_dir.exists():
+            return []
+        entries = []
+        for path in self.base_dir.iterdir():
+            if not path.is_dir():
+                continue
+            try:
+                entries.append(IndexCacheEntry(path))
+            except OSError:
+                # Removed concurrently by another session
+                continue
+        return sorted(entries, key=lambda entry: entry.last_access, reverse=True)
+
+    def shared_caches(self) -> List[Union[EmbeddingCache, AnswerCache]]:
+        """The embedding and answer caches that exist on disk."""
+        caches = []
+        for file_name, cache_class in ((EMBEDDING_CACHE_FILE, EmbeddingCache), (ANSWER_CACHE_FILE, AnswerCache)):
+            path = self.config.config_dir / file_name
+            if path.exists():
+                caches.append(cache_class(path))
+        return caches
+
+    def total_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self.entries()) + sum(
+            cache.size_bytes() for cache in self.shared_caches()
+        )
+
+    def remove(self, entry: IndexCacheEntry) -> None:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    def prune(
+        self,
+        max_bytes: Optional[int] = None,
+        keep: Collection[Path] = (),
+        grace: float = IN_USE_GRACE,
+    ) -> List[IndexCacheEntry]:
+        """Evict least recently used indexes and shared cache entries until everything fits ``max_bytes``.
+
+        Returns the evicted indexes; what was evicted from the shared caches
+        is left in ``evicted_entries``. Indexes in ``keep``, and indexes and
+        entries used within ``grace`` seconds, are never evicted.
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        keep = {Path(p).resolve() for p in keep}
+        now = time.time()
+        entries = self.entries()
+        indexes = [
+            entry for entry in reversed(entries)
+            if entry.path.resolve() not in keep and now - entry.last_access >= grace
+        ]
+        shared = self.shared_caches()
+        caches = list(shared)
+        total = sum(entry.size_bytes for entry in entries) + sum(cache.size_bytes() for cache in shared)
+        self.evicted_entries = {}
+        evicted = []
+        while total > budget:
+            oldest = [(cache.oldest_use(), cache) for cache in caches]
+            oldest = [(used, cache) for used, cache in oldest if used is not None and used < now - grace]
+            used, cache = min(oldest, key=lambda item: item[0], default=(None, None))
+            if indexes and (cache is None or indexes[0].last_access <= used):
+                entry = indexes.pop(0)
+                self.remove(entry)
+                total -= entry.size_bytes
+                evicted.append(entry)
+                continue
+            if cache is None:
+                break
+            # Entries older than the next index to evict (or the grace period) go first
+            before = min(now - grace, indexes[0].last_access) if indexes else now - grace
+            dropped, freed = cache.evict(total - budget, before)
+            if not dropped:
+                caches.remove(cache)
+                continue
+            count, size = self.evicted_entries.get(cache.name, (0, 0))
+            self.evicted_entries[cache.name] = (count + dropped, size + freed)
+            total -= freed
+        for cache in shared:
+            if cache.name in self.evicted_entries:
+                cache.compact()
+        return evicted
+
+    def prune_missing(self, keep: Collection[Path] = ()) -> List[IndexCacheEntry]:
+        """Evict indexes whose log file no longer exists."""
+        keep = {Path(p).resolve() for p in keep}
+        evicted = []
+        for entry in self.entries():
+            if not entry.log_exists and entry.path.resolve() not in keep:
+                self.remove(entry)
+                evicted.append(entry)
+        return evicted
@@ -3,12 +3,15 @@ Chat interface with memory persistence for log analysis
 """
 import os
 import json
+import re
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 import click
 from rich.console import Console
 from rich.markdown import Markdown
+from rich.markup import escape
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
 import rich.spinner
@@ -16,19 +19,26 @@ from prompt_toolkit import prompt
 from prompt_toolkit.history import FileHistory
 from langchain.schema import BaseMessage
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 import hashlib
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_community.chat_message_histories import FileChatMessageHistory
 
+from .answer_cache import ANSWER_CACHE_FILE, AnswerCache, answer_scope
+from .cache import IndexLease
 from .config import Config
+from .embedding_cache import CachedEmbeddings
 from .llm_factory import llm_factory
+from .index import LogIndex
+from .follow import IndexBuilder, LogFollower, DEFAULT_FOLLOW_INTERVAL
+from .retrieval import LogRetriever
+from .trigram import scan_lines
+
+# Lines shown per /grep command
+GREP_LIMIT = 50
+
+SYSTEM_PROMPT_PATH = Path(__file__).parent / "prompts" / "system_prompt.txt"
 
 console = Console()
 
@@ -36,19 +46,35 @@ console = Console()
 class LogAnalyzer:
     """Main chat interface for log analysis"""
     
-    def __init__(self, log_file_path: str, save_path: Optional[str] = None):
+    def __init__(
+        self,
+        log_file_path: str,
+        save_path: Optional[str] = None,
+        follow: bool = False,
+        follow_interval: float = DEFAULT_FOLLOW_INTERVAL,
+    ):
         self.log_file_path = Path(log_file_path)
         self.save_path = Path(save_path) if save_path else None
+        self.follow = follow
+        self.follow_interval = follow_interval
+        self.follower = None
+        self.builder = None
+        self.lease = None
         self.config = Config()
         self.llm = None
+        self.llm_id = ""
         self.conversation_history = []
         self.retriever = None
         self.rag_chain = None
+        self.answer_cache = None
         self.fallback_chain = None
+        self.index = LogIndex(self.log_file_path, self.config)
         self.session_id = self._compute_session_id()
+        # Messages saved by earlier sessions on this log; answers are cached by the ones after them
+        self.history_start = len(self._get_chat_history(self.session_id).messages)
         
-        # Load log file content
-        self.log_content = self._load_log_file()
+        # Inspect the log file; content is streamed from disk when indexing
+        self.log_size = self._load_log_file()
         
         # Initialize LLM
         self._initialize_llm()
@@ -59,14 +85,19 @@ class LogAnalyzer:
         if self.save_path and self.save_path.exists():
             self._load_conversation()
     
-    def _load_log_file(self) -> str:
-        """Load and return log file content"""
+    def _load_log_file(self) -> int:
+        """Check the log file is readable and return its size in bytes.
+
+        The content is never read into memory as a whole; it is memory-mapped
+        and streamed in bounded windows when the index is built.
+        """
         try:
-            with open(self.log_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            with open(self.log_file_path, 'rb') as f:
+                f.read(1)
+            size = self.log_file_path.stat().st_size
             console.print(f"[green]✓ Loaded log file: {self.log_file_path}[/green]")
-            console.print(f"[dim]Log file size: {len(content)} characters[/dim]")
-            return content
+            console.print(f"[dim]Log file size: {size} bytes[/dim]")
+            return size
         except Exception as e:
             console.print(f"[red]✗ Failed to load log file: {e}[/red]")
             raise
@@ -83,6 +114,7 @@ class LogAnalyzer:
                 provider_config["model"],
                 provider_config
             )
+            self.llm_id = f"{provider_config['provider']}:{provider_config['model']}"
             console.print(f"[green]✓ Initialized {provider_config['provider']} with model {provider_config['model']}[/green]")
         except Exception as e:
             console.print(f"[red]✗ Failed to initialize LLM: {e}[/red]")
@@ -125,30 +157,28 @@ class LogAnalyzer:
             console.print(f"[red]Warning: Could not save conversation: {e}[/red]")
     
     def _get_system_instructions(self) -> str:
-        """System instructions for the RAG chain (no full log in prompt)."""
-        with open("E:/Codes/AI/log-whisperer/log_whisperer/prompts/system_prompt.txt", "r") as f:
-            return f.read()
+        """System instructions for the chains (no full log in prompt).
+
+        Once the index is ready, the exact statistics of the whole log are
+        appended so counts and first/last-seen times are never guessed
+        from the few retrieved excerpts.
+        """
+        with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
+            instructions = f.read()
+        summary = self.index.profile_summary() if self.rag_chain is not None else ""
+        if summary:
+            instructions += (
+                "\n\nLog profile (exact counts over the whole indexed log; use these for counts and "
+                "first/last seen instead of counting in the retrieved context):\n" + summary
+            )
+        return instructions
     
     def _compute_session_id(self) -> str:
         digest = hashlib.sha256(str(self.log_file_path.resolve()).encode("utf-8")).hexdigest()[:12]
         return f"session-{digest}"
     
     def _index_cache_dir(self) -> Path:
-        base = self.config.config_dir / "indexes"
-        base.mkdir(parents=True, exist_ok=True)
-        # Fingerprint by file path, size, mtime, and chunking/version params
-        stat = self.log_file_path.stat()
-        finger_str = json.dumps({
-            "path": str(self.log_file_path.resolve()),
-            "size": stat.st_size,
-            "mtime": int(stat.st_mtime),
-            "chunk_size": 2000,
-            "chunk_overlap": 200,
-            "embedding": "fastembed-bge-small-en-v1.5",
-            "version": 1,
-        }, sort_keys=True)
-        digest = hashlib.sha256(finger_str.encode("utf-8")).hexdigest()[:16]
-        return base / digest
+        return self.index.cache_dir
 
     def _messages_store_path(self) -> Path:
         base = self.config.config_dir / "messages"
@@ -162,51 +192,99 @@ class LogAnalyzer:
     def _initialize_rag(self, force_rebuild: bool = False) -> None:
         """Create or load a vector store retriever and retrieval chain over the log file.
 
-        Lazy + cached: load FAISS if available, else build and persist.
+        Lazy + cached: load FAISS if available (indexing only appended bytes), else build and persist.
+        Runs in the background builder; ``rag_chain`` is only set once everything is ready.
         """
-        with console.status("[yellow] Retrieving Embeddings...[/yellow]", spinner="material"):
+        if not self.index.load_or_build(force_rebuild=force_rebuild):
+            raise ValueError("Log file is empty, nothing to index")
 
-            try:
-                # console.print("[yellow] Retrieving Embeddings...[/yellow]")
-                cache_dir = self._index_cache_dir()
-                # embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-                embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+        retrieval = self.config.get_retrieval_config()
+        self.retriever = LogRetriever(
+            index=self.index,
+            k=6,
+            mode=retrieval.get("mode", "hybrid"),
+            prefilter=retrieval.get("prefilter", True),
+        )
 
-                if cache_dir.exists() and not force_rebuild:
-                    vector_store = FAISS.load_local(
-                        str(cache_dir), embeddings, allow_dangerous_deserialization=True
-                    )
-                else:
-                    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200, add_start_index=True)
+        if self.config.get_cache_config().get("answers", True):
+            self.answer_cache = AnswerCache(self.config.config_dir / ANSWER_CACHE_FILE)
 
-                    documents = splitter.create_documents(
-                        [self.log_content], metadatas=[{"source": str(self.log_file_path)}]
-                    )
-                    vector_store = FAISS.from_documents(documents, embeddings)
-                    vector_store.save_local(str(cache_dir))
+        # Prompt and answer chain with persisted chat history; the context is
+        # retrieved beforehand (see _answer_with_context) so it can key the answer cache
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "{system_instructions}\n\nRetrieved context:\n{context}"),
+            MessagesPlaceholder("history"),
+            ("human", "{input}")
+        ])
+        document_chain = create_stuff_documents_chain(self.llm, prompt)
+        self.rag_chain = RunnableWithMessageHistory(
+            document_chain,
+            self._get_chat_history,
+            input_messages_key="input",
+            history_messages_key="history",
+        )
 
-                self.retriever = vector_store.as_retriever(search_kwargs={"k": 6})
+    def _answer_with_context(self, user_input: str) -> str:
+        """Answer from the log's context, reusing a cached answer given over the same index, context and conversation.
 
-                # Prompt and retrieval chain with persisted chat history
-                prompt = ChatPromptTemplate.from_messages([
-                    ("system", "{system_instructions}\n\nRetrieved context:\n{context}"),
-                    MessagesPlaceholder("history"),
-                    ("human", "{input}")
-                ])
-                document_chain = create_stuff_documents_chain(self.llm, prompt)
-                base_chain = create_retrieval_chain(self.retriever, document_chain)
-                self.rag_chain = RunnableWithMessageHistory(
-                    base_chain,
-                    self._get_chat_history,
-                    input_messages_key="input",
-                    history_messages_key="history",
-                    output_messages_key="answer",
+        Only this session's messages count as the conversation, so a session
+        opening with a question asked before reuses its answer. Cached answers
+        are still added to the chat history so follow-up questions see them.
+        """
+        documents = self.retriever.invoke(user_input)
+        scope = vector = None
+        if self.answer_cache is not None:
+            history = self._get_chat_history(self.session_id).messages[self.history_start:]
+            scope = answer_scope(self.index.version(), self.llm_id, documents, history)
+            if isinstance(self.index.embeddings, CachedEmbeddings):
+                # Already embedded by the retriever, so this is a cache hit
+                vector = self.index.embeddings.embed_query(user_input)
+            cached = self.answer_cache.get(scope, user_input, vector)
+            if cached is not None:
+                self._get_chat_history(self.session_id).add_messages(
+                    [HumanMessage(content=user_input), AIMessage(content=cached)]
                 )
-                console.print("[green]✓ Log are retrieved and ready to be analyzed[/green]")
-            except Exception as e:
-                console.print(f"[yellow]Warning: Failed to initialize Log retriever: {e}[/yellow]")
-                self.retriever = None
-                self.rag_chain = None
+                console.print("[dim]Reusing a cached answer (same index and context)[/dim]")
+                return cached
+        answer = self.rag_chain.invoke(
+            {"input": user_input, "context": documents, "system_instructions": self._get_system_instructions()},
+            config={"configurable": {"session_id": self.session_id}},
+        )
+        if self.answer_cache is not None:
+            self.answer_cache.put(scope, user_input, answer, vector)
+        return answer
+
+    def _start_indexing(self) -> None:
+        """Load or build the index in the background; questions are answered without it meanwhile."""
+        self.builder = IndexBuilder(self.index, self._initialize_rag)
+        self.builder.start()
+        # A cached index usually loads in well under a second; only mention the build if it takes longer
+        if not self.builder.wait(timeout=1.0):
+            console.print(
+                "[yellow]Indexing the log in the background; answers use the log's context once it is ready.[/yellow]"
+            )
+        self._check_indexing()
+
+    def _check_indexing(self) -> None:
+        """Report a finished background build once, and start following the log if requested."""
+        if self.builder is None or not self.builder.done:
+            return
+        builder, self.builder = self.builder, None
+        if builder.error:
+            console.print(f"[yellow]Warning: Failed to initialize Log retriever: {builder.error}[/yellow]")
+            self.retriever = None
+            self.rag_chain = None
+            return
+        console.print("[green]✓ Log are retrieved and ready to be analyzed[/green]")
+        shards = self.index.manifest.data.get("shards") or {}
+        types = sorted({(info.get("ann") or {}).get("type", "flat") for info in shards.values()})
+        console.print(
+            f"[dim]{self.index.chunk_count} chunks in {len(shards)} shard(s) ({', '.join(types)})[/dim]"
+        )
+        # Keep the index from being evicted by other processes for as long as the session lasts
+        self.lease = IndexLease(self.index.cache_dir)
+        self.lease.start()
+        self._start_follower()
 
     def _initialize_fallback_chain(self) -> None:
         try:
@@ -225,6 +303,55 @@ class LogAnalyzer:
         except Exception:
             self.fallback_chain = None
     
+    def _start_follower(self) -> None:
+        """Index records appended to the log in the background while chatting."""
+        if not self.follow or self.rag_chain is None:
+            return
+        self.follower = LogFollower(self.index, interval=self.follow_interval)
+        self.follower.start()
+        if self.index.read_only:
+            # The follower reloads the index each time the other session persists it
+            console.print(
+                "[yellow]Another session is indexing this log; new lines show up here once it has saved them.[/yellow]"
+            )
+            return
+        console.print(f"[green]✓ Following {self.log_file_path.name} (checking every {self.follow_interval:g}s)[/green]")
+
+    def _stop_follower(self) -> None:
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower = None
+
+    def _watermark_toolbar(self):
+        if self.builder is not None:
+            return self.builder.status()
+        return self.follower.watermark() if self.follower is not None else None
+
+    def _grep(self, pattern: str) -> None:
+        """Print the lines matching a regex, using the trigram index once it is built."""
+        if not pattern:
+            console.print("[yellow]Usage: /grep <regex>, e.g. /grep ERROR .*timeout[/yellow]")
+            return
+        started = time.perf_counter()
+        try:
+            if self.rag_chain is not None:
+                matches, scanned, total = self.index.grep(pattern, limit=GREP_LIMIT)
+                scope = f"scanned {scanned:,} of {total:,} blocks"
+            else:
+                # No index yet: scan the whole log
+                size = self.log_file_path.stat().st_size
+                matches = scan_lines(self.log_file_path, re.compile(pattern), 0, size, 1, GREP_LIMIT)
+                scope = "scanned the whole log"
+        except (ValueError, re.error) as e:
+            console.print(f"[red]✗ {e}[/red]")
+            return
+        for line, _, text in matches:
+            console.print(f"[cyan]{line}:[/cyan] {escape(text)}", highlight=False, soft_wrap=True)
+        shown = f"first {len(matches)}" if len(matches) >= GREP_LIMIT else str(len(matches))
+        console.print(
+            f"[dim]{shown} matching line(s), {scope} in {1000 * (time.perf_counter() - started):.0f} ms[/dim]"
+        )
+
     def _format_response(self, response: str) -> None:
         """Format and display AI response"""
         panel = Panel(
@@ -255,10 +382,11 @@ class LogAnalyzer:
             - "Summarize the main events"
             - "Are there any patterns or anomalies?"
             - "What happened around timestamp X?"
+            - "Why do we see /timeout after \\d+ms/?" (lines matching a /regex/ are added to the context)
 
-            Type '/quit', '/exit', or press Ctrl+C to end the session.
+            Type '/grep <regex>' to list matching lines, '/quit', '/exit', or press Ctrl+C to end the session.
         """
-        self._initialize_rag()
+        self._start_indexing()
         
         self._format_response(welcome_msg)
         
@@ -270,9 +398,13 @@ class LogAnalyzer:
             while True:
                 try:
                     # Get user input
+                    self._check_indexing()
                     user_input = prompt(
                         "You: ",
-                        history=history
+                        history=history,
+                        bottom_toolbar=self._watermark_toolbar if self.builder or self.follower else None,
+                        # Keep the build progress in the toolbar moving while the user types
+                        refresh_interval=1.0 if self.builder is not None else 0,
                     ).strip()
                     
                     if not user_input:
@@ -281,17 +413,20 @@ class LogAnalyzer:
                     if user_input.lower() in ['/quit', '/exit']:
                         break
                     
+                    if user_input.lower().startswith('/grep'):
+                        self._grep(user_input[len('/grep'):].strip())
+                        continue
+                    
                     # Add user message to history
                     self._add_to_history('human', user_input)
+                    self._check_indexing()
+                    if self.builder is not None:
+                        console.print(f"[dim]{self.builder.status()}; answering without the log's context[/dim]")
                     
                     # Get AI response (RAG if available; fallback to direct LLM) with transient status
                     with console.status("[dim]Analyzing...[/dim]", spinner="dots"):
                         if self.rag_chain is not None:
-                            result = self.rag_chain.invoke(
-                                {"input": user_input, "system_instructions": self._get_system_instructions()},
-                                config={"configurable": {"session_id": self.session_id}},
-                            )
-                            ai_response = result.get("answer") or str(result)
+                            ai_response = self._answer_with_context(user_input)
                         else:
                             # Fallback chain with persisted chat history
                             if self.fallback_chain is None:
@@ -311,6 +446,8 @@ class LogAnalyzer:
                     
                     # Display response
                     self._format_response(ai_response)
+                    if self.follower is not None:
+                        console.print(f"[dim]{self.follower.watermark()}[/dim]")
                     
                     # Save conversation
                     self._save_conversation()
@@ -324,5 +461,13 @@ class LogAnalyzer:
                     continue
         
         finally:
+            if self.builder is not None:
+                self.builder.cancel()
+                self.builder = None
+            self._stop_follower()
+            if self.lease is not None:
+                self.lease.stop()
+                self.lease = None
+            self.index.close()
             console.print("\n[yellow]Goodbye! Your conversation has been saved.[/yellow]")
             self._save_conversation()
@@ -2,14 +2,26 @@
 Command Line Interface for log-whisperer
 """
 import click
+import glob
+import json
+import time
+from datetime import datetime
 from pathlib import Path
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 from rich.panel import Panel
 
 from .config import Config, list_supported_providers, get_provider_info
 from .llm_factory import llm_factory
 from .chat import LogAnalyzer
+from .follow import DEFAULT_FOLLOW_INTERVAL, IndexBuilder
+from .index import LogIndex
+from .retrieval import RETRIEVAL_MODES, LogRetriever
+from .embeddings import get_embedding_backend, list_embedding_backends
+from .answer_cache import AnswerCache
+from .embedding_cache import EmbeddingCache
+from .cache import IndexCacheManager, format_size, parse_size
 
 console = Console()
 
@@ -195,7 +207,19 @@ def configure():
     type=click.Path(path_type=Path),
     help="Path to save the conversation (optional)"
 )
-def chat(log_file: Path, save: Path):
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="Keep indexing lines appended to the log while chatting"
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.5),
+    default=DEFAULT_FOLLOW_INTERVAL,
+    show_default=True,
+    help="Seconds between checks for new lines in --follow mode"
+)
+def chat(log_file: Path, save: Path, follow: bool, interval: float):
     """Start interactive chat session for log analysis"""
     try:
         # Check if configuration exists
@@ -207,13 +231,215 @@ def chat(log_file: Path, save: Path):
             return
         
         # Initialize and start chat
-        analyzer = LogAnalyzer(str(log_file), str(save) if save else None)
+        analyzer = LogAnalyzer(
+            str(log_file),
+            str(save) if save else None,
+            follow=follow,
+            follow_interval=interval,
+        )
         analyzer.start_chat()
         
     except Exception as e:
         console.print(f"[red]✗ Error starting chat: {e}[/red]")
 
 
+@main.command()
+@click.argument("patterns", nargs=-1, required=True)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    help="Processes used to chunk and embed (default: indexing.workers, or all cores)"
+)
+@click.option("--rebuild", is_flag=True, help="Rebuild indexes from scratch instead of updating them")
+def index(patterns, workers: int, rebuild: bool):
+    """Build or update the index of log files (paths or glob patterns) without chatting
+
+    Indexes are written to the same cache 'chat' reads, so sessions on these
+    logs start warm. Exits with status 1 if any file failed.
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or ([pattern] if Path(pattern).exists() else [])
+        if not matches:
+            console.print(f"[yellow]Warning: No files match {pattern}[/yellow]")
+        files += [Path(match) for match in matches if Path(match).is_file() and Path(match) not in files]
+    if not files:
+        console.print("[red]✗ Nothing to index.[/red]")
+        raise SystemExit(1)
+    
+    config = Config()
+    table = Table(title="Index Build", show_header=True, header_style="bold magenta")
+    table.add_column("Log File", style="cyan")
+    table.add_column("Indexed", justify="right")
+    table.add_column("Chunks", justify="right")
+    table.add_column("Embedded", justify="right")
+    table.add_column("Emb/s", justify="right")
+    table.add_column("Wall (s)", justify="right")
+    totals = {"bytes": 0, "chunks": 0, "embedded": 0}
+    failed = 0
+    started = time.perf_counter()
+    for log_file in files:
+        log_index = LogIndex(log_file, config, workers=workers)
+        builder = IndexBuilder(log_index, lambda: log_index.load_or_build(force_rebuild=rebuild))
+        file_started = time.perf_counter()
+        with console.status(f"[yellow]Indexing {log_file}...[/yellow]") as spinner:
+            builder.start()
+            while not builder.wait(timeout=0.5):
+                spinner.update(f"[yellow]{log_file}: {builder.status()}[/yellow]")
+        log_index.close()
+        wall = time.perf_counter() - file_started
+        if builder.error:
+            failed += 1
+            table.add_row(str(log_file), f"[red]{builder.error}[/red]", "", "", "", f"{wall:.1f}")
+            continue
+        stats = log_index.last_stats
+        for key in totals:
+            totals[key] += stats.get(key, 0)
+        table.add_row(
+            str(log_file),
+            format_size(stats.get("bytes", 0)) if stats.get("bytes") else "[dim]up to date[/dim]",
+            f"{log_index.chunk_count:,}",
+            f"{stats.get('embedded', 0):,}",
+            f"{stats.get('embeddings_per_second', 0.0):,.1f}",
+            f"{wall:.1f}",
+        )
+    
+    console.print(table)
+    wall = time.perf_counter() - started
+    console.print(
+        f"[dim]{len(files) - failed} of {len(files)} log(s) indexed: {format_size(totals['bytes'])}, "
+        f"{totals['chunks']:,} new chunks, {totals['embedded']:,} embeddings "
+        f"({totals['embedded'] / wall if wall > 0 else 0:,.1f}/s) in {wall:.1f}s[/dim]"
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+def _load_index(log_file: Path, quiet: bool = False) -> LogIndex:
+    """Load the cached index of a log, indexing what is new first; exit on failure.
+
+    ``quiet`` shows no progress, keeping stdout clean for machine-readable output.
+    """
+    log_index = LogIndex(log_file, Config())
+    builder = IndexBuilder(log_index, log_index.load_or_build)
+    builder.start()
+    if quiet:
+        builder.wait()
+    else:
+        with console.status(f"[yellow]Loading index of {log_file}...[/yellow]") as spinner:
+            while not builder.wait(timeout=0.5):
+                spinner.update(f"[yellow]{builder.status()}[/yellow]")
+    if builder.error:
+        Console(stderr=True).print(f"[red]✗ Failed to index {log_file}: {builder.error}[/red]")
+        raise SystemExit(1)
+    return log_index
+
+
+@main.command()
+@click.argument("query")
+@click.option(
+    "--log-file",
+    required=True,
+    type=click.Path(exists=True, path_type=Path),
+    help="Log file to search (indexed first if needed)"
+)
+@click.option("--k", type=click.IntRange(min=1), default=20, show_default=True, help="Maximum number of records to show")
+@click.option("--any", "match_any", is_flag=True, help="Match records containing any term instead of all")
+@click.option("--raw", is_flag=True, help="Pass QUERY to SQLite FTS5 unchanged (NEAR, OR, NOT, column filters)")
+def find(query: str, log_file: Path, k: int, match_any: bool, raw: bool):
+    """Full-text search of log records: "quoted phrases", prefix* and plain terms
+
+    Matches are ranked by BM25 and printed as file:line: record.
+    """
+    log_index = _load_index(log_file)
+    try:
+        records = log_index.fulltext_search(query, k=k, raw=raw, operator="OR" if match_any else "AND")
+    except ValueError as e:
+        console.print(f"[red]✗ {e}[/red]")
+        raise SystemExit(1)
+    
+    for record in records:
+        console.print(
+            f"[cyan]{log_file}:{record.metadata['line']}:[/cyan] {escape(record.page_content.rstrip())}",
+            highlight=False,
+            soft_wrap=True,
+        )
+    console.print(f"[dim]{len(records)} matching record(s){' (limit reached)' if len(records) == k else ''}[/dim]")
+
+
+@main.command()
+@click.argument("query")
+@click.option(
+    "--log-file",
+    required=True,
+    type=click.Path(exists=True, path_type=Path),
+    help="Log file to search (indexed first if needed)"
+)
+@click.option("--k", type=click.IntRange(min=1), default=6, show_default=True, help="Number of excerpts to retrieve")
+@click.option(
+    "--mode",
+    type=click.Choice(list(RETRIEVAL_MODES), case_sensitive=False),
+    help="Retrieval mode (default: retrieval.mode from config.yaml, else hybrid)"
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the results as JSON")
+def search(query: str, log_file: Path, k: int, mode: str, as_json: bool):
+    """Top log excerpts for QUERY, retrieved like the chat does but without calling the LLM
+
+    Excerpts are printed best first with their line range and score:
+    1/(1+L2 distance) in vector mode, BM25 in lexical and fulltext mode,
+    the reciprocal rank fusion score in hybrid mode. /regex/ matches and records
+    of a time window named in QUERY come first, as in the chat.
+    """
+    log_index = _load_index(log_file, quiet=as_json)
+    retrieval = Config().get_retrieval_config()
+    started = time.perf_counter()
+    try:
+        retriever = LogRetriever(
+            index=log_index,
+            k=k,
+            mode=mode or retrieval.get("mode", "hybrid"),
+            prefilter=retrieval.get("prefilter", True),
+        )
+        documents = retriever.invoke(query)
+    except ValueError as e:
+        Console(stderr=True).print(f"[red]✗ {e}[/red]")
+        raise SystemExit(1)
+    took_ms = 1000 * (time.perf_counter() - started)
+
+    results = []
+    for rank, doc in enumerate(documents, start=1):
+        meta = doc.metadata
+        result = {"rank": rank, "kind": "grep" if "grep" in meta else "excerpt"}
+        for key in ("line", "end_line", "start_index", "end_index", "timestamp", "score", "grep", "matches"):
+            if meta.get(key) is not None:
+                result[key] = meta[key]
+        result["text"] = doc.page_content.rstrip("\n")
+        results.append(result)
+
+    if as_json:
+        click.echo(json.dumps({
+            "query": query,
+            "log_file": str(log_file),
+            "mode": retriever.mode,
+            "took_ms": round(took_ms, 1),
+            "results": results,
+        }, indent=2, ensure_ascii=False))
+        return
+
+    for result in results:
+        if result["kind"] == "grep":
+            location = f"/{escape(result['grep'])}/"
+        else:
+            location = f"{log_file}:{result['line']}"
+            if result.get("end_line", result["line"]) != result["line"]:
+                location += f"-{result['end_line']}"
+        score = f" [dim]score {result['score']:.4g}[/dim]" if "score" in result else ""
+        console.print(f"[bold]#{result['rank']}[/bold] [cyan]{location}[/cyan]{score}", highlight=False, soft_wrap=True)
+        console.print(escape(result["text"]), highlight=False, soft_wrap=True)
+        console.print()
+    console.print(f"[dim]{len(results)} excerpt(s), {retriever.mode} retrieval in {took_ms:.0f} ms[/dim]")
+
+
 @main.command()
 def status():
     """Show current configuration status"""
@@ -243,10 +469,141 @@ def status():
         if key.endswith("_key") or key.endswith("_token"):
             table.add_row(key.replace("_", " ").title(), "***configured***")
     
+    embedding_backend = config.get_embedding_config().get("backend")
+    try:
+        table.add_row("Embedding Model", get_embedding_backend(embedding_backend)["model_name"])
+    except ValueError:
+        table.add_row("Embedding Model", f"[red]unknown backend '{embedding_backend}'[/red]")
+    
     console.print(table)
     console.print(f"\n[dim]Configuration file: {config.config_file}[/dim]")
 
 
+@main.command()
+@click.option(
+    "--log-file",
+    type=click.Path(exists=True, path_type=Path),
+    help="Log file to sample chunks from (synthetic log lines if omitted)"
+)
+@click.option(
+    "--backends",
+    default=",".join(list_embedding_backends()),
+    show_default=True,
+    help="Comma-separated embedding backends to compare"
+)
+@click.option("--samples", type=click.IntRange(min=1), default=256, show_default=True, help="Number of chunks to embed")
+@click.option("--reference", help="Backend whose top-k results define recall (default: first backend)")
+def benchmark(log_file: Path, backends: str, samples: int, reference: str):
+    """Compare embedding backends: load time, chunks/sec, peak RSS and recall"""
+    from .benchmark import run_benchmark
+    
+    names = [name.strip().lower() for name in backends.split(",") if name.strip()]
+    try:
+        with console.status(f"[yellow]Benchmarking {len(names)} embedding backends...[/yellow]"):
+            reports = run_benchmark(names, log_file=log_file, samples=samples, reference=reference)
+    except ValueError as e:
+        console.print(f"[red]✗ {e}[/red]")
+        return
+    
+    table = Table(title="Embedding Backends", show_header=True, header_style="bold magenta")
+    table.add_column("Backend", style="cyan")
+    table.add_column("Model", style="white")
+    table.add_column("Dim", justify="right")
+    table.add_column("Load (s)", justify="right")
+    table.add_column("Chunks/s", justify="right")
+    table.add_column("Peak RSS (MB)", justify="right")
+    table.add_column("Recall@10", justify="right")
+    
+    for report in reports:
+        model = get_embedding_backend(report["backend"])["model_name"]
+        if "error" in report:
+            table.add_row(report["backend"], model, "", "", "", "", f"[red]{report['error']}[/red]")
+            continue
+        rss = report["peak_rss_mb"]
+        recall = report["recall"]
+        table.add_row(
+            report["backend"],
+            model,
+            str(report["dimension"]),
+            f"{report['load_seconds']:.1f}",
+            f"{report['chunks_per_second']:.1f}",
+            f"{rss:.0f}" if rss is not None else "n/a",
+            f"{recall:.2f}" if recall is not None else "n/a",
+        )
+    
+    console.print(table)
+    console.print("[dim]Select a backend with 'embedding: {backend: <name>}' in the configuration file.[/dim]")
+
+
+@main.command()
+@click.option("--prune", is_flag=True, help="Evict least recently used indexes, embeddings and answers not in use until the cache fits its budget")
+@click.option("--max-size", help="Budget to prune to, e.g. 2GB (default: cache.max_size, 5GB)")
+@click.option("--missing", is_flag=True, help="Remove indexes whose log file no longer exists")
+@click.option("--clear", is_flag=True, help="Remove all cached indexes")
+def cache(prune: bool, max_size: str, missing: bool, clear: bool):
+    """Inspect and prune the on-disk index cache"""
+    try:
+        manager = IndexCacheManager(Config(), parse_size(max_size) if max_size else None)
+    except ValueError as e:
+        console.print(f"[red]✗ {e}[/red]")
+        return
+    
+    evicted = []
+    if clear:
+        if not click.confirm("Remove all cached indexes?"):
+            console.print("[yellow]Clear cancelled.[/yellow]")
+            return
+        evicted = manager.entries()
+        for entry in evicted:
+            manager.remove(entry)
+    else:
+        if missing:
+            evicted += manager.prune_missing()
+        if prune or max_size:
+            evicted += manager.prune()
+    if evicted:
+        freed = sum(entry.size_bytes for entry in evicted)
+        console.print(f"[green]✓ Removed {len(evicted)} index(es), freed {format_size(freed)}[/green]")
+    for name, (count, freed) in manager.evicted_entries.items():
+        console.print(f"[green]✓ Evicted {count} cached {name}(s), freed {format_size(freed)}[/green]")
+    
+    entries = manager.entries()
+    table = Table(title="Index Cache", show_header=True, header_style="bold magenta")
+    table.add_column("Index", style="cyan")
+    table.add_column("Log File", style="white")
+    table.add_column("Chunks", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Last Used", justify="right")
+    for entry in entries:
+        log_path = entry.log_path or "?"
+        if not entry.log_exists:
+            log_path = f"[dim]{log_path} (missing)[/dim]"
+        table.add_row(
+            entry.path.name,
+            log_path,
+            str(entry.chunks),
+            format_size(entry.size_bytes),
+            datetime.fromtimestamp(entry.last_access).strftime("%Y-%m-%d %H:%M"),
+        )
+    console.print(table)
+    
+    total = sum(entry.size_bytes for entry in entries)
+    shared = []
+    for shared_cache in manager.shared_caches():
+        size = shared_cache.size_bytes()
+        total += size
+        if isinstance(shared_cache, EmbeddingCache):
+            shared.append(f"Embedding cache: {shared_cache.count()} vector(s), {format_size(size)}")
+        elif isinstance(shared_cache, AnswerCache):
+            shared.append(f"Answer cache: {shared_cache.count()} answer(s), {format_size(size)}")
+    for line in shared:
+        console.print(f"[dim]{line}[/dim]")
+    console.print(
+        f"[dim]{len(entries)} index(es), {format_size(total)} in all of {format_size(manager.max_bytes)} "
+        f"budget in {manager.config.config_dir}[/dim]"
+    )
+
+
 @main.command()
 def reset():
     """Reset configuration"""
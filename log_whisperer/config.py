@@ -51,6 +51,26 @@ class Config:
         config = self.load_config()
         config['provider'] = provider_config
         self.save_config(config)
+    
+    def get_embedding_config(self) -> Dict[str, Any]:
+        """Get embedding settings (e.g. ``backend``); empty if not configured"""
+        config = self.load_config()
+        return config.get('embedding') or {}
+    
+    def get_indexing_config(self) -> Dict[str, Any]:
+        """Get index build settings (e.g. ``workers``); empty if not configured"""
+        config = self.load_config()
+        return config.get('indexing') or {}
+    
+    def get_retrieval_config(self) -> Dict[str, Any]:
+        """Get retrieval settings (e.g. ``mode``); empty if not configured"""
+        config = self.load_config()
+        return config.get('retrieval') or {}
+    
+    def get_cache_config(self) -> Dict[str, Any]:
+        """Get index cache settings (e.g. ``max_size``); empty if not configured"""
+        config = self.load_config()
+        return config.get('cache') or {}
 
 
 # Supported LLM providers with their package requirements
@@ -0,0 +1,237 @@
+"""
+SQLite document store for indexed chunks: byte ranges of the log, read on demand
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .facets import FacetIndex
+from .fulltext import FullTextIndex
+from .ingest import LOOKUP_BATCH_SIZE, open_log_map
+from .lexical import BM25Index
+from .profile import LogProfile
+from .trigram import TrigramIndex
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+
+class ChunkStore:
+    """Chunks of one log keyed by their id in the FAISS index of their shard.
+
+    Only each chunk's byte range, line numbers, timestamp and shard are stored; the text is
+    read back from the log (memory-mapped) when a chunk is returned, so the
+    store stays a few dozen bytes per chunk and nothing is unpickled. The
+    BM25 postings of the chunks (``lexical``), their level/service/host
+    bitmaps (``facets``), the full-text index of the log's records
+    (``fulltext``), the statistics of those records (``profile``) and the
+    trigram signatures of its blocks (``trigrams``) live in the same database. Writes
+    are buffered in a transaction until ``commit``, which the index calls
+    after every batch so readers in other processes are never locked out;
+    chunks committed past the last persisted manifest are dropped by the
+    next update.
+    """
+
+    def __init__(self, path: Path, source: str):
+        self.path = Path(path)
+        self.source = source
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # Shared by the chat thread and the follower; access is serialized by the lock
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, start INTEGER NOT NULL, end INTEGER NOT NULL, "
+                "line INTEGER, end_line INTEGER, time REAL, shard TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_start ON chunks (start)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_shard ON chunks (shard)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_time ON chunks (time)")
+            # Chunks deleted from the store whose vectors are still in their shard's index (HNSW)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (id INTEGER PRIMARY KEY, shard TEXT NOT NULL)")
+        self.lexical = BM25Index(self._conn, self._lock)
+        self.facets = FacetIndex(self._conn, self._lock)
+        self.fulltext = FullTextIndex(self._conn, self._lock, source)
+        self.profile = LogProfile(self._conn, self._lock)
+        self.trigrams = TrigramIndex(self._conn, self._lock, source)
+        self._next_id = self._max_id() + 1
+
+    def _max_id(self) -> int:
+        row = self._conn.execute(
+            "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM chunks UNION ALL SELECT MAX(id) FROM tombstones)"
+        ).fetchone()
+        return row[0] if row and row[0] is not None else -1
+
+    def add(self, metadatas: Sequence[Dict], shard: str, texts: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Store chunks by their ``start_index``/``end_index`` byte range; return the ids allocated.
+
+        ``texts`` of the chunks, if given, are added to the lexical and facet indexes.
+        """
+        with self._lock:
+            ids = np.arange(self._next_id, self._next_id + len(metadatas), dtype=np.int64)
+            self._next_id += len(metadatas)
+            self._conn.executemany(
+                "INSERT INTO chunks (id, start, end, line, end_line, time, shard) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        int(chunk_id), meta["start_index"], meta["end_index"],
+                        meta.get("line"), meta.get("end_line"), meta.get("timestamp"), shard,
+                    )
+                    for chunk_id, meta in zip(ids, metadatas)
+                ],
+            )
+            if texts is not None:
+                self.lexical.add(ids, texts)
+                self.facets.add(ids, texts)
+            return ids
+
+    def documents(self, ids: Sequence[int]) -> List[Optional[Document]]:
+        """Documents for ``ids`` in the same order; None for ids no longer stored."""
+        rows = {}
+        ids = [int(i) for i in ids]
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + LOOKUP_BATCH_SIZE]
+                for row in self._conn.execute(
+                    f"SELECT id, start, end, line, end_line, time FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ):
+                    rows[row[0]] = row
+        if not rows:
+            return [None] * len(ids)
+        found = {}
+        with open_log_map(self.source) as mm:
+            for chunk_id, start, end, line, end_line, timestamp in rows.values():
+                found[chunk_id] = Document(
+                    page_content=mm[start:end].decode("utf-8", errors="replace"),
+                    metadata={
+                        "source": self.source,
+                        "start_index": start,
+                        "end_index": end,
+                        "line": line,
+                        "end_line": end_line,
+                        "timestamp": timestamp,
+                    },
+                )
+        return [found.get(i) for i in ids]
+
+    def within_time(self, ids: Sequence[int], since: Optional[float] = None, until: Optional[float] = None) -> List[int]:
+        """The ``ids`` (in order) of chunks timestamped within ``[since, until]``."""
+        ids = [int(i) for i in ids]
+        kept = set()
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + LOOKUP_BATCH_SIZE]
+                kept.update(
+                    row[0] for row in self._conn.execute(
+                        f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(batch))}) "
+                        "AND time >= ? AND time <= ?",
+                        batch + [since if since is not None else float("-inf"), until if until is not None else float("inf")],
+                    )
+                )
+        return [i for i in ids if i in kept]
+
+    def ids_within_time(self, since: Optional[float] = None, until: Optional[float] = None) -> np.ndarray:
+        """Sorted ids of all chunks timestamped within ``[since, until]``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM chunks WHERE time >= ? AND time <= ? ORDER BY id",
+                (since if since is not None else float("-inf"), until if until is not None else float("inf")),
+            ).fetchall()
+        return np.asarray([row[0] for row in rows], dtype=np.int64)
+
+    def ids_in_range(self, start: int, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Ids of chunks starting inside ``[start, end)`` (to the end of the log if ``end`` is None), by shard."""
+        with self._lock:
+            if end is None:
+                rows = self._conn.execute("SELECT shard, id FROM chunks WHERE start >= ?", (start,))
+            else:
+                rows = self._conn.execute("SELECT shard, id FROM chunks WHERE start >= ? AND start < ?", (start, end))
+            by_shard: Dict[str, List[int]] = {}
+            for shard, chunk_id in rows:
+                by_shard.setdefault(shard, []).append(chunk_id)
+        return {shard: np.asarray(ids, dtype=np.int64) for shard, ids in by_shard.items()}
+
+    def last_chunk(self, before: int) -> Optional[Tuple[int, int]]:
+        """(start, end) of the last chunk starting before byte ``before``, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT start, end FROM chunks WHERE start < ? ORDER BY start DESC LIMIT 1", (before,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def shards_of(self, ids: Sequence[int]) -> Dict[str, np.ndarray]:
+        """Stored ``ids`` grouped by shard."""
+        ids = [int(i) for i in ids]
+        by_shard: Dict[str, List[int]] = {}
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + LOOKUP_BATCH_SIZE]
+                for shard, chunk_id in self._conn.execute(
+                    f"SELECT shard, id FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ):
+                    by_shard.setdefault(shard, []).append(chunk_id)
+        return {shard: np.asarray(ids, dtype=np.int64) for shard, ids in by_shard.items()}
+
+    def live_ids(self, shard: Optional[str] = None) -> np.ndarray:
+        with self._lock:
+            if shard is None:
+                rows = self._conn.execute("SELECT id FROM chunks ORDER BY id")
+            else:
+                rows = self._conn.execute("SELECT id FROM chunks WHERE shard = ? ORDER BY id", (shard,))
+            return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def count(self, shard: Optional[str] = None) -> int:
+        with self._lock:
+            if shard is None:
+                return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE shard = ?", (shard,)).fetchone()[0]
+
+    def remove(self, ids: Sequence[int], shard: str, tombstone: bool = False) -> None:
+        """Delete chunks of ``shard``; with ``tombstone`` remember their ids so searches can skip their vectors."""
+        rows = [(int(i),) for i in ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", rows)
+            self.lexical.remove([i for (i,) in rows])
+            self.facets.remove([i for (i,) in rows])
+            if tombstone:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tombstones (id, shard) VALUES (?, ?)", [(i, shard) for (i,) in rows]
+                )
+
+    def tombstones(self, shard: Optional[str] = None) -> np.ndarray:
+        with self._lock:
+            if shard is None:
+                rows = self._conn.execute("SELECT id FROM tombstones ORDER BY id")
+            else:
+                rows = self._conn.execute("SELECT id FROM tombstones WHERE shard = ? ORDER BY id", (shard,))
+            return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def clear_tombstones(self, shard: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tombstones WHERE shard = ?", (shard,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM tombstones")
+            self.lexical.clear()
+            self.facets.clear()
+            self.fulltext.clear()
+            self.profile.clear()
+            self.trigrams.clear()
+            self._next_id = 0
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the connection, discarding uncommitted writes."""
+        with self._lock:
+            self._conn.close()
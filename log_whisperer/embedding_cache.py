@@ -0,0 +1,208 @@
+"""
+Content-addressed on-disk cache of chunk embeddings shared by all indexes
+"""
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .ingest import LOOKUP_BATCH_SIZE
+
+EMBEDDING_CACHE_FILE = "embeddings.sqlite"
+
+# Query embeddings kept in memory per process, most recently used
+QUERY_CACHE_SIZE = 256
+
+# Last use of a vector is recorded to this resolution (seconds), so most reads do not write
+USE_RESOLUTION = 3600
+
+
+def normalize_text(text: str) -> str:
+    """Normalize chunk text for cache keys: unify line endings and trim outer whitespace."""
+    return text.replace("\r\n", "\n").strip()
+
+
+def embedding_key(model_id: str, text: str) -> bytes:
+    """128-bit key identifying the embedding of ``text`` under ``model_id``."""
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).digest()[:16]
+
+
+def query_key(model_id: str, text: str) -> bytes:
+    """Key of the query embedding of ``text``; some models embed queries and documents differently."""
+    return hashlib.sha256(f"{model_id}\0query\0{normalize_text(text)}".encode("utf-8")).digest()[:16]
+
+
+def model_identifier(embeddings: Embeddings) -> str:
+    """Best-effort stable identifier for an embeddings model."""
+    for attr in ("model_name", "model"):
+        value = getattr(embeddings, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    size = getattr(embeddings, "size", None)
+    return f"{type(embeddings).__name__}-{size}" if size else type(embeddings).__name__
+
+
+class EmbeddingCache:
+    """SQLite table mapping embedding keys to float32 vectors stored as raw bytes.
+
+    Safe to share between threads and between the processes of an index build
+    pool; concurrent writers are serialized by SQLite's WAL journal. Each
+    vector's last use is kept so the least recently used ones can be evicted
+    to keep the cache within ``cache.max_size`` (see IndexCacheManager).
+    """
+
+    name = "embedding"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "key BLOB PRIMARY KEY, vector BLOB NOT NULL, used INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(vectors)")]
+            if "used" not in columns:
+                # Caches written before last use was tracked count as used now
+                conn.execute("ALTER TABLE vectors ADD COLUMN used INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE vectors SET used = ?", (int(time.time()),))
+            conn.execute("CREATE INDEX IF NOT EXISTS vectors_used ON vectors (used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        conn = self._connect()
+        unique = list(dict.fromkeys(keys))
+        now = int(time.time())
+        stale = []
+        for i in range(0, len(unique), LOOKUP_BATCH_SIZE):
+            batch = unique[i:i + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT key, vector, used FROM vectors WHERE key IN ({placeholders})", batch)
+            for key, blob, used in rows:
+                found[key] = np.frombuffer(blob, dtype="<f4")
+                if now - used >= USE_RESOLUTION:
+                    stale.append((now, key))
+        if stale:
+            with conn:
+                conn.executemany("UPDATE vectors SET used = ? WHERE key = ?", stale)
+        return found
+
+    def put_many(self, items: Iterable) -> None:
+        """Store ``(key, vector)`` pairs; existing keys are left untouched."""
+        now = int(time.time())
+        rows = [(key, np.asarray(vector, dtype="<f4").tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO vectors (key, vector, used) VALUES (?, ?, ?)", rows)
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        return sum(
+            p.stat().st_size for p in self.path.parent.glob(f"{self.path.name}*") if p.is_file()
+        )
+
+    def oldest_use(self) -> Optional[float]:
+        """When the least recently used vector was last used; None if the cache is empty."""
+        return self._connect().execute("SELECT MIN(used) FROM vectors").fetchone()[0]
+
+    def evict(self, excess_bytes: int, before: float) -> Tuple[int, int]:
+        """Drop least recently used vectors not used since ``before`` until about ``excess_bytes`` are freed.
+
+        Returns the number of vectors dropped and the bytes they took.
+        """
+        conn = self._connect()
+        count = self.count()
+        if not count or excess_bytes <= 0:
+            return 0, 0
+        row_bytes = self.size_bytes() / count
+        with conn:
+            dropped = conn.execute(
+                "DELETE FROM vectors WHERE key IN (SELECT key FROM vectors WHERE used < ? ORDER BY used LIMIT ?)",
+                (before, math.ceil(excess_bytes / row_bytes)),
+            ).rowcount
+        return dropped, int(dropped * row_bytes)
+
+    def compact(self) -> None:
+        """Give the space of evicted vectors back to the file system, unless another process is using the cache."""
+        conn = self._connect()
+        try:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError:
+            # Busy; the free pages are reused by later inserts
+            pass
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only computes vectors missing from an EmbeddingCache.
+
+    Identical chunk text embedded by the same model is computed once, no
+    matter which log, copy or rebuild it came from. Questions are cached
+    too: in memory for the session and on disk across sessions.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_id: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_id = model_id or model_identifier(underlying)
+        self.hits = 0
+        self.misses = 0
+        self.query_hits = 0
+        self._queries: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model_id, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = self.underlying.embed_documents([texts[i] for i in missing])
+            self.cache.put_many((keys[i], vector) for i, vector in zip(missing, computed))
+            for i, vector in zip(missing, computed):
+                cached[keys[i]] = np.asarray(vector, dtype="<f4")
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = query_key(self.model_id, text)
+        with self._queries_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+        if vector is None:
+            stored = self.cache.get_many([key]).get(key)
+            if stored is None:
+                vector = list(self.underlying.embed_query(text))
+                self.cache.put_many([(key, vector)])
+            else:
+                vector = stored.tolist()
+                self.query_hits += 1
+            with self._queries_lock:
+                self._queries[key] = vector
+                while len(self._queries) > QUERY_CACHE_SIZE:
+                    self._queries.popitem(last=False)
+        else:
+            self.query_hits += 1
+        return list(vector)
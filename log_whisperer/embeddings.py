@@ -0,0 +1,91 @@
+"""
+Selectable embedding backends for the log index
+"""
+import importlib
+from typing import Any, Dict, List, Optional
+
+# Embedding backends selectable via ``embedding.backend`` in config.yaml
+EMBEDDING_BACKENDS = {
+    "mpnet": {
+        "package": "langchain-huggingface",
+        "module": "langchain_huggingface",
+        "class": "HuggingFaceEmbeddings",
+        "model_name": "sentence-transformers/all-mpnet-base-v2",
+        "dimension": 768,
+        "description": "PyTorch all-mpnet-base-v2 (~420 MB), best recall, slowest",
+    },
+    "minilm": {
+        "package": "langchain-huggingface",
+        "module": "langchain_huggingface",
+        "class": "HuggingFaceEmbeddings",
+        "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+        "dimension": 384,
+        "description": "PyTorch all-MiniLM-L6-v2 (~90 MB)",
+    },
+    "bge-small": {
+        "package": "fastembed",
+        "module": "langchain_community.embeddings",
+        "class": "FastEmbedEmbeddings",
+        "model_name": "BAAI/bge-small-en-v1.5",
+        "dimension": 384,
+        "description": "FastEmbed ONNX bge-small-en-v1.5, quantized weights (~67 MB)",
+    },
+    "bge-base": {
+        "package": "fastembed",
+        "module": "langchain_community.embeddings",
+        "class": "FastEmbedEmbeddings",
+        "model_name": "BAAI/bge-base-en-v1.5",
+        "dimension": 768,
+        "description": "FastEmbed ONNX bge-base-en-v1.5 (~210 MB)",
+    },
+    "minilm-onnx": {
+        "package": "fastembed",
+        "module": "langchain_community.embeddings",
+        "class": "FastEmbedEmbeddings",
+        "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+        "dimension": 384,
+        "description": "FastEmbed ONNX all-MiniLM-L6-v2, quantized weights (~90 MB)",
+    },
+}
+
+DEFAULT_EMBEDDING_BACKEND = "mpnet"
+
+
+def get_embedding_backend(name: Optional[str] = None) -> Dict[str, Any]:
+    """Get information about an embedding backend (the default one if ``name`` is None)"""
+    name = (name or DEFAULT_EMBEDDING_BACKEND).lower()
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unsupported embedding backend: {name}. Choose one of: {', '.join(list_embedding_backends())}"
+        )
+    return EMBEDDING_BACKENDS[name]
+
+
+def list_embedding_backends() -> List[str]:
+    """Get list of supported embedding backend names"""
+    return list(EMBEDDING_BACKENDS.keys())
+
+
+def _import_backend_class(backend: Dict[str, Any]):
+    """Import the backend class, installing its package on first use like LLM providers"""
+    try:
+        if backend["package"] == "fastembed":
+            importlib.import_module("fastembed")
+        return getattr(importlib.import_module(backend["module"]), backend["class"])
+    except ImportError:
+        # Imported lazily: llm_factory pulls in provider tooling not needed by workers
+        from .llm_factory import llm_factory
+        if not llm_factory._install_package(backend["package"]):
+            raise ImportError(f"Embedding backend requires the '{backend['package']}' package")
+        return getattr(importlib.import_module(backend["module"]), backend["class"])
+
+
+def create_embeddings(backend_name: Optional[str] = None):
+    """Create the embeddings model for a backend.
+
+    Module-level and keyed by name so ``functools.partial(create_embeddings, name)``
+    can be sent to index build worker processes.
+    """
+    backend = get_embedding_backend(backend_name)
+    embeddings_class = _import_backend_class(backend)
+    return embeddings_class(model_name=backend["model_name"])
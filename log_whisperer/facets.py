@@ -0,0 +1,236 @@
+"""
+Level, service and host facets of log chunks, stored as compressed bitmaps of chunk ids
+"""
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .ingest import LOOKUP_BATCH_SIZE
+from .lexical import tokenize
+from .records import is_record_start
+
+FACETS_VERSION = "facet-bitmaps-v1"
+
+FACETS = ("level", "service", "host")
+
+# Facet name -> accepted values, e.g. {"level": {"ERROR", "FATAL"}}
+Filters = Dict[str, Set[str]]
+
+# Level spellings of common frameworks, mapped to one name each
+LEVEL_ALIASES = {
+    "TRACE": "TRACE", "DEBUG": "DEBUG", "INFO": "INFO", "NOTICE": "INFO",
+    "WARN": "WARN", "WARNING": "WARN",
+    "ERROR": "ERROR", "ERR": "ERROR", "SEVERE": "ERROR",
+    "FATAL": "FATAL", "CRITICAL": "FATAL", "CRIT": "FATAL", "EMERG": "FATAL", "ALERT": "FATAL",
+}
+# Only the start of a record is searched for its level, so messages quoting one do not count
+_LEVEL_SPAN = 120
+_LEVEL = re.compile(r"\b(" + "|".join(LEVEL_ALIASES) + r")\b")
+_LEVEL_FIELD = re.compile(r"""\b(?:level|severity|lvl)"?\s*[=:]\s*"?([A-Za-z]+)""", re.IGNORECASE)
+# key=value and JSON fields naming the service or host
+_FIELDS = {
+    "service": re.compile(r"""\b(?:service|svc|app|application)(?:[._]name)?"?\s*[=:]\s*"?([\w.\-]+)""", re.IGNORECASE),
+    "host": re.compile(r"""\b(?:host|hostname|node)(?:[._]name)?"?\s*[=:]\s*"?([\w.\-]+)""", re.IGNORECASE),
+}
+# Jan 31 12:00:00 web-01 sshd[123]: ...
+_SYSLOG = re.compile(r"^[A-Z][a-z]{2}\s+\d{1,2}\s\d{2}:\d{2}:\d{2}\s+([\w.\-]+)\s+([\w.\-/]+?)(?:\[\d+\])?:\s")
+# 2024-01-31 12:00:00 ERROR [payment-service] ...
+_BRACKETED_SERVICE = re.compile(r"^\[([A-Za-z][\w.\-]*)\]")
+# Bracketed names after the level that are threads rather than services
+_THREAD_NAME = re.compile(r"^(?:main|.*thread.*|.*worker.*|pool-.*|.*-exec-\d+)$", re.IGNORECASE)
+
+# Question words asking about levels
+_QUESTION_LEVELS = [
+    (re.compile(r"\b(?:errors?|err)\b", re.IGNORECASE), {"ERROR", "FATAL"}),
+    (re.compile(r"\b(?:warn|warnings?)\b", re.IGNORECASE), {"WARN"}),
+    (re.compile(r"\b(?:fatal|critical|crash(?:es|ed)?)\b", re.IGNORECASE), {"FATAL"}),
+    (re.compile(r"\bdebug\b", re.IGNORECASE), {"DEBUG"}),
+]
+
+# Ids are split into containers of 2^16 like Roaring bitmaps: up to
+# _ARRAY_MAX ids a container is a sorted uint16 array, beyond that a bitmap
+_CONTAINER_BITS = 16
+_CONTAINER_SIZE = 1 << _CONTAINER_BITS
+_ARRAY_MAX = 4096
+
+
+def record_facets(line: str) -> Dict[str, str]:
+    """Level, service and host named in the first line of a record, where present."""
+    facets = {}
+    syslog = _SYSLOG.match(line)
+    if syslog:
+        facets["host"], facets["service"] = syslog.group(1), syslog.group(2)
+    field = _LEVEL_FIELD.search(line)
+    if field and field.group(1).upper() in LEVEL_ALIASES:
+        facets["level"] = LEVEL_ALIASES[field.group(1).upper()]
+    else:
+        level = _LEVEL.search(line[:_LEVEL_SPAN])
+        if level:
+            facets["level"] = LEVEL_ALIASES[level.group(1)]
+            bracketed = _BRACKETED_SERVICE.match(line[level.end():].lstrip())
+            if bracketed and not _THREAD_NAME.match(bracketed.group(1)):
+                facets.setdefault("service", bracketed.group(1))
+    for facet, pattern in _FIELDS.items():
+        match = pattern.search(line)
+        if match:
+            facets[facet] = match.group(1)
+    return {facet: value.lower() if facet != "level" else value for facet, value in facets.items()}
+
+
+def chunk_facets(text: str) -> Dict[str, Set[str]]:
+    """Values of each facet among the records of a chunk.
+
+    As in ``iter_records``, each line is a record until the first record start.
+    """
+    values: Dict[str, Set[str]] = defaultdict(set)
+    structured = False
+    for line in text.splitlines():
+        starts = is_record_start(line)
+        if starts or not structured:
+            for facet, value in record_facets(line).items():
+                values[facet].add(value)
+        structured = structured or starts
+    return values
+
+
+def matches_filters(text: str, filters: Filters) -> bool:
+    """True if the records of ``text`` have one of the accepted values of every filtered facet."""
+    values = chunk_facets(text)
+    return all(values.get(facet, set()) & accepted for facet, accepted in filters.items())
+
+
+def question_filters(question: str, known: Dict[str, Iterable[str]]) -> Filters:
+    """Facet filters a question implies: levels it asks about, and ``known`` services or hosts it names."""
+    filters: Filters = {}
+    for pattern, levels in _QUESTION_LEVELS:
+        if pattern.search(question):
+            filters.setdefault("level", set()).update(levels)
+    terms = set(tokenize(question))
+    for facet in ("service", "host"):
+        named = terms.intersection(known.get(facet, ()))
+        if named:
+            filters[facet] = named
+    return filters
+
+
+def _encode(ids: np.ndarray) -> bytes:
+    """One container: sorted low 16 bits of ``ids`` as an array, or as a bitmap once that is smaller."""
+    low = (ids & (_CONTAINER_SIZE - 1)).astype("<u2")
+    if len(low) <= _ARRAY_MAX:
+        return low.tobytes()
+    bits = np.zeros(_CONTAINER_SIZE, dtype=bool)
+    bits[low] = True
+    return np.packbits(bits, bitorder="little").tobytes()
+
+
+def _decode(container: int, count: int, data: bytes) -> np.ndarray:
+    if count <= _ARRAY_MAX:
+        low = np.frombuffer(data, dtype="<u2").astype(np.int64)
+    else:
+        low = np.flatnonzero(np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little"))
+    return low + (container << _CONTAINER_BITS)
+
+
+class FacetIndex:
+    """Bitmaps of the chunks having each level, service and host, in tables of the docstore's database.
+
+    Kept in step with the chunks on every add and remove, inside the
+    docstore's transaction, so a filter can narrow the candidates of a
+    search before any vector is compared.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self._conn = conn
+        self._lock = lock
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS facet_bitmaps ("
+                "facet TEXT NOT NULL, value TEXT NOT NULL, container INTEGER NOT NULL, "
+                "count INTEGER NOT NULL, bits BLOB NOT NULL, PRIMARY KEY (facet, value, container)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS facet_bitmaps_container ON facet_bitmaps (container)")
+
+    def _store(self, facet: str, value: str, container: int, ids: np.ndarray) -> None:
+        if len(ids):
+            self._conn.execute(
+                "INSERT OR REPLACE INTO facet_bitmaps (facet, value, container, count, bits) VALUES (?, ?, ?, ?, ?)",
+                (facet, value, container, len(ids), _encode(ids)),
+            )
+        else:
+            self._conn.execute(
+                "DELETE FROM facet_bitmaps WHERE facet = ? AND value = ? AND container = ?", (facet, value, container)
+            )
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        groups: Dict[Tuple[str, str, int], List[int]] = defaultdict(list)
+        for chunk_id, text in zip(ids, texts):
+            chunk_id = int(chunk_id)
+            for facet, values in chunk_facets(text).items():
+                for value in values:
+                    groups[(facet, value, chunk_id >> _CONTAINER_BITS)].append(chunk_id)
+        with self._lock:
+            for (facet, value, container), new_ids in groups.items():
+                row = self._conn.execute(
+                    "SELECT count, bits FROM facet_bitmaps WHERE facet = ? AND value = ? AND container = ?",
+                    (facet, value, container),
+                ).fetchone()
+                merged = np.asarray(new_ids, dtype=np.int64)
+                if row:
+                    merged = np.union1d(_decode(container, *row), merged)
+                self._store(facet, value, container, np.unique(merged))
+
+    def remove(self, ids: Sequence[int]) -> None:
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if not len(ids):
+            return
+        with self._lock:
+            for container in np.unique(ids >> _CONTAINER_BITS).tolist():
+                removed = ids[(ids >> _CONTAINER_BITS) == container]
+                rows = self._conn.execute(
+                    "SELECT facet, value, count, bits FROM facet_bitmaps WHERE container = ?", (container,)
+                ).fetchall()
+                for facet, value, count, bits in rows:
+                    current = _decode(container, count, bits)
+                    kept = np.setdiff1d(current, removed, assume_unique=True)
+                    if len(kept) != len(current):
+                        self._store(facet, value, container, kept)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM facet_bitmaps")
+
+    def values(self, facet: str) -> Dict[str, int]:
+        """Number of chunks having each value of ``facet``."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT value, SUM(count) FROM facet_bitmaps WHERE facet = ? GROUP BY value", (facet,)
+            ))
+
+    def ids(self, facet: str, values: Iterable[str]) -> np.ndarray:
+        """Sorted ids of the chunks having any of ``values``."""
+        values = list(values)
+        parts = []
+        with self._lock:
+            for i in range(0, len(values), LOOKUP_BATCH_SIZE):
+                batch = values[i:i + LOOKUP_BATCH_SIZE]
+                for container, count, bits in self._conn.execute(
+                    f"SELECT container, count, bits FROM facet_bitmaps WHERE facet = ? "
+                    f"AND value IN ({','.join('?' * len(batch))})",
+                    [facet] + batch,
+                ):
+                    parts.append(_decode(container, count, bits))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def select(self, filters: Filters) -> Optional[np.ndarray]:
+        """Sorted ids of the chunks matching every facet of ``filters`` (any of its values); None if unfiltered."""
+        selected = None
+        for facet, values in filters.items():
+            ids = self.ids(facet, values)
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+        return selected
@@ -0,0 +1,119 @@
+"""
+Content fingerprints of logs, so identical logs share an index wherever they live
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .ingest import iter_window_bytes, open_log_map
+from .locks import FileLock
+
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+REGISTRY_FILE = "registry.json"
+# Serializes read-modify-write cycles of the registry between processes
+REGISTRY_LOCK_FILE = "registry.lock"
+
+# FileLock is shared by the threads of a process, so they are serialized here
+_register_lock = threading.Lock()
+
+
+def fingerprint(path: Path, size: Optional[int] = None, full: bool = False) -> Dict[str, Any]:
+    """Fingerprint of the first ``size`` bytes of a log (the whole file by default).
+
+    The size plus SHA-256 digests of sampled head, middle and tail blocks is
+    enough to tell logs apart in practice at the cost of three small reads;
+    ``full`` adds a streaming hash of every byte for when that is not enough.
+    """
+    if size is None:
+        size = Path(path).stat().st_size
+    sample = FINGERPRINT_SAMPLE_SIZE
+    middle = max(0, size // 2 - sample // 2)
+    with open_log_map(path) as mm:
+        result = {
+            "size": size,
+            "head": hashlib.sha256(mm[:min(sample, size)]).hexdigest(),
+            "middle": hashlib.sha256(mm[middle:min(middle + sample, size)]).hexdigest(),
+            "tail": hashlib.sha256(mm[max(0, size - sample):size]).hexdigest(),
+        }
+    if full:
+        digest = hashlib.sha256()
+        for _, window in iter_window_bytes(path, 0, size):
+            digest.update(window)
+        result["full"] = digest.hexdigest()
+    return result
+
+
+class IndexRegistry:
+    """``registry.json`` in the index cache: which log path and content each index directory holds.
+
+    Lets a log reopen its own index by path even after it grew, and lets a
+    copy of already indexed content (another directory, a fresh download, a
+    touched backup) find an index by fingerprint instead of re-embedding.
+    Updates are made under a lock file and written to a temporary file
+    that replaces the registry, so concurrent sessions never lose each
+    other's entries and readers never see a half-written file.
+    """
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        self.path = self.base_dir / REGISTRY_FILE
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        indexes = data.get("indexes") or {}
+        # Drop directories evicted or deleted since they were registered
+        return {name: info for name, info in indexes.items() if (self.base_dir / name).is_dir()}
+
+    def _save(self, indexes: Dict[str, Any]) -> None:
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{REGISTRY_FILE}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"indexes": indexes}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def find_by_path(self, log_path: Path, model: str) -> Optional[str]:
+        log_path = str(Path(log_path).resolve())
+        for name, info in self._load().items():
+            if info.get("path") == log_path and info.get("model") == model:
+                return name
+        return None
+
+    def find_by_content(self, log_path: Path, model: str) -> Optional[Dict[str, Any]]:
+        """The registered index whose content is the longest prefix of this log, if any.
+
+        Returns the registry entry with its directory ``name`` added.
+        """
+        size = Path(log_path).stat().st_size
+        candidates = [
+            dict(info, name=name)
+            for name, info in self._load().items()
+            if info.get("model") == model and 0 < (info.get("fingerprint") or {}).get("size", 0) <= size
+        ]
+        computed = {}
+        for entry in sorted(candidates, key=lambda e: e["fingerprint"]["size"], reverse=True):
+            expected = entry["fingerprint"]
+            key = (expected["size"], "full" in expected)
+            if key not in computed:
+                computed[key] = fingerprint(log_path, size=expected["size"], full="full" in expected)
+            if computed[key] == expected:
+                return entry
+        return None
+
+    def register(self, name: str, log_path: Path, model: str, log_fingerprint: Dict[str, Any]) -> None:
+        with _register_lock, FileLock(self.base_dir / REGISTRY_LOCK_FILE):
+            indexes = self._load()
+            indexes[name] = {
+                "path": str(Path(log_path).resolve()),
+                "model": model,
+                "fingerprint": log_fingerprint,
+                "updated_at": time.time(),
+            }
+            self._save(indexes)
@@ -0,0 +1,145 @@
+"""
+Background indexing of log files: the initial build, and records appended while chatting
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from .cache import format_size
+from .index import IndexingCancelled, LogIndex
+
+# Seconds between checks for appended bytes
+DEFAULT_FOLLOW_INTERVAL = 5.0
+# Upper bound on bytes indexed per cycle, which bounds how stale a question can be
+DEFAULT_FOLLOW_MAX_BYTES = 8 * 1024 * 1024
+# Persist the index to disk at most this often while following
+PERSIST_INTERVAL = 60.0
+
+
+class LogFollower(threading.Thread):
+    """Daemon thread that polls a log file and indexes appended records.
+
+    Each cycle indexes at most ``max_bytes`` so a burst of writes is worked off
+    over several short cycles instead of one long one. The docstore is
+    committed every cycle; vector shards and the manifest are written to
+    disk every ``PERSIST_INTERVAL`` seconds and once more when the follower
+    stops.
+    """
+
+    def __init__(
+        self,
+        index: LogIndex,
+        interval: float = DEFAULT_FOLLOW_INTERVAL,
+        max_bytes: int = DEFAULT_FOLLOW_MAX_BYTES,
+    ):
+        super().__init__(name="log-follower", daemon=True)
+        self.index = index
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.last_error: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._last_persist = time.monotonic()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def poll(self) -> int:
+        """Run one indexing cycle; return the number of new bytes indexed."""
+        try:
+            indexed = self.index.update(max_bytes=self.max_bytes, persist=False)
+            if indexed and time.monotonic() - self._last_persist >= PERSIST_INTERVAL:
+                self.index.persist()
+                self._last_persist = time.monotonic()
+            self.last_error = None
+            return indexed
+        except Exception as e:
+            self.last_error = str(e)
+            return 0
+
+    def stop(self) -> None:
+        """Stop polling and flush the index to disk."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=self.interval + 30)
+        if self.index.line_index is not None:
+            self.index.persist()
+
+    @property
+    def lag_bytes(self) -> int:
+        """Bytes written to the log that are not yet indexed."""
+        try:
+            size = self.index.log_file_path.stat().st_size
+        except OSError:
+            return 0
+        covered = self.index.line_index.indexed_bytes if self.index.line_index is not None else 0
+        return max(size - covered, 0)
+
+    def watermark(self) -> str:
+        """Human-readable description of how far the index has caught up."""
+        line_index = self.index.line_index
+        if line_index is None:
+            return "Indexing not started"
+        text = f"Indexed up to line {line_index.line_count:,} ({line_index.indexed_bytes:,} bytes)"
+        if self.index.updated_at is not None:
+            text += f" at {datetime.fromtimestamp(self.index.updated_at).strftime('%H:%M:%S')}"
+        lag = self.lag_bytes
+        text += f", {lag:,} bytes behind" if lag else ", up to date"
+        if self.last_error:
+            text += f" (last error: {self.last_error})"
+        return text
+
+
+class IndexBuilder(threading.Thread):
+    """Daemon thread that runs the initial index load/build so the chat can start right away.
+
+    ``build`` loads or builds ``index`` (and anything that depends on it);
+    until it returns the session answers without retrieved context, polling
+    ``done`` to switch over and ``status`` to show progress.
+    """
+
+    def __init__(self, index: LogIndex, build: Callable[[], None]):
+        super().__init__(name="index-builder", daemon=True)
+        self.index = index
+        self.build = build
+        self.error: Optional[str] = None
+        self.started_at = time.monotonic()
+        self._built = threading.Event()
+
+    def run(self) -> None:
+        try:
+            self.build()
+        except IndexingCancelled:
+            self.error = "cancelled"
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._built.set()
+
+    @property
+    def done(self) -> bool:
+        return self._built.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._built.wait(timeout)
+
+    def cancel(self, timeout: float = 30.0) -> None:
+        """Stop the build after its current batch and wait for the thread to exit."""
+        self.index.cancel()
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+    def status(self) -> str:
+        """Human-readable progress of the build, with an estimate of the time left."""
+        done, total, embedded = self.index.progress()
+        if self.done:
+            return f"Index build failed: {self.error}" if self.error else "Index ready"
+        if not total:
+            return "Loading index..."
+        elapsed = time.monotonic() - self.started_at
+        text = f"Indexing {done / total:.0%} ({format_size(done)} of {format_size(total)}, {embedded:,} chunks embedded)"
+        if done and elapsed > 1:
+            remaining = elapsed * (total - done) / done
+            text += f", about {int(remaining // 60)}m {int(remaining % 60):02d}s left"
+        return text
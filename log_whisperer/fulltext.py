@@ -0,0 +1,230 @@
+"""
+SQLite FTS5 full-text index of log records, for exact phrase and prefix search
+"""
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .ingest import open_log_map
+
+FULLTEXT_VERSION = "fts5-records-v1"
+
+# Once this fraction of the full-text rows belongs to deleted records, the table is rebuilt
+MAX_ORPHAN_FRACTION = 0.2
+
+# Quoted phrases, or bare terms with an optional trailing * for prefix search
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+# (start, end, line, end_line, timestamp, text) of one record
+RecordRow = Tuple[int, int, int, int, Optional[float], str]
+
+
+def match_query(text: str, operator: str = "AND") -> str:
+    """Turn free text into an FTS5 query: ``"quoted phrases"``, ``prefix*`` and plain terms.
+
+    Every part is quoted so punctuation in log tokens (``db-01.prod``,
+    ``user=42``) matches as a phrase of its words instead of being parsed
+    as FTS5 syntax. Parts are joined by ``operator`` (AND or OR).
+    """
+    parts = []
+    for phrase, term in _QUERY_PART.findall(text):
+        prefix = bool(term) and term.endswith("*")
+        words = (phrase or term.rstrip("*")).replace('"', " ").strip()
+        if words:
+            parts.append(f'"{words}"' + ("*" if prefix else ""))
+    return f" {operator} ".join(parts)
+
+
+class FullTextIndex:
+    """Contentless FTS5 table of the log's records, next to the chunks in the docstore's database.
+
+    Only the postings are stored; record text is read back from the log by
+    byte range, like chunk text. A contentless table cannot delete a row
+    without its original text, which is gone once a segment of the log
+    changed, so deleted records are dropped from ``records`` only and their
+    postings are skipped by the join until the table is rebuilt.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock, source: str):
+        self._conn = conn
+        self._lock = lock
+        self.source = source
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "id INTEGER PRIMARY KEY, start INTEGER NOT NULL, end INTEGER NOT NULL, "
+                "line INTEGER, end_line INTEGER, time REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_start ON records (start)")
+            # Sorted time -> offset mapping for questions about a moment or range
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_time ON records (time)")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(body, content='', prefix='2 3')"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS fulltext_stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO fulltext_stats VALUES ('rows', 0), ('orphans', 0)")
+
+    def _bump(self, key: str, delta: int) -> None:
+        self._conn.execute("UPDATE fulltext_stats SET value = value + ? WHERE key = ?", (delta, key))
+
+    def _stats(self) -> dict:
+        return dict(self._conn.execute("SELECT key, value FROM fulltext_stats"))
+
+    def add(self, records: Iterable[RecordRow]) -> int:
+        """Index records; return how many were added."""
+        records = list(records)
+        if not records:
+            return 0
+        with self._lock:
+            last = self._conn.execute("SELECT rowid FROM records_fts ORDER BY rowid DESC LIMIT 1").fetchone()
+            first_id = (last[0] if last else 0) + 1
+            ids = range(first_id, first_id + len(records))
+            self._conn.executemany(
+                "INSERT INTO records (id, start, end, line, end_line, time) VALUES (?, ?, ?, ?, ?, ?)",
+                [(record_id,) + tuple(record[:5]) for record_id, record in zip(ids, records)],
+            )
+            self._conn.executemany(
+                "INSERT INTO records_fts (rowid, body) VALUES (?, ?)",
+                [(record_id, record[5]) for record_id, record in zip(ids, records)],
+            )
+            self._bump("rows", len(records))
+        return len(records)
+
+    def remove_range(self, start: int, end: Optional[int] = None) -> None:
+        """Drop records starting inside ``[start, end)`` (to the end of the log if ``end`` is None)."""
+        with self._lock:
+            if end is None:
+                removed = self._conn.execute("DELETE FROM records WHERE start >= ?", (start,)).rowcount
+            else:
+                removed = self._conn.execute("DELETE FROM records WHERE start >= ? AND start < ?", (start, end)).rowcount
+            self._bump("orphans", removed)
+
+    @property
+    def needs_compaction(self) -> bool:
+        stats = self._stats()
+        return stats["orphans"] > MAX_ORPHAN_FRACTION * max(stats["rows"], 1)
+
+    def compact(self) -> None:
+        """Rebuild the full-text table from the live records, dropping postings of deleted ones."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, start, end FROM records ORDER BY id").fetchall()
+            self._conn.execute("INSERT INTO records_fts (records_fts) VALUES ('delete-all')")
+            with open_log_map(self.source) as mm:
+                self._conn.executemany(
+                    "INSERT INTO records_fts (rowid, body) VALUES (?, ?)",
+                    ((record_id, mm[start:end].decode("utf-8", errors="replace")) for record_id, start, end in rows),
+                )
+            self._conn.execute("UPDATE fulltext_stats SET value = CASE key WHEN 'rows' THEN ? ELSE 0 END", (len(rows),))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM records")
+            self._conn.execute("INSERT INTO records_fts (records_fts) VALUES ('delete-all')")
+            self._conn.execute("UPDATE fulltext_stats SET value = 0")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def search(
+        self,
+        query: str,
+        k: int = 20,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        raw: bool = False,
+        operator: str = "AND",
+    ) -> List[Document]:
+        """Records matching ``query`` best first (BM25 rank), optionally within ``[since, until]``.
+
+        ``query`` is free text (see ``match_query``) unless ``raw``, in which
+        case it is passed to FTS5 as is (``NEAR(...)``, ``OR``, ``NOT``, ...).
+        Raises ValueError for a query FTS5 cannot parse.
+        """
+        expression = query if raw else match_query(query, operator)
+        if not expression:
+            return []
+        sql = (
+            "SELECT r.start, r.end, r.line, r.end_line, r.time, rank FROM records_fts "
+            "JOIN records r ON r.id = records_fts.rowid WHERE records_fts MATCH ?"
+        )
+        params: list = [expression]
+        if since is not None:
+            sql += " AND r.time >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND r.time <= ?"
+            params.append(until)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(k)
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid search query {expression!r}: {e}") from e
+        # FTS5 ranks by negated BM25; report the score itself, higher is better
+        return self._documents([row[:5] for row in rows], [-row[5] for row in rows])
+
+    def time_span(self) -> Tuple[Optional[float], Optional[float]]:
+        """Timestamps of the earliest and latest timed records, (None, None) if there are none."""
+        with self._lock:
+            return tuple(self._conn.execute("SELECT MIN(time), MAX(time) FROM records").fetchone())
+
+    def between(
+        self,
+        since: Optional[float],
+        until: Optional[float],
+        limit: int = 20,
+        around: Optional[float] = None,
+    ) -> List[Document]:
+        """Records timed within ``[since, until]``, in log order, up to ``limit``.
+
+        With ``around`` the records closest to that moment are kept,
+        otherwise the first ones of the range.
+        """
+        sql = "SELECT start, end, line, end_line, time FROM records WHERE time IS NOT NULL"
+        params: list = []
+        if since is not None:
+            sql += " AND time >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND time <= ?"
+            params.append(until)
+        if around is not None:
+            sql += " ORDER BY abs(time - ?), start"
+            params.append(around)
+        else:
+            sql += " ORDER BY time, start"
+        sql += " LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return self._documents(sorted(rows))
+
+    def _documents(
+        self, rows: List[Tuple[int, int, int, int, Optional[float]]], scores: Optional[List[float]] = None
+    ) -> List[Document]:
+        if not rows:
+            return []
+        with open_log_map(self.source) as mm:
+            documents = [
+                Document(
+                    page_content=mm[start:end].decode("utf-8", errors="replace"),
+                    metadata={
+                        "source": self.source,
+                        "start_index": start,
+                        "end_index": end,
+                        "line": line,
+                        "end_line": end_line,
+                        "timestamp": timestamp,
+                    },
+                )
+                for start, end, line, end_line, timestamp in rows
+            ]
+        if scores is not None:
+            for document, score in zip(documents, scores):
+                document.metadata["score"] = score
+        return documents
@@ -0,0 +1,1153 @@
+"""
+Incrementally updated vector index over a single log file
+"""
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from .ann import (
+    ann_settings,
+    build_index,
+    choose_index_type,
+    describe_index,
+    index_type_of,
+    measure_tradeoff,
+    reconstruct_all,
+    search_parameters,
+    supports_remove,
+)
+from .cache import LAST_ACCESS_FILE, IndexCacheManager, touch_index
+from .config import Config
+from .docstore import DOCSTORE_FILE, ChunkStore
+from .embedding_cache import EMBEDDING_CACHE_FILE, CachedEmbeddings, EmbeddingCache
+from .embeddings import create_embeddings, get_embedding_backend
+from .facets import FACETS, FACETS_VERSION, Filters, matches_filters
+from .fingerprint import IndexRegistry, fingerprint
+from .fulltext import FULLTEXT_VERSION
+from .ingest import batched, open_log_map
+from .lexical import LEXICAL_VERSION, RRF_K, reciprocal_rank_scores
+from .line_index import LineIndex
+from .locks import FileLock
+from .manifest import MANIFEST_FILE, IndexManifest
+from .profile import PROFILE_VERSION
+from .records import (
+    CHUNKER_VERSION,
+    LogRecordSplitter,
+    iter_records,
+    last_record_start,
+    parse_timestamp,
+    record_aligned_ranges,
+)
+from .trigram import TRIGRAM_VERSION, GrepMatch
+
+# Number of chunks embedded and added to the index per batch
+EMBED_BATCH_SIZE = 256
+
+CHUNK_SIZE = 2000
+
+# Ranges are chunked in record-aligned partitions of about PARTITION_SIZE bytes,
+# which double as the manifest's segments: chunks never cross a partition, so a
+# change inside the log only invalidates the partitions it touches. Ranges of
+# at least PARALLEL_MIN_BYTES are chunked/embedded by a process pool.
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+PARTITION_SIZE = 8 * 1024 * 1024
+# HNSW indexes cannot remove vectors, so deleted positions are tombstoned and
+# skipped at query time; past this fraction of the index they are compacted away
+MAX_TOMBSTONE_FRACTION = 0.2
+
+# Vectors are sharded by the time window of their chunk: one FAISS index per
+# window under SHARDS_DIR, plus UNTIMED_SHARD for chunks without a dated timestamp
+SHARDS_DIR = "shards"
+UNTIMED_SHARD = "untimed"
+DEFAULT_SHARD_WINDOW = 3600
+# Read flags for shards, tried in order. IO_FLAG_MMAP_IFC maps the vectors and
+# graph of Flat, HNSW and IVF-PQ indexes in place (IO_FLAG_MMAP alone only maps
+# IVF inverted lists), so opening every shard does not load them into memory
+SHARD_READ_FLAGS = tuple(
+    flags for flags in (
+        getattr(faiss, "IO_FLAG_MMAP_IFC", None),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    ) if flags is not None
+)
+# Threads used to search shards in parallel
+MAX_SEARCH_THREADS = 8
+# Up to this many chunks pass a facet filter, their vectors are compared
+# exactly; larger selections are searched through the ANN index
+EXACT_PREFILTER_MAX = 10_000
+
+# Held by the one process allowed to write an index directory; others open it read-only
+WRITER_LOCK_FILE = ".writer.lock"
+
+# Bytes hashed at the head, middle and tail of each segment to validate it
+# without re-reading the whole log
+SEGMENT_SAMPLE_SIZE = 4 * 1024
+
+
+class IndexingCancelled(Exception):
+    """Raised inside a build or update when ``LogIndex.cancel`` was called."""
+
+
+def segment_digest(log_path: Path, start: int, end: int) -> str:
+    """Digest of a byte range's length and its sampled head, middle and tail blocks."""
+    digest = hashlib.sha256(str(end - start).encode("ascii"))
+    with open_log_map(log_path) as mm:
+        if end - start <= 3 * SEGMENT_SAMPLE_SIZE:
+            digest.update(mm[start:end])
+        else:
+            middle = start + (end - start - SEGMENT_SAMPLE_SIZE) // 2
+            for block_start in (start, middle, end - SEGMENT_SAMPLE_SIZE):
+                digest.update(mm[block_start:block_start + SEGMENT_SAMPLE_SIZE])
+    return digest.hexdigest()
+
+
+def _complete_lines_end(log_path: Path, start: int, end: int) -> int:
+    """Offset just past the last newline in ``[start, end)``, or ``start`` if none."""
+    with open_log_map(log_path) as mm:
+        newline = mm.rfind(b"\n", start, end)
+    return start if newline == -1 else newline + 1
+
+
+# Per-process embedding model for pool workers, created once by _init_worker
+_worker_embeddings = None
+
+
+def _clone_index_dir(source: Path, target: Path) -> None:
+    """Copy an index directory so a second log can diverge from it.
+
+    Shards, the line index and the manifest are only ever replaced whole,
+    never written in place, so they are hard-linked where the filesystem
+    allows. The docstore is copied with SQLite's backup API, which reads a
+    consistent snapshot even while another process writes it. It is copied
+    last, after the manifest, so it covers everything the manifest does;
+    chunks past the manifest are dropped by the next update.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    skipped = {LAST_ACCESS_FILE, WRITER_LOCK_FILE}
+    files = sorted(
+        (path for path in source.rglob("*") if path.is_file()),
+        key=lambda path: path.name != MANIFEST_FILE,
+    )
+    for path in files:
+        if path.name in skipped or path.name.startswith(DOCSTORE_FILE) or path.suffix == ".tmp":
+            continue
+        copy = target / path.relative_to(source)
+        copy.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(path, copy)
+        except OSError:
+            shutil.copy2(path, copy)
+    if (source / DOCSTORE_FILE).exists():
+        src = sqlite3.connect(str(source / DOCSTORE_FILE), timeout=60)
+        dst = sqlite3.connect(str(target / DOCSTORE_FILE))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+
+def _init_worker(embeddings_factory: Callable, cache_path: Optional[str]) -> None:
+    global _worker_embeddings
+    # One compute thread per worker; the pool provides the parallelism
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker_embeddings = embeddings_factory()
+    if cache_path:
+        _worker_embeddings = CachedEmbeddings(_worker_embeddings, EmbeddingCache(Path(cache_path)))
+
+
+def _embed_partition(
+    args: Tuple[str, int, int, int, Optional[int]],
+) -> Tuple[List[str], List[Dict[str, Any]], np.ndarray, int]:
+    """Pool task: chunk and embed one partition of the log.
+
+    Also returns how many chunks were actually embedded (embedding cache misses).
+    """
+    path, start, end, chunk_size, window = args
+    texts, metadatas = [], []
+    for doc in LogRecordSplitter(chunk_size=chunk_size, window=window).iter_documents(path, start=start, end=end):
+        texts.append(doc.page_content)
+        metadatas.append(doc.metadata)
+    misses_before = getattr(_worker_embeddings, "misses", 0)
+    vectors = [
+        _worker_embeddings.embed_documents(batch) for batch in batched(texts, EMBED_BATCH_SIZE)
+    ]
+    embedded = getattr(_worker_embeddings, "misses", len(texts) + misses_before) - misses_before
+    flat = [vector for batch in vectors for vector in batch]
+    return texts, metadatas, np.asarray(flat, dtype=np.float32), embedded
+
+
+class LogIndex:
+    """FAISS index over a log file that only embeds what changed since the last build.
+
+    Vectors are sharded by time window (hourly by default): each window has
+    its own FAISS index under ``shards/``, opened memory-mapped on first use,
+    so appending to a live log only rewrites the newest shard and a
+    time-restricted query only touches the shards it overlaps. Queries over
+    several shards search them in parallel and merge by distance.
+    ``docstore.sqlite`` maps each vector id to the shard, byte range, lines
+    and timestamp of its chunk, whose text is read from the log itself.
+
+    ``manifest.json`` in the cache directory records the embedding model and
+    chunker the index was built with, plus the byte ranges (segments) it
+    covers with a sampled digest of each. On reopen the manifest is validated:
+    a different model or chunker forces a full rebuild, segments whose bytes
+    changed are re-indexed on their own, and bytes appended after the last
+    segment are chunked and added. The last record (which may still gain
+    continuation lines, e.g. a stack trace being written) is indexed
+    provisionally and re-chunked with the bytes that follow it.
+    """
+
+    def __init__(
+        self,
+        log_file_path: Path,
+        config: Optional[Config] = None,
+        workers: Optional[int] = None,
+        embeddings_factory: Optional[Callable] = None,
+    ):
+        self.log_file_path = Path(log_file_path)
+        self.config = config or Config()
+        self.workers = workers or self.config.get_indexing_config().get("workers") or os.cpu_count() or 1
+        self.embedding_backend = self.config.get_embedding_config().get("backend")
+        self.embedding_model = get_embedding_backend(self.embedding_backend)["model_name"]
+        self.embeddings_factory = embeddings_factory or functools.partial(
+            create_embeddings, self.embedding_backend
+        )
+        self.embedding_cache_path: Optional[Path] = None
+        if self.config.get_indexing_config().get("embedding_cache", True):
+            self.embedding_cache_path = self.config.config_dir / EMBEDDING_CACHE_FILE
+        self.ann = ann_settings(self.config.get_indexing_config())
+        # Also hash every byte when fingerprinting the log, not just sampled blocks
+        self.full_hash = bool(self.config.get_indexing_config().get("full_hash", False))
+        window = self.config.get_indexing_config().get("shard_window", DEFAULT_SHARD_WINDOW)
+        self.shard_window: Optional[int] = int(window) if window else None
+        # Loaded shard indexes; the rest are opened on first use
+        self.shards: Dict[str, faiss.Index] = {}
+        self.docstore: Optional[ChunkStore] = None
+        # Ids whose chunks were deleted but whose vectors remain (HNSW only)
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        # Shards memory-mapped read-only (until their first write), and shards changed since persisting
+        self._mapped = set()
+        self._dirty = set()
+        self._search_pool: Optional[ThreadPoolExecutor] = None
+        self.line_index: Optional[LineIndex] = None
+        self.manifest = IndexManifest()
+        self.updated_at: Optional[float] = None
+        self.last_rebuild_reason: Optional[str] = None
+        # Stats of the last build, repair or update committed
+        self.last_stats: Dict[str, Any] = {}
+        # Guards the vector index and docstore so they can be searched while a follower appends to it
+        self.lock = threading.RLock()
+        self._embeddings = None
+        self._run: Dict[str, Any] = {}
+        self._cancelled = threading.Event()
+        self._cache_dir: Optional[Path] = None
+        # (index version, text) of the last log profile summary
+        self._profile_summary: Optional[Tuple[str, str]] = None
+        # Path of the log whose index was reused because this log starts with the same content
+        self.reused_from: Optional[str] = None
+        # Set when another process writes this index: it is loaded as that process last persisted it,
+        # and only changes by reloading (see refresh)
+        self.read_only = False
+        self._writer: Optional[FileLock] = None
+        # Modification time of the manifest a read-only index was loaded from
+        self._loaded_manifest: Optional[int] = None
+
+    @property
+    def cache_dir(self) -> Path:
+        if self._cache_dir is None:
+            self._cache_dir = self._resolve_cache_dir()
+        return self._cache_dir
+
+    def _resolve_cache_dir(self) -> Path:
+        """Find this log's index directory: by path, else by content, else a new one.
+
+        A log seen before keeps its directory as it grows. A log at a new path
+        whose content starts with an indexed log's content (a copy, a fresh
+        download, a restored backup) reuses that index: taken over if the
+        original log is gone, cloned otherwise so the two can diverge.
+        Everything else (model settings, changed bytes) is validated via the
+        manifest.
+        """
+        base = self.config.config_dir / "indexes"
+        base.mkdir(parents=True, exist_ok=True)
+        registry = IndexRegistry(base)
+        name = registry.find_by_path(self.log_file_path, self.embedding_model)
+        if name:
+            return base / name
+        match = registry.find_by_content(self.log_file_path, self.embedding_model)
+        if match is None:
+            return base / uuid.uuid4().hex[:16]
+        self.reused_from = match["path"]
+        if not Path(match["path"]).exists():
+            return base / match["name"]
+        name = uuid.uuid4().hex[:16]
+        _clone_index_dir(base / match["name"], base / name)
+        return base / name
+
+    def _register(self) -> None:
+        """Record this log's path and the fingerprint of its indexed content in the cache registry."""
+        IndexRegistry(self.cache_dir.parent).register(
+            self.cache_dir.name,
+            self.log_file_path,
+            self.embedding_model,
+            fingerprint(self.log_file_path, size=self.line_index.indexed_bytes, full=self.full_hash),
+        )
+
+    @property
+    def indexed_bytes(self) -> int:
+        return self.manifest.indexed_bytes
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            embeddings = self.embeddings_factory()
+            if self.embedding_cache_path is not None:
+                embeddings = CachedEmbeddings(embeddings, EmbeddingCache(self.embedding_cache_path))
+            self._embeddings = embeddings
+        return self._embeddings
+
+    @property
+    def chunk_count(self) -> int:
+        return self.docstore.count() if self.docstore is not None else 0
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return (self.manifest.data.get("embedding") or {}).get("dimension")
+
+    def _splitter(self) -> LogRecordSplitter:
+        return LogRecordSplitter(chunk_size=CHUNK_SIZE, window=self.shard_window)
+
+    def _shard_key(self, timestamp: Optional[float]) -> str:
+        if timestamp is None or not self.shard_window:
+            return UNTIMED_SHARD
+        return str(int(timestamp // self.shard_window))
+
+    def _shard_path(self, key: str) -> Path:
+        return self.cache_dir / SHARDS_DIR / f"{key}.faiss"
+
+    def _shard(self, key: str) -> faiss.Index:
+        """A shard's index, memory-mapping it from disk on first use."""
+        index = self.shards.get(key)
+        if index is None:
+            path = str(self._shard_path(key))
+            for flags in SHARD_READ_FLAGS:
+                try:
+                    index = faiss.read_index(path, flags)
+                    break
+                except RuntimeError:
+                    continue
+            else:
+                index = faiss.read_index(path)
+            self.shards[key] = index
+            self._mapped.add(key)
+        return index
+
+    def _writable_shard(self, key: str) -> faiss.Index:
+        """A shard's index, first reading it fully into memory if it is memory-mapped."""
+        index = self._shard(key)
+        if key in self._mapped:
+            index = self.shards[key] = faiss.read_index(str(self._shard_path(key)))
+            self._mapped.discard(key)
+        self._dirty.add(key)
+        return index
+
+    def shard_keys(self, since: Optional[float] = None, until: Optional[float] = None) -> List[str]:
+        """Shards whose time window overlaps ``[since, until]`` (epoch seconds), or all of them.
+
+        The untimed shard of a sharded index is only included when no time
+        range is given; an unsharded index keeps every chunk in it.
+        """
+        keys = list(self.manifest.data.get("shards") or {})
+        if (since is None and until is None) or not self.shard_window:
+            return keys
+        selected = []
+        for key in keys:
+            if key == UNTIMED_SHARD:
+                continue
+            window_start = int(key) * self.shard_window
+            if (until is None or window_start <= until) and (since is None or window_start + self.shard_window > since):
+                selected.append(key)
+        return selected
+
+    def _expected_settings(self) -> Dict[str, Any]:
+        """Manifest sections the current configuration would produce."""
+        # Only known once vectors exist; a loaded index is checked against its manifest separately
+        dimension = self.dimension
+        return {
+            "embedding": {
+                "backend": self.embedding_backend,
+                "model": self.embedding_model,
+                "dimension": dimension,
+            },
+            # 0 for unsharded, since None values are not checked
+            "chunker": {"name": CHUNKER_VERSION, "chunk_size": CHUNK_SIZE, "shard_window": self.shard_window or 0},
+            # Switching between auto and a fixed type rebuilds; embeddings come from the cache
+            "ann": {"index_type": self.ann["index_type"]},
+            "lexical": {"name": LEXICAL_VERSION},
+            "facets": {"name": FACETS_VERSION},
+            "fulltext": {"name": FULLTEXT_VERSION},
+            "profile": {"name": PROFILE_VERSION},
+            "trigram": {"name": TRIGRAM_VERSION},
+        }
+
+    def _segment_is_valid(self, segment: Dict[str, Any], size: int) -> bool:
+        return segment["end"] <= size and segment_digest(
+            self.log_file_path, segment["start"], segment["end"]
+        ) == segment["digest"]
+
+    def _annotate_lines(self, metadata: Dict[str, Any]) -> None:
+        """Add the 1-based line range a chunk covers to its metadata."""
+        start = metadata["start_index"]
+        metadata["line"] = self.line_index.line_at_offset(start) + 1
+        metadata["end_line"] = self.line_index.line_at_offset(max(metadata["end_index"] - 1, start)) + 1
+
+    def _open_docstore(self, clear: bool = False) -> None:
+        if self.docstore is None:
+            self.docstore = ChunkStore(self.cache_dir / DOCSTORE_FILE, str(self.log_file_path))
+        if clear:
+            self.docstore.clear()
+        self.tombstones = self.docstore.tombstones()
+
+    def _add_embedded(self, texts: List[str], metadatas: List[Dict[str, Any]], vectors) -> None:
+        """Insert already embedded chunks into their shards and the docstore."""
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        by_shard: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            by_shard.setdefault(self._shard_key(metadata.get("timestamp")), []).append(i)
+        shards = self.manifest.data.setdefault("shards", {})
+        with self.lock:
+            for key, rows in by_shard.items():
+                ids = self.docstore.add([metadatas[i] for i in rows], key, texts=[texts[i] for i in rows])
+                if key in shards:
+                    self._writable_shard(key).add_with_ids(vectors[rows], ids)
+                else:
+                    self.shards[key] = build_index("flat", vectors[rows], ids, self.ann)
+                    self._dirty.add(key)
+                    shards[key] = {}
+                times = [metadatas[i]["timestamp"] for i in rows if metadatas[i].get("timestamp") is not None]
+                if times:
+                    shards[key]["first_time"] = min(times + [shards[key].get("first_time", times[0])])
+                    shards[key]["last_time"] = max(times + [shards[key].get("last_time", times[0])])
+            self.manifest.data.setdefault("embedding", {})["dimension"] = int(vectors.shape[1])
+        self._run["chunks"] = self._run.get("chunks", 0) + len(texts)
+
+    def _delete_range(self, start: int, end: Optional[int] = None, records: bool = True) -> None:
+        """Remove chunks starting inside ``[start, end)`` (to the end of the log if ``end`` is None).
+
+        Without ``records`` the range's records stay in the full-text and
+        trigram indexes and the log profile.
+        """
+        if self.docstore is None:
+            return
+        with self.lock:
+            if records:
+                self.docstore.fulltext.remove_range(start, end)
+                self.docstore.profile.remove_range(start, end)
+                self.docstore.trigrams.remove_range(start, end)
+            for key, ids in self.docstore.ids_in_range(start, end).items():
+                if supports_remove(self._shard(key)):
+                    self._writable_shard(key).remove_ids(ids)
+                    self.docstore.remove(ids, key)
+                else:
+                    self.docstore.remove(ids, key, tombstone=True)
+                    self.tombstones = np.union1d(self.tombstones, ids)
+                    self._dirty.add(key)
+
+    def _tune_shard(self, key: str) -> None:
+        """Switch a shard to the index type suited to its size, compact its tombstones, or drop it if empty.
+
+        Conversion reconstructs the exact vectors from the current flat or HNSW
+        index, and records the recall/latency tradeoff of the new index in the
+        manifest so nprobe/efSearch can be tuned.
+        """
+        shards = self.manifest.data.setdefault("shards", {})
+        live = self.docstore.count(key)
+        if live == 0:
+            with self.lock:
+                self.shards.pop(key, None)
+                self._mapped.discard(key)
+                self.docstore.clear_tombstones(key)
+                self.tombstones = self.docstore.tombstones()
+                shards.pop(key, None)
+            return
+        index = self._shard(key)
+        total = index.ntotal
+        current = index_type_of(index)
+        target = choose_index_type(live, self.ann)
+        # IVF-PQ vectors are lossy, so a shard is never converted away from it in place
+        converting = target != current and current != "ivfpq"
+        compacting = total - live > MAX_TOMBSTONE_FRACTION * total
+        info = shards[key]
+        if converting or compacting:
+            target = target if converting else current
+            ids = self.docstore.live_ids(key)
+            vectors = reconstruct_all(index, ids)
+            index = build_index(target, vectors, ids, self.ann)
+            with self.lock:
+                self.shards[key] = index
+                self._mapped.discard(key)
+                self._dirty.add(key)
+                self.docstore.clear_tombstones(key)
+                self.tombstones = self.docstore.tombstones()
+            info["ann"] = dict(describe_index(index, self.ann), tradeoff=measure_tradeoff(index, vectors, ids, self.ann))
+        else:
+            info["ann"] = dict(info.get("ann") or {}, **describe_index(index, self.ann))
+        info["chunks"] = live
+
+    def _index_range(self, start: int, end: int, records_from: int = 0) -> List[Tuple[int, int]]:
+        """Chunk, embed and add ``[start, end)`` of the log; return the partitions indexed.
+
+        Records before ``records_from`` are already in the record indexes and
+        are only re-chunked.
+        """
+        if end <= start:
+            return []
+        self._run["bytes"] = self._run.get("bytes", 0) + end - start
+        partitions = record_aligned_ranges(self.log_file_path, start, end, PARTITION_SIZE)
+        if self.workers > 1 and end - start >= PARALLEL_MIN_BYTES:
+            self._index_partitions_parallel(partitions)
+            for part_start, part_end in partitions:
+                if part_end > records_from:
+                    self._index_records(max(part_start, records_from), part_end)
+            return partitions
+        splitter = self._splitter()
+        for part_start, part_end in partitions:
+            documents = splitter.iter_documents(self.log_file_path, start=part_start, end=part_end)
+            for batch in batched(documents, EMBED_BATCH_SIZE):
+                texts = [doc.page_content for doc in batch]
+                for doc in batch:
+                    self._annotate_lines(doc.metadata)
+                # Embed outside the lock so queries are only blocked for the insert itself
+                misses_before = getattr(self.embeddings, "misses", 0)
+                vectors = self.embeddings.embed_documents(texts)
+                embedded = getattr(self.embeddings, "misses", len(texts) + misses_before) - misses_before
+                self._run["embedded"] = self._run.get("embedded", 0) + embedded
+                self._add_embedded(texts, [doc.metadata for doc in batch], vectors)
+                self._advance(batch[-1].metadata["end_index"] - batch[0].metadata["start_index"])
+            if part_end > records_from:
+                self._index_records(max(part_start, records_from), part_end)
+        return partitions
+
+    def _index_records(self, start: int, end: int) -> None:
+        """Add the records of ``[start, end)`` to the full-text and trigram indexes and the log profile."""
+        rows, previous, last_time = [], None, None
+        for record in iter_records(self.log_file_path, start, end):
+            offset, first_line = record[0]
+            last_time = parse_timestamp(first_line) or last_time
+            if previous is not None:
+                rows.append((previous[0], offset) + previous[1:])
+            line = self.line_index.line_at_offset(offset) + 1
+            previous = (offset, line, line + len(record) - 1, last_time, "".join(text for _, text in record))
+        if previous is not None:
+            rows.append((previous[0], end) + previous[1:])
+        with self.lock:
+            self.docstore.fulltext.add(rows)
+            self.docstore.profile.add(rows)
+            self.docstore.trigrams.add_range(start, end, self.line_index.line_at_offset(start) + 1)
+
+    def _index_partitions_parallel(self, partitions: List[Tuple[int, int]]) -> None:
+        """Chunk and embed record-aligned partitions in a process pool.
+
+        Partial results are merged in file order as they complete; at most two
+        partitions per worker are in flight so memory stays bounded. Once the
+        run is cancelled no more partitions are submitted.
+        """
+        tasks = [(str(self.log_file_path), s, e, CHUNK_SIZE, self.shard_window) for s, e in partitions]
+        workers = min(self.workers, len(tasks))
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                self.embeddings_factory,
+                str(self.embedding_cache_path) if self.embedding_cache_path else None,
+            ),
+        ) as pool:
+            pending = deque()
+            remaining = iter(tasks)
+
+            def submit_next() -> None:
+                # Nothing more is queued once the run is cancelled
+                if not self._cancelled.is_set():
+                    task = next(remaining, None)
+                    if task is not None:
+                        pending.append((pool.submit(_embed_partition, task), task[2] - task[1]))
+
+            for _ in range(2 * workers):
+                submit_next()
+            while pending:
+                future, size = pending.popleft()
+                texts, metadatas, vectors, embedded = future.result()
+                if self._cancelled.is_set():
+                    # Queued partitions never start; leaving the pool waits only for the running ones
+                    for future, _ in pending:
+                        future.cancel()
+                    raise IndexingCancelled("indexing cancelled")
+                submit_next()
+                for metadata in metadatas:
+                    self._annotate_lines(metadata)
+                self._run["embedded"] = self._run.get("embedded", 0) + embedded
+                self._add_embedded(texts, metadatas, vectors)
+                self._advance(size)
+        if self._cancelled.is_set():
+            raise IndexingCancelled("indexing cancelled")
+
+    def _index_segments(self, start: int, end: int, records_from: int = 0) -> None:
+        """Index ``[start, end)`` and record its partitions as committed segments in the manifest.
+
+        Small appends grow the last segment instead of adding a new one, so a
+        followed log does not accumulate thousands of tiny segments.
+        """
+        segments = self.manifest.segments
+        for seg_start, seg_end in self._index_range(start, end, records_from):
+            last = segments[-1] if segments else None
+            if last is not None and last["end"] == seg_start and seg_end - last["start"] <= PARTITION_SIZE:
+                last["end"] = seg_end
+                last["digest"] = segment_digest(self.log_file_path, last["start"], seg_end)
+            else:
+                segments.append({
+                    "start": seg_start,
+                    "end": seg_end,
+                    "digest": segment_digest(self.log_file_path, seg_start, seg_end),
+                })
+
+    def _reopen_tail(self, end: int, grow: bool = True) -> int:
+        """Reopen the last committed chunk before ``end`` if needed; return where to re-chunk from.
+
+        With ``grow``, a chunk ending at ``end`` with room to spare is reopened
+        so appended records are packed into it as in a fresh build, instead
+        of leaving one under-filled chunk behind per update. A chunk reaching
+        past ``end`` was re-chunked by an update whose shards were never
+        written, and is always reopened. The chunk is dropped and the last
+        segment cut back to its start.
+        """
+        segments = self.manifest.segments
+        last = self.docstore.last_chunk(end) if self.docstore is not None and segments else None
+        if last is None or last[0] < segments[-1]["start"]:
+            return end
+        if not (last[1] > end or (grow and last[1] == end and last[1] - last[0] < CHUNK_SIZE)):
+            return end
+        start = last[0]
+        self._delete_range(start, end, records=False)
+        if start == segments[-1]["start"]:
+            segments.pop()
+        else:
+            segments[-1]["end"] = start
+            segments[-1]["digest"] = segment_digest(self.log_file_path, segments[-1]["start"], start)
+        return start
+
+    def _index_pending(self, start: int, end: int) -> None:
+        """Index the provisional tail ``[start, end)`` and record it in the manifest."""
+        self._index_range(start, end)
+        self.manifest.pending = {"start": start, "end": end} if end > start else None
+
+    def _begin_run(self, total: int = 0) -> None:
+        self._run = {"bytes": 0, "chunks": 0, "embedded": 0, "done": 0, "total": total, "started": time.perf_counter()}
+
+    def _advance(self, size: int) -> None:
+        """Count ``size`` more bytes as indexed in this run, or stop if the run was cancelled.
+
+        The docstore is committed after every batch so other processes
+        reading it are never locked out for a whole build.
+        """
+        self._run["done"] = self._run.get("done", 0) + size
+        if self.docstore is not None:
+            self.docstore.commit()
+        if self._cancelled.is_set():
+            raise IndexingCancelled("indexing cancelled")
+
+    def progress(self) -> Tuple[int, int, int]:
+        """Bytes indexed so far, bytes to index and chunks embedded in the current (or last) run."""
+        run = self._run
+        return run.get("done", 0), run.get("total", 0), run.get("embedded", 0)
+
+    def cancel(self) -> None:
+        """Stop a build or update running in another thread after its current batch.
+
+        Later runs on this instance are cancelled too. Nothing of the cancelled
+        run is persisted; vectors it embedded stay in the embedding cache, so
+        the next session resumes almost where this one stopped.
+        """
+        self._cancelled.set()
+
+    def _commit(self, persist: bool = True) -> Dict[str, Any]:
+        """Record settings and build stats in the manifest, optionally persisting to disk."""
+        # Progress counters are not build stats
+        run = {key: value for key, value in self._run.items() if key not in ("done", "total")}
+        seconds = time.perf_counter() - run.pop("started", time.perf_counter())
+        stats = dict(run, seconds=round(seconds, 3))
+        stats["embeddings_per_second"] = round(stats["embedded"] / seconds, 1) if seconds > 0 else 0.0
+        self.manifest.data.update(self._expected_settings())
+        for key in sorted(self._dirty):
+            self._tune_shard(key)
+        if self.docstore is not None and self.docstore.fulltext.needs_compaction:
+            self.docstore.fulltext.compact()
+        self.manifest.data["log"] = {
+            "path": str(self.log_file_path.resolve()),
+            "size": self.line_index.indexed_bytes,
+        }
+        if stats["bytes"]:
+            self.manifest.record_build(stats)
+        self.last_stats = stats
+        self.updated_at = time.time()
+        if persist:
+            self.persist()
+        elif self.docstore is not None:
+            # Shards and manifest are written later; chunks past the manifest are dropped by the next update if not
+            self.docstore.commit()
+        return stats
+
+    def persist(self) -> None:
+        """Write the docstore, vector index, line index and manifest to the cache directory.
+
+        The docstore is committed first: if writing stops halfway, a shard on
+        disk may miss chunks or hold vectors of deleted chunks, but never
+        reuses an id for a different chunk. Only shards changed since the last
+        persist are written; older ones stay untouched.
+        """
+        if self.read_only:
+            return
+        cache_dir = self.cache_dir
+        shards_dir = cache_dir / SHARDS_DIR
+        shards_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            if self.docstore is not None:
+                self.docstore.commit()
+            for key in sorted(self._dirty):
+                if key in self.shards:
+                    tmp_path = shards_dir / f"{key}.faiss.tmp"
+                    faiss.write_index(self.shards[key], str(tmp_path))
+                    os.replace(tmp_path, self._shard_path(key))
+                else:
+                    self._shard_path(key).unlink(missing_ok=True)
+            self._dirty = set()
+            self.line_index.save(cache_dir)
+            self.manifest.save(cache_dir)
+        # A long-running session's index stays in use for the cache's LRU eviction
+        touch_index(cache_dir)
+
+    def _load_cached(self, cache_dir: Path) -> Optional[str]:
+        """Load and validate the cached index; return why it must be rebuilt, or None.
+
+        Segments whose bytes changed are re-indexed in place.
+        """
+        manifest = IndexManifest.load(cache_dir)
+        if manifest is None or not (cache_dir / DOCSTORE_FILE).exists():
+            return "no cached index"
+        if any(not (cache_dir / SHARDS_DIR / f"{key}.faiss").exists() for key in manifest.data.get("shards") or {}):
+            return "shard files missing"
+        reason = manifest.incompatibility(self._expected_settings())
+        if reason:
+            return reason
+        size = self.log_file_path.stat().st_size
+        if size < manifest.indexed_bytes:
+            return "log file shrank"
+        stale = [seg for seg in manifest.segments if not self._segment_is_valid(seg, size)]
+        if manifest.segments and len(stale) == len(manifest.segments):
+            return "log content changed"
+
+        with self.lock:
+            self.manifest = manifest
+            self.shards, self._mapped, self._dirty = {}, set(), set()
+            keys = self.shard_keys()
+            # Shards are opened lazily; check one against the manifest's dimension
+            if keys and self._shard(keys[-1]).d != self.dimension:
+                return f"stored vectors have dimension {self._shard(keys[-1]).d}, manifest says {self.dimension}"
+            self._open_docstore()
+        self.updated_at = time.time()
+        self.line_index = LineIndex.load(cache_dir)
+        if self.line_index is None or stale:
+            covered = max(manifest.indexed_bytes, (manifest.pending or {}).get("end", 0))
+            self.line_index = LineIndex.build(self.log_file_path, end=covered)
+        if stale and not self.read_only:
+            self._repair(stale)
+        return None
+
+    def _repair(self, stale: List[Dict[str, Any]]) -> None:
+        """Re-index only the segments whose bytes no longer match their digest."""
+        self._begin_run(sum(segment["end"] - segment["start"] for segment in stale))
+        for segment in stale:
+            self._delete_range(segment["start"], segment["end"])
+            self._index_range(segment["start"], segment["end"])
+            segment["digest"] = segment_digest(self.log_file_path, segment["start"], segment["end"])
+        self._run["repaired_segments"] = len(stale)
+        self._commit()
+
+    def load_or_build(self, force_rebuild: bool = False) -> int:
+        """Load the cached index, repairing and extending it as needed, or build it from scratch.
+
+        Only one process writes an index at a time. If another one does (e.g.
+        a session following the log), the index is loaded as that process last
+        committed it and left unchanged (``read_only``). Returns the number of
+        indexed chunks.
+        """
+        if self._writer is None:
+            self._writer = FileLock(self.cache_dir / WRITER_LOCK_FILE)
+        self.read_only = not self._writer.acquire(blocking=False)
+        if self.read_only:
+            self._loaded_manifest = self._manifest_stamp()
+            reason = self._load_cached(self.cache_dir)
+            if reason:
+                raise RuntimeError(f"the index is being written by another process ({reason})")
+            return self.chunk_count
+        reason = "forced rebuild" if force_rebuild else self._load_cached(self.cache_dir)
+        if reason:
+            self.rebuild(reason)
+        else:
+            self.update()
+        self._register()
+        touch_index(self.cache_dir)
+        # Keep the shared index cache within its budget; this index is in use and never evicted
+        IndexCacheManager(self.config).prune(keep=[self.cache_dir])
+        return self.chunk_count
+
+    def _manifest_stamp(self) -> Optional[int]:
+        try:
+            return (self.cache_dir / MANIFEST_FILE).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self) -> bool:
+        """Reload a read-only index if the process writing it has persisted since; return True if it did."""
+        stamp = self._manifest_stamp()
+        if not self.read_only or stamp is None or stamp == self._loaded_manifest:
+            return False
+        # The manifest is written last, so everything it describes is on disk
+        if self._load_cached(self.cache_dir):
+            return False
+        self._loaded_manifest = stamp
+        return True
+
+    def close(self) -> None:
+        """Let other processes write this index again."""
+        if self._writer is not None:
+            self._writer.release()
+
+    def rebuild(self, reason: Optional[str] = None) -> Dict[str, Any]:
+        """Index the whole file from scratch; return build stats."""
+        self.last_rebuild_reason = reason
+        self.manifest = IndexManifest()
+        with self.lock:
+            self.shards, self._mapped, self._dirty = {}, set(), set()
+            shutil.rmtree(self.cache_dir / SHARDS_DIR, ignore_errors=True)
+            self._open_docstore(clear=True)
+        size = self.log_file_path.stat().st_size
+        self._begin_run(size)
+        self.line_index = LineIndex.build(self.log_file_path, end=size)
+        complete_end = _complete_lines_end(self.log_file_path, 0, size)
+        open_from = last_record_start(self.log_file_path, 0, complete_end)
+        self._index_segments(0, open_from)
+        self._index_pending(open_from, size)
+        return self._commit()
+
+    def update(self, max_bytes: Optional[int] = None, persist: bool = True) -> int:
+        """Index bytes appended since the last build; return how many new bytes were indexed.
+
+        ``max_bytes`` caps the work done per call so a caller polling a live
+        log gets bounded latency; the rest is picked up by later calls. Falls
+        back to a full rebuild if the first or last committed segment changed.
+        A read-only index is left to the process writing it, and reloaded
+        whenever that process has persisted more of the log.
+        """
+        if self.read_only:
+            self.refresh()
+            return 0
+        size = self.log_file_path.stat().st_size
+        segments = self.manifest.segments
+        if size < self.indexed_bytes or any(
+            not self._segment_is_valid(seg, size) for seg in segments[:1] + segments[-1:]
+        ):
+            self.rebuild("log file rotated or truncated")
+            return self.line_index.indexed_bytes
+
+        seen = self.line_index.indexed_bytes
+        if size <= seen:
+            return 0
+
+        previous = self.indexed_bytes
+        target = size
+        if max_bytes is not None and seen + max_bytes < size:
+            capped_end = _complete_lines_end(self.log_file_path, seen, seen + max_bytes)
+            # A single line longer than the cap is indexed in one go
+            if capped_end > seen:
+                target = capped_end
+
+        # The provisional last record is re-chunked together with the new bytes. Chunks
+        # committed to the docstore past the manifest (whose shards were never written) go too
+        self._delete_range(previous)
+        self.line_index = self.line_index.extend(self.log_file_path, end=target)
+        complete_end = _complete_lines_end(self.log_file_path, previous, target)
+        open_from = last_record_start(self.log_file_path, previous, complete_end)
+        # So is an under-filled last chunk, once there are complete records to add to it
+        reopened = self._reopen_tail(previous, grow=open_from > previous)
+        self._begin_run(target - reopened)
+        self._index_segments(reopened, open_from, records_from=previous)
+        self._index_pending(open_from, target)
+        self._commit(persist=persist)
+        return target - seen
+
+    def _vector_hits(
+        self,
+        query: str,
+        k: int,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """``(id, L2 distance)`` of the ``k`` chunks nearest to ``query`` in the shards overlapping ``[since, until]``.
+
+        With ``allowed`` (sorted chunk ids passing a facet filter) only those
+        chunks are compared: exactly when there are few of them, otherwise
+        through the ANN index restricted to them.
+        """
+        keys = self.shard_keys(since, until)
+        if not keys or self.docstore is None:
+            return []
+        if (since is not None or until is not None) and not self.shard_window:
+            # Shards do not narrow an unsharded index by time; chunk times do
+            timed = self.docstore.ids_within_time(since, until)
+            allowed = timed if allowed is None else np.intersect1d(allowed, timed)
+        by_shard = None
+        if allowed is not None:
+            by_shard = {key: ids for key, ids in self.docstore.shards_of(allowed).items() if key in keys}
+            keys = [key for key in keys if key in by_shard]
+            if not keys:
+                return []
+        vector = np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+        if by_shard is not None and len(allowed) <= EXACT_PREFILTER_MAX:
+            with self.lock:
+                ids = np.concatenate([by_shard[key] for key in keys])
+                vectors = np.concatenate([reconstruct_all(self._shard(key), by_shard[key]) for key in keys])
+            distances = ((vectors - vector) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind="stable")[:k]
+            return [(int(ids[i]), float(distances[i])) for i in order]
+        with self.lock:
+            excluded = self.tombstones if len(self.tombstones) else None
+            indexes = [(self._shard(key), by_shard[key] if by_shard is not None else None) for key in keys]
+
+            def search(shard: Tuple[faiss.Index, Optional[np.ndarray]]):
+                index, shard_allowed = shard
+                return index.search(vector, k, params=search_parameters(index, self.ann, excluded, shard_allowed))
+
+            if len(indexes) == 1:
+                results = [search(indexes[0])]
+            else:
+                # FAISS releases the GIL while searching, so shards are scanned concurrently
+                results = list(self._pool().map(search, indexes))
+        hits = sorted(
+            (distance, chunk_id)
+            for distances, ids in results
+            for distance, chunk_id in zip(distances[0], ids[0])
+            if chunk_id != -1
+        )[:k]
+        return [(int(chunk_id), float(distance)) for distance, chunk_id in hits]
+
+    def _lexical_hits(
+        self,
+        query: str,
+        k: int,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """``(id, BM25 score)`` of the ``k`` best matches for ``query`` among chunks within ``[since, until]`` (and ``allowed``)."""
+        if self.docstore is None:
+            return []
+        if since is None and until is None and allowed is None:
+            return self.docstore.lexical.search(query, k)
+        # Over-fetch and filter, widening until enough matches qualify
+        permitted = set(allowed.tolist()) if allowed is not None else None
+        limit = 4 * k
+        while True:
+            hits = self.docstore.lexical.search(query, limit)
+            in_range = [chunk_id for chunk_id, _ in hits]
+            if permitted is not None:
+                in_range = [chunk_id for chunk_id in in_range if chunk_id in permitted]
+            if since is not None or until is not None:
+                in_range = self.docstore.within_time(in_range, since, until)
+            if len(in_range) >= k or len(hits) < limit:
+                scores = dict(hits)
+                return [(chunk_id, scores[chunk_id]) for chunk_id in in_range[:k]]
+            limit *= 4
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._search_pool is None:
+            self._search_pool = ThreadPoolExecutor(max_workers=min(MAX_SEARCH_THREADS, os.cpu_count() or 1))
+        return self._search_pool
+
+    def _documents(self, hits: List[Tuple[int, float]]) -> List[Document]:
+        """Documents of ``(id, score)`` hits, in order, with the score in their metadata."""
+        with self.lock:
+            documents = self.docstore.documents([chunk_id for chunk_id, _ in hits]) if hits else []
+        for doc, (_, score) in zip(documents, hits):
+            if doc is not None:
+                doc.metadata["score"] = score
+        return [doc for doc in documents if doc is not None]
+
+    def version(self) -> str:
+        """Digest of what the index holds: its settings and the digests of every indexed byte range.
+
+        Changes whenever the index does (appends, repairs, rebuilds), so it
+        can key anything derived from search results.
+        """
+        with self.lock:
+            data = self.manifest.data
+            state = {
+                "embedding": data.get("embedding"),
+                "chunker": data.get("chunker"),
+                "segments": [[seg["start"], seg["end"], seg["digest"]] for seg in self.manifest.segments],
+            }
+            pending = self.manifest.pending
+            if pending:
+                state["pending"] = segment_digest(self.log_file_path, pending["start"], pending["end"])
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+    def profile_summary(self) -> str:
+        """Exact per-level, per-message and per-period counts of the indexed log, as compact text.
+
+        Computed from the statistics kept with the index and reused until the index changes.
+        """
+        if self.docstore is None:
+            return ""
+        version = self.version()
+        if self._profile_summary is None or self._profile_summary[0] != version:
+            self._profile_summary = (version, self.docstore.profile.summary())
+        return self._profile_summary[1]
+
+    def facet_values(self) -> Dict[str, Dict[str, int]]:
+        """Number of chunks having each level, service and host seen in the log."""
+        if self.docstore is None:
+            return {facet: {} for facet in FACETS}
+        return {facet: self.docstore.facets.values(facet) for facet in FACETS}
+
+    def _allowed(self, filters: Optional[Filters]) -> Optional[np.ndarray]:
+        """Sorted ids of the chunks passing ``filters``, from the facet bitmaps; None if unfiltered."""
+        if not filters or self.docstore is None:
+            return None
+        return self.docstore.facets.select(filters)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 6,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        filters: Optional[Filters] = None,
+    ) -> List[Document]:
+        """Search the shards overlapping ``[since, until]`` (all by default) and merge by distance.
+
+        ``filters`` (e.g. ``{"level": {"ERROR", "FATAL"}}``) restrict the
+        candidates to chunks having those facets before any vector is
+        compared. Safe to call while another thread updates the index.
+        The ``score`` of each document is ``1 / (1 + L2 distance)``.
+        """
+        hits = self._vector_hits(query, k, since, until, self._allowed(filters))
+        return self._documents([(chunk_id, 1.0 / (1.0 + distance)) for chunk_id, distance in hits])
+
+    def lexical_search(
+        self,
+        query: str,
+        k: int = 6,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        filters: Optional[Filters] = None,
+    ) -> List[Document]:
+        """BM25 search for the exact tokens of ``query`` (error codes, hosts, ids...)."""
+        return self._documents(self._lexical_hits(query, k, since, until, self._allowed(filters)))
+
+    def fulltext_search(
+        self,
+        query: str,
+        k: int = 6,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        raw: bool = False,
+        operator: str = "AND",
+        filters: Optional[Filters] = None,
+    ) -> List[Document]:
+        """FTS5 phrase/prefix search over individual log records (see ``FullTextIndex.search``)."""
+        if self.docstore is None:
+            return []
+        if not filters:
+            return self.docstore.fulltext.search(query, k, since, until, raw=raw, operator=operator)
+        # Records have no bitmaps; over-fetch and check their facets directly
+        limit = 4 * k
+        while True:
+            records = self.docstore.fulltext.search(query, limit, since, until, raw=raw, operator=operator)
+            kept = [record for record in records if matches_filters(record.page_content, filters)]
+            if len(kept) >= k or len(records) < limit:
+                return kept[:k]
+            limit *= 4
+
+    def time_span(self) -> Tuple[Optional[float], Optional[float]]:
+        """First and last record timestamps of the indexed log, (None, None) if untimed."""
+        if self.docstore is None:
+            return None, None
+        return self.docstore.fulltext.time_span()
+
+    def records_between(
+        self,
+        since: Optional[float],
+        until: Optional[float],
+        limit: int = 20,
+        around: Optional[float] = None,
+    ) -> List[Document]:
+        """Records timed within ``[since, until]`` found through the time index (see ``FullTextIndex.between``)."""
+        if self.docstore is None:
+            return []
+        return self.docstore.fulltext.between(since, until, limit, around)
+
+    def grep(self, pattern: str, limit: int = 100, flags: int = 0) -> Tuple[List[GrepMatch], int, int]:
+        """Lines matching the regex ``pattern``, scanning only blocks whose trigrams allow a match.
+
+        Returns the matches, the number of blocks scanned and the number of
+        blocks in the index (see ``TrigramIndex.grep``).
+        """
+        if self.docstore is None:
+            return [], 0, 0
+        return self.docstore.trigrams.grep(pattern, limit, flags)
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 6,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        rrf_k: int = RRF_K,
+        filters: Optional[Filters] = None,
+    ) -> List[Document]:
+        """Vector and BM25 search run in parallel, fused by reciprocal rank.
+
+        Each side contributes its top ``2 * k`` so a chunk ranked well by
+        both beats one ranked first by only one of them.
+        """
+        depth = 2 * k
+        allowed = self._allowed(filters)
+        lexical = self._pool().submit(self._lexical_hits, query, depth, since, until, allowed)
+        vector = self._vector_hits(query, depth, since, until, allowed)
+        rankings = [[chunk_id for chunk_id, _ in hits] for hits in (vector, lexical.result())]
+        return self._documents(reciprocal_rank_scores(rankings, k=rrf_k)[:k])
@@ -0,0 +1,90 @@
+"""
+Streaming, memory-mapped ingestion of log files
+"""
+import mmap
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Iterable, Optional, Tuple, Union
+
+# Upper bound on how much of the log is decoded into a Python string at once
+DEFAULT_WINDOW_SIZE = 4 * 1024 * 1024
+# SQLite limits the number of bound parameters per statement, so id lookups are batched
+LOOKUP_BATCH_SIZE = 500
+
+
+@contextmanager
+def open_log_map(path: Union[str, Path]) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Memory-map a log file read-only.
+
+    Empty files cannot be mapped, so an empty bytes object is yielded instead;
+    both support the slicing and find/rfind calls used by this module.
+    """
+    with open(path, "rb") as f:
+        if Path(path).stat().st_size == 0:
+            yield b""
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def iter_window_bytes(
+    path: Union[str, Path],
+    start: int = 0,
+    end: Optional[int] = None,
+    window_size: int = DEFAULT_WINDOW_SIZE,
+) -> Iterator[Tuple[int, bytes]]:
+    """Yield (byte_offset, raw_bytes) windows that end on a newline boundary.
+
+    A window only exceeds ``window_size`` when a single line is longer than it.
+    """
+    with open_log_map(path) as mm:
+        end = len(mm) if end is None else min(end, len(mm))
+        pos = start
+        while pos < end:
+            stop = min(pos + window_size, end)
+            if stop < end:
+                newline = mm.rfind(b"\n", pos, stop)
+                if newline == -1:
+                    newline = mm.find(b"\n", stop, end)
+                stop = end if newline == -1 else newline + 1
+            yield pos, mm[pos:stop]
+            pos = stop
+
+
+def split_lines(raw: bytes) -> Iterator[bytes]:
+    """Split on b"\n" only, keeping line endings, so offsets agree with the line index."""
+    pos, length = 0, len(raw)
+    while pos < length:
+        newline = raw.find(b"\n", pos)
+        stop = length if newline == -1 else newline + 1
+        yield raw[pos:stop]
+        pos = stop
+
+
+def iter_lines(
+    path: Union[str, Path],
+    start: int = 0,
+    end: Optional[int] = None,
+    window_size: int = DEFAULT_WINDOW_SIZE,
+) -> Iterator[Tuple[int, bytes]]:
+    """Yield (byte_offset, raw_line) pairs, newline included."""
+    for offset, raw in iter_window_bytes(path, start, end, window_size):
+        pos = 0
+        for line in split_lines(raw):
+            yield offset + pos, line
+            pos += len(line)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most ``size`` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,175 @@
+"""
+BM25 inverted index over log chunks, stored next to the chunks in the SQLite docstore
+"""
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from .ingest import LOOKUP_BATCH_SIZE
+
+LEXICAL_VERSION = "bm25-v1"
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Constant of reciprocal rank fusion: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+
+# Terms in more than this fraction of chunks (INFO, the date, ...) carry almost
+# no weight; their posting lists are only scanned when nothing rarer matched
+COMMON_TERM_FRACTION = 0.5
+MAX_TERM_LENGTH = 64
+
+# Words, plus the dotted/dashed compounds logs are full of: hostnames, IPs,
+# error codes, request ids and qualified exception names
+_WORD = re.compile(r"\w+")
+_COMPOUND = re.compile(r"\w+(?:[.\-:/@]\w+)+")
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Lowercased terms of ``text``: every word, and every compound such as ``db-01.prod`` as a whole."""
+    text = text.lower()
+    for match in _WORD.finditer(text):
+        if len(match.group()) <= MAX_TERM_LENGTH:
+            yield match.group()
+    for match in _COMPOUND.finditer(text):
+        if len(match.group()) <= MAX_TERM_LENGTH:
+            yield match.group()
+
+
+def reciprocal_rank_scores(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Merge ranked id lists into ``(id, score)`` pairs, best first, scored by the sum of ``1 / (k + rank)``."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: -pair[1])
+
+
+class BM25Index:
+    """Term postings of chunks in tables of the docstore's database.
+
+    Each posting carries the term frequency and the chunk's length, so a
+    query reads one clustered range of the postings table per term and
+    never joins. Document frequencies and corpus totals are maintained on
+    every add and remove, inside the docstore's transaction, so the
+    lexical index always matches the chunks committed with it.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self._conn = conn
+        self._lock = lock
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term INTEGER NOT NULL, chunk INTEGER NOT NULL, tf INTEGER NOT NULL, length INTEGER NOT NULL, "
+                "PRIMARY KEY (term, chunk)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lexical_stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO lexical_stats VALUES ('docs', 0), ('length', 0)")
+
+    def _term_ids(self, terms: Sequence[str]) -> Dict[str, Tuple[int, int]]:
+        """``{term: (id, df)}`` for the known ``terms``."""
+        found = {}
+        terms = list(terms)
+        for i in range(0, len(terms), LOOKUP_BATCH_SIZE):
+            batch = terms[i:i + LOOKUP_BATCH_SIZE]
+            for term_id, term, df in self._conn.execute(
+                f"SELECT id, term, df FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch
+            ):
+                found[term] = (term_id, df)
+        return found
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        counts = [Counter(tokenize(text)) for text in texts]
+        df = Counter(term for count in counts for term in count)
+        if not df:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                df.items(),
+            )
+            term_ids = self._term_ids(df)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO postings (term, chunk, tf, length) VALUES (?, ?, ?, ?)",
+                [
+                    (term_ids[term][0], int(chunk_id), tf, sum(count.values()))
+                    for chunk_id, count in zip(ids, counts)
+                    for term, tf in count.items()
+                ],
+            )
+            self._bump_stats(len(texts), sum(sum(count.values()) for count in counts))
+
+    def _bump_stats(self, docs: int, length: int) -> None:
+        self._conn.execute("UPDATE lexical_stats SET value = value + ? WHERE key = 'docs'", (docs,))
+        self._conn.execute("UPDATE lexical_stats SET value = value + ? WHERE key = 'length'", (length,))
+
+    def remove(self, ids: Sequence[int]) -> None:
+        ids = [int(i) for i in ids]
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT term, chunk, length FROM postings WHERE chunk IN ({placeholders})", batch
+                ).fetchall()
+                if not rows:
+                    continue
+                removed = Counter(term for term, _, _ in rows)
+                self._conn.executemany(
+                    "UPDATE terms SET df = df - ? WHERE id = ?", [(n, term) for term, n in removed.items()]
+                )
+                self._conn.executemany("DELETE FROM terms WHERE id = ? AND df <= 0", [(term,) for term in removed])
+                self._conn.execute(f"DELETE FROM postings WHERE chunk IN ({placeholders})", batch)
+                lengths = {chunk: length for _, chunk, length in rows}
+                self._bump_stats(-len(lengths), -sum(lengths.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("UPDATE lexical_stats SET value = 0")
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """``(chunk_id, score)`` of the ``limit`` best BM25 matches for ``query``, best first."""
+        terms = set(tokenize(query))
+        if not terms or limit <= 0:
+            return []
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT key, value FROM lexical_stats"))
+            docs, total_length = stats.get("docs", 0), stats.get("length", 0)
+            if not docs:
+                return []
+            known = sorted(self._term_ids(terms).values(), key=lambda item: item[1])
+            rare = [item for item in known if item[1] <= COMMON_TERM_FRACTION * docs]
+            chunks, scores = [], []
+            average = total_length / docs
+            for term_id, df in rare or known:
+                rows = np.array(
+                    self._conn.execute("SELECT chunk, tf, length FROM postings WHERE term = ?", (term_id,)).fetchall(),
+                    dtype=np.float64,
+                ).reshape(-1, 3)
+                idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+                tf, length = rows[:, 1], rows[:, 2]
+                chunks.append(rows[:, 0].astype(np.int64))
+                scores.append(idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average)))
+        if not chunks:
+            return []
+        ids, inverse = np.unique(np.concatenate(chunks), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        if len(ids) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(ids[i]), float(totals[i])) for i in top]
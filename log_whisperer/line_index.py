@@ -0,0 +1,98 @@
+"""
+Persistent byte-offset line index for random access into log files
+"""
+import os
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from .ingest import DEFAULT_WINDOW_SIZE, iter_window_bytes, open_log_map
+
+LINE_INDEX_FILE = "lines.idx"
+
+
+class LineIndex:
+    """Byte offset of the start of every line in a log file.
+
+    Stored as a flat array of little-endian uint64 values with one entry per
+    line plus a trailing sentinel holding the end of the last line, so line
+    ``i`` (0-based) spans ``offsets[i]:offsets[i + 1]``.
+    """
+
+    def __init__(self, offsets: np.ndarray):
+        self.offsets = offsets
+
+    @property
+    def line_count(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    @property
+    def indexed_bytes(self) -> int:
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    @classmethod
+    def build(
+        cls,
+        path: Union[str, Path],
+        start: int = 0,
+        end: Optional[int] = None,
+        window_size: int = DEFAULT_WINDOW_SIZE,
+    ) -> "LineIndex":
+        """Build the index in a single streaming pass over ``[start, end)``."""
+        parts = [np.array([start], dtype="<u8")]
+        last_end = start
+        for offset, raw in iter_window_bytes(path, start, end, window_size):
+            newlines = np.flatnonzero(np.frombuffer(raw, dtype=np.uint8) == 0x0A)
+            parts.append((newlines + offset + 1).astype("<u8"))
+            last_end = offset + len(raw)
+        offsets = np.concatenate(parts)
+        # A final line without a trailing newline still counts as a line
+        if offsets[-1] != last_end:
+            offsets = np.append(offsets, np.array([last_end], dtype="<u8"))
+        return cls(offsets)
+
+    def extend(self, path: Union[str, Path], end: Optional[int] = None) -> "LineIndex":
+        """Return a new index that also covers bytes appended since this one was built.
+
+        The last indexed line may have been incomplete, so indexing resumes at
+        its start rather than at the end of the covered range.
+        """
+        if self.line_count == 0:
+            return LineIndex.build(path, end=end)
+        resume = int(self.offsets[-2])
+        tail = LineIndex.build(path, start=resume, end=end)
+        return LineIndex(np.concatenate([self.offsets[:-2], tail.offsets]))
+
+    def save(self, directory: Union[str, Path]) -> Path:
+        """Write atomically: other sessions may have the saved index memory-mapped."""
+        path = Path(directory) / LINE_INDEX_FILE
+        tmp_path = Path(directory) / f"{LINE_INDEX_FILE}.tmp"
+        self.offsets.astype("<u8").tofile(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> Optional["LineIndex"]:
+        """Memory-map a saved index, or return None if there is none."""
+        path = Path(directory) / LINE_INDEX_FILE
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        return cls(np.memmap(path, dtype="<u8", mode="r"))
+
+    def line_at_offset(self, byte_offset: int) -> int:
+        """Return the 0-based line containing ``byte_offset``."""
+        line = int(np.searchsorted(self.offsets, byte_offset, side="right")) - 1
+        return min(max(line, 0), max(self.line_count - 1, 0))
+
+    def line_span(self, first: int, last: int) -> Tuple[int, int]:
+        """Byte range covering 0-based lines ``first`` through ``last`` inclusive."""
+        first = min(max(first, 0), self.line_count)
+        last = min(max(last, first - 1), self.line_count - 1)
+        return int(self.offsets[first]), int(self.offsets[last + 1])
+
+    def read_lines(self, log_path: Union[str, Path], first: int, last: int) -> str:
+        """Read 0-based lines ``first`` through ``last`` inclusive straight from disk."""
+        start, end = self.line_span(first, last)
+        with open_log_map(log_path) as mm:
+            return mm[start:end].decode("utf-8", errors="replace")
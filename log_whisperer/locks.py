@@ -0,0 +1,98 @@
+"""
+Advisory file locks shared between processes
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Seconds between attempts while waiting for a lock held by another process
+_RETRY_INTERVAL = 0.05
+
+# Locks held by this process: path -> (file descriptor, holders)
+_held: Dict[str, list] = {}
+_held_lock = threading.Lock()
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    """Exclusive lock on ``path`` against other processes.
+
+    Holders within one process share the lock (they coordinate through
+    their own locks), so it only keeps other processes out. The lock is
+    released by ``release`` or when the process exits.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._key = str(self.path.resolve())
+        self.held = False
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        """Take the lock; without ``blocking`` (or after ``timeout`` seconds) return False if another process has it."""
+        if self.held:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with _held_lock:
+                entry = _held.get(self._key)
+                if entry is not None:
+                    entry[1] += 1
+                    self.held = True
+                    return True
+                fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+                if _try_lock(fd):
+                    _held[self._key] = [fd, 1]
+                    self.held = True
+                    return True
+                os.close(fd)
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(_RETRY_INTERVAL)
+
+    def release(self) -> None:
+        if not self.held:
+            return
+        self.held = False
+        with _held_lock:
+            entry = _held[self._key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _held[self._key]
+                _unlock(entry[0])
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
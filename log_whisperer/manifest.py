@@ -0,0 +1,88 @@
+"""
+Index manifest: what an index directory covers and how it was built
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class IndexManifest:
+    """JSON manifest stored alongside the vectors of one index.
+
+    Records the embedding model and dimension, the chunker parameters, the
+    byte ranges ("segments") of the log that are indexed together with a
+    digest of each, and statistics about the builds that produced them. The
+    loader compares it with the current settings and file to decide between
+    reusing, selectively repairing or rebuilding the index.
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self.data = data or {
+            "manifest_version": MANIFEST_VERSION,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "segments": [],
+            "pending": None,
+            "stats": {},
+        }
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["IndexManifest"]:
+        try:
+            with open(Path(directory) / MANIFEST_FILE, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def save(self, directory: Path) -> None:
+        """Write atomically so a crash never leaves a half-written manifest."""
+        self.data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        tmp_path = Path(directory) / f"{MANIFEST_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, Path(directory) / MANIFEST_FILE)
+
+    @property
+    def segments(self) -> List[Dict[str, Any]]:
+        return self.data.setdefault("segments", [])
+
+    @property
+    def pending(self) -> Optional[Dict[str, Any]]:
+        """Provisionally indexed tail (the last, possibly unfinished record)."""
+        return self.data.get("pending")
+
+    @pending.setter
+    def pending(self, value: Optional[Dict[str, Any]]) -> None:
+        self.data["pending"] = value
+
+    @property
+    def indexed_bytes(self) -> int:
+        """End of the last committed segment; segments are contiguous from offset 0."""
+        return self.segments[-1]["end"] if self.segments else 0
+
+    def incompatibility(self, expected: Dict[str, Any]) -> Optional[str]:
+        """Describe why this index cannot be reused with ``expected`` settings, or None.
+
+        ``expected`` holds the sections (``embedding``, ``chunker``, ...) the
+        current configuration would write; values of None are not checked.
+        """
+        if self.data.get("manifest_version") != MANIFEST_VERSION:
+            return f"manifest version {self.data.get('manifest_version')} != {MANIFEST_VERSION}"
+        for section, values in expected.items():
+            recorded = self.data.get(section) or {}
+            for key, value in (values or {}).items():
+                if value is not None and recorded.get(key) != value:
+                    return f"{section} {key} changed ({recorded.get(key)} -> {value})"
+        return None
+
+    def record_build(self, stats: Dict[str, Any]) -> None:
+        """Store stats of the latest build/update and add them to the running totals."""
+        self.data.setdefault("stats", {})["last_build"] = stats
+        totals = self.data["stats"].setdefault("total", {})
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
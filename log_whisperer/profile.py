@@ -0,0 +1,263 @@
+"""
+Exact statistics of a log (per level, message template and time bucket), kept with its index
+"""
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .facets import LEVEL_ALIASES, record_facets
+from .fulltext import RecordRow
+from .records import TIMESTAMP_PREFIX
+
+PROFILE_VERSION = "record-profile-v2"
+
+# Counts are kept per hour; summaries merge buckets to fit PROFILE_MAX_BUCKETS lines
+PROFILE_BUCKET = 3600
+PROFILE_MAX_BUCKETS = 24
+SUMMARY_BUCKETS = (3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600)
+# Error and warning templates listed in the summary
+PROFILE_TOP_TEMPLATES = 10
+# Records without a level are counted under this name
+NO_LEVEL = "-"
+# Untimed records are counted in this bucket
+NO_BUCKET = -1
+
+_PROBLEM_LEVELS = ("FATAL", "ERROR", "WARN")
+_LEVEL_ORDER = ("FATAL", "ERROR", "WARN", "INFO", "DEBUG", "TRACE", NO_LEVEL)
+
+MAX_TEMPLATE_LENGTH = 160
+
+# Variable parts of messages, most specific first
+_MASKS = [
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b(?:0x[0-9a-fA-F]+|(?=[0-9a-fA-F]*[a-fA-F])(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,})\b"), "<hex>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<num>"),
+]
+_LEVEL_WORD = re.compile(r"^\W*(?:" + "|".join(LEVEL_ALIASES) + r")\b[^\w\[]*")
+# The bracketed service or thread name after the level, as in ``ERROR [payment-service] ...``
+_BRACKETED_NAME = re.compile(r"^\[[^\]\s]+\][^\w\[]*")
+
+
+def message_template(line: str) -> str:
+    """The message of a record's first line with timestamp, level and variable parts masked.
+
+    ``2024-01-31 10:00:00 ERROR timeout after 3000ms from 10.0.0.7`` and the
+    same message with other numbers share the template
+    ``timeout after <num>ms from <ip>``. A bracketed service or thread name
+    after the level is not part of the message.
+    """
+    line = line.strip()
+    stamp = TIMESTAMP_PREFIX.match(line)
+    message = line[stamp.end():] if stamp else line
+    message = message.lstrip("] ,")
+    level = _LEVEL_WORD.match(message)
+    if level:
+        message = _BRACKETED_NAME.sub("", message[level.end():], count=1)
+    for pattern, mask in _MASKS:
+        message = pattern.sub(mask, message)
+    return " ".join(message.split())[:MAX_TEMPLATE_LENGTH]
+
+
+def _bucket(timestamp: Optional[float]) -> int:
+    return NO_BUCKET if timestamp is None else int(timestamp // PROFILE_BUCKET) * PROFILE_BUCKET
+
+
+def _format_time(timestamp: Optional[float]) -> str:
+    if timestamp is None:
+        return "untimed"
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class LogProfile:
+    """Counts of records per level, message template and hour, with first/last seen times.
+
+    Updated in the same pass that indexes records, inside the docstore's
+    transaction, so the statistics always describe exactly the indexed
+    log. Each record's level, template and time are kept too, so counts of
+    a re-indexed range are recomputed exactly when it is removed.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self._conn = conn
+        self._lock = lock
+        self._template_ids: Dict[str, int] = {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_templates (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_records ("
+                "start INTEGER PRIMARY KEY, time REAL, level TEXT NOT NULL, template INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS profile_records_key ON profile_records (level, template, time)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_counts ("
+                "level TEXT NOT NULL, template INTEGER NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "first_time REAL, last_time REAL, PRIMARY KEY (level, template, bucket)) WITHOUT ROWID"
+            )
+
+    def _template_id(self, text: str) -> int:
+        template_id = self._template_ids.get(text)
+        if template_id is None:
+            self._conn.execute("INSERT OR IGNORE INTO profile_templates (text) VALUES (?)", (text,))
+            template_id = self._conn.execute("SELECT id FROM profile_templates WHERE text = ?", (text,)).fetchone()[0]
+            self._template_ids[text] = template_id
+        return template_id
+
+    def add(self, records: Iterable[RecordRow]) -> None:
+        """Count records given as full-text rows ``(start, end, line, end_line, time, text)``."""
+        counts: Dict[Tuple[str, int, int], List] = {}
+        rows = []
+        with self._lock:
+            for start, _, _, _, timestamp, text in records:
+                first_line = text.split("\n", 1)[0]
+                level = record_facets(first_line).get("level", NO_LEVEL)
+                template = self._template_id(message_template(first_line))
+                rows.append((start, timestamp, level, template))
+                entry = counts.setdefault((level, template, _bucket(timestamp)), [0, None, None])
+                entry[0] += 1
+                if timestamp is not None:
+                    entry[1] = timestamp if entry[1] is None else min(entry[1], timestamp)
+                    entry[2] = timestamp if entry[2] is None else max(entry[2], timestamp)
+            if not rows:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO profile_records (start, time, level, template) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "INSERT INTO profile_counts (level, template, bucket, count, first_time, last_time) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (level, template, bucket) DO UPDATE SET "
+                "count = count + excluded.count, "
+                "first_time = min(coalesce(first_time, excluded.first_time), coalesce(excluded.first_time, first_time)), "
+                "last_time = max(coalesce(last_time, excluded.last_time), coalesce(excluded.last_time, last_time))",
+                [key + tuple(value) for key, value in counts.items()],
+            )
+
+    def remove_range(self, start: int, end: Optional[int] = None) -> None:
+        """Uncount records starting inside ``[start, end)`` (to the end of the log if ``end`` is None)."""
+        where, params = ("start >= ?", (start,)) if end is None else ("start >= ? AND start < ?", (start, end))
+        with self._lock:
+            affected: Set[Tuple[str, int, int]] = {
+                (level, template, _bucket(timestamp))
+                for timestamp, level, template in self._conn.execute(
+                    f"SELECT time, level, template FROM profile_records WHERE {where}", params
+                )
+            }
+            self._conn.execute(f"DELETE FROM profile_records WHERE {where}", params)
+            # Recount the touched buckets from the remaining records; first/last seen cannot be decremented
+            for level, template, bucket in affected:
+                if bucket == NO_BUCKET:
+                    time_clause, time_params = "time IS NULL", ()
+                else:
+                    time_clause, time_params = "time >= ? AND time < ?", (bucket, bucket + PROFILE_BUCKET)
+                count, first, last = self._conn.execute(
+                    f"SELECT COUNT(*), MIN(time), MAX(time) FROM profile_records "
+                    f"WHERE level = ? AND template = ? AND {time_clause}",
+                    (level, template) + time_params,
+                ).fetchone()
+                if count:
+                    self._conn.execute(
+                        "UPDATE profile_counts SET count = ?, first_time = ?, last_time = ? "
+                        "WHERE level = ? AND template = ? AND bucket = ?",
+                        (count, first, last, level, template, bucket),
+                    )
+                else:
+                    self._conn.execute(
+                        "DELETE FROM profile_counts WHERE level = ? AND template = ? AND bucket = ?",
+                        (level, template, bucket),
+                    )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM profile_records")
+            self._conn.execute("DELETE FROM profile_counts")
+            self._conn.execute("DELETE FROM profile_templates")
+            self._template_ids.clear()
+
+    def levels(self) -> Dict[str, Tuple[int, Optional[float], Optional[float]]]:
+        """``{level: (count, first seen, last seen)}``."""
+        with self._lock:
+            return {
+                level: (count, first, last)
+                for level, count, first, last in self._conn.execute(
+                    "SELECT level, SUM(count), MIN(first_time), MAX(last_time) FROM profile_counts GROUP BY level"
+                )
+            }
+
+    def templates(
+        self, levels: Iterable[str] = _PROBLEM_LEVELS, limit: int = PROFILE_TOP_TEMPLATES
+    ) -> List[Tuple[str, str, int, Optional[float], Optional[float]]]:
+        """``(level, template, count, first seen, last seen)`` of the most frequent templates at ``levels``."""
+        levels = list(levels)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT c.level, t.text, SUM(c.count) AS n, MIN(c.first_time), MAX(c.last_time) "
+                "FROM profile_counts c JOIN profile_templates t ON t.id = c.template "
+                f"WHERE c.level IN ({','.join('?' * len(levels))}) "
+                "GROUP BY c.level, c.template ORDER BY n DESC LIMIT ?",
+                levels + [limit],
+            ).fetchall()
+
+    def buckets(self) -> Dict[int, Dict[str, int]]:
+        """``{hour start: {level: count}}`` of timed records."""
+        result: Dict[int, Dict[str, int]] = defaultdict(dict)
+        with self._lock:
+            for bucket, level, count in self._conn.execute(
+                "SELECT bucket, level, SUM(count) FROM profile_counts WHERE bucket != ? GROUP BY bucket, level",
+                (NO_BUCKET,),
+            ):
+                result[bucket][level] = count
+        return dict(result)
+
+    def summary(self) -> str:
+        """Compact text of the statistics for the LLM prompt; empty if nothing is indexed."""
+        levels = self.levels()
+        if not levels:
+            return ""
+        total = sum(count for count, _, _ in levels.values())
+        firsts = [first for _, first, _ in levels.values() if first is not None]
+        lasts = [last for _, _, last in levels.values() if last is not None]
+        lines = [f"Records: {total:,}" + (f", from {_format_time(min(firsts))} to {_format_time(max(lasts))} UTC" if firsts else "")]
+
+        by_level = []
+        for level in sorted(levels, key=_LEVEL_ORDER.index):
+            count, first, last = levels[level]
+            name = "no level" if level == NO_LEVEL else level
+            seen = f" (first {_format_time(first)}, last {_format_time(last)})" if level in _PROBLEM_LEVELS and first else ""
+            by_level.append(f"{name} {count:,}{seen}")
+        lines.append("By level: " + "; ".join(by_level))
+
+        templates = self.templates()
+        if templates:
+            lines.append("Most frequent error/warning messages (<num>, <ip>, <hex>, <uuid> mark variable parts):")
+            for level, text, count, first, last in templates:
+                seen = f", first {_format_time(first)}, last {_format_time(last)}" if first else ""
+                lines.append(f"- {count:,}x {level} \"{text}\"{seen}")
+
+        buckets = self.buckets()
+        if buckets:
+            span = max(buckets) - min(buckets) + PROFILE_BUCKET
+            size = next((s for s in SUMMARY_BUCKETS if span / s <= PROFILE_MAX_BUCKETS), SUMMARY_BUCKETS[-1])
+            merged: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+            for bucket, counts in buckets.items():
+                for level, count in counts.items():
+                    merged[bucket // size * size][level] += count
+            label = {3600: "hour", 6 * 3600: "6 hours", 24 * 3600: "day", 7 * 24 * 3600: "week"}[size]
+            rows = sorted(merged.items())
+            if len(rows) > PROFILE_MAX_BUCKETS:
+                # Keep the periods with the most errors and warnings, in time order
+                def problems(item):
+                    return sum(item[1].get(level, 0) for level in _PROBLEM_LEVELS)
+                rows = sorted(sorted(rows, key=problems, reverse=True)[:PROFILE_MAX_BUCKETS])
+                label += f", {PROFILE_MAX_BUCKETS} periods with most errors/warnings"
+            lines.append(f"Records per {label} (UTC):")
+            for start, counts in rows:
+                problem = ", ".join(f"{level} {counts[level]:,}" for level in _PROBLEM_LEVELS if counts.get(level))
+                lines.append(f"- {_format_time(start)[:16]}: {sum(counts.values()):,}" + (f" ({problem})" if problem else ""))
+        return "\n".join(lines)
@@ -0,0 +1,277 @@
+"""
+Log-record-aware chunking
+"""
+import calendar
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from .ingest import DEFAULT_WINDOW_SIZE, iter_lines, open_log_map, split_lines
+
+# Leading timestamps in the formats most log frameworks emit, optionally
+# bracketed: ISO 8601 / log4j / Python logging, syslog, Apache/nginx, slash dates
+TIMESTAMP_PREFIX = re.compile(
+    r"""^\[?(?:
+        \d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}(?::\d{2})?     # 2024-01-31 12:00:00 / 2024-01-31T12:00
+      | \d{4}/\d{2}/\d{2}\s\d{2}:\d{2}                   # 2024/01/31 12:00
+      | \d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}            # 31/Jan/2024:12:00
+      | [A-Z][a-z]{2}\s+\d{1,2}\s\d{2}:\d{2}:\d{2}       # Jan 31 12:00:00
+      | \d{2}:\d{2}:\d{2}[.,]\d+                          # 12:00:00.123
+      | \d{10}(?:\.\d+)?\s                                # epoch seconds
+    )""",
+    re.VERBOSE,
+)
+
+# Records that start with a level instead of a timestamp (e.g. Python's default format)
+LEVEL_PREFIX = re.compile(r"^\[?(?:TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|SEVERE|CRITICAL|FATAL)\b")
+
+CHUNKER_VERSION = "log-records-v2"
+
+# Records are cut after this many bytes, so a stray record start in an
+# unstructured log does not swallow the lines after it
+MAX_RECORD_BYTES = 64 * 1024
+
+_MONTHS = {name: i for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1
+)}
+
+# Timestamp prefixes that carry a date, with the order of their fields
+_TIMESTAMP_FORMATS = [
+    # 2024-01-31 12:00:00 / 2024-01-31T12:00 / 2024/01/31 12:00:00
+    (re.compile(r"^\[?(\d{4})[-/](\d{2})[-/](\d{2})[T\s](\d{2}):(\d{2})(?::(\d{2}))?"), "ymdHMS"),
+    # 31/Jan/2024:12:00:00
+    (re.compile(r"^\[?(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2})"), "dbyHMS"),
+    # Jan 31 12:00:00 (syslog, no year)
+    (re.compile(r"^\[?([A-Z][a-z]{2})\s+(\d{1,2})\s(\d{2}):(\d{2}):(\d{2})"), "bdHMS"),
+]
+_EPOCH_PREFIX = re.compile(r"^\[?(\d{10})(?:\.(\d+))?\s")
+
+
+def is_record_start(line: str) -> bool:
+    """True if ``line`` begins a new log record rather than continuing one.
+
+    Indented lines, ``at ...`` frames, ``Caused by:`` and ``Traceback`` blocks
+    never match, so multi-line stack traces stay with the record that logged them.
+    """
+    if not line or line[0].isspace():
+        return False
+    return bool(TIMESTAMP_PREFIX.match(line) or LEVEL_PREFIX.match(line))
+
+
+def parse_timestamp(line: str, default_year: Optional[int] = None) -> Optional[float]:
+    """Seconds since the epoch of a record's leading timestamp, or None if it has no date.
+
+    Timestamps are taken as UTC wall-clock time; syslog lines without a year
+    use ``default_year`` (the current year by default).
+    """
+    match = _EPOCH_PREFIX.match(line)
+    if match:
+        return float(f"{match.group(1)}.{match.group(2) or 0}")
+    for pattern, fields in _TIMESTAMP_FORMATS:
+        match = pattern.match(line)
+        if not match:
+            continue
+        values = dict(zip(fields, match.groups()))
+        month = values["m"] if "m" in values else _MONTHS.get(values["b"])
+        year = values.get("y") or default_year or datetime.now().year
+        try:
+            return float(calendar.timegm((
+                int(year), int(month), int(values["d"]),
+                int(values["H"]), int(values["M"]), int(values.get("S") or 0),
+            )))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def iter_records(
+    path: Union[str, Path],
+    start: int = 0,
+    end: Optional[int] = None,
+    window_size: int = DEFAULT_WINDOW_SIZE,
+) -> Iterator[List[Tuple[int, str]]]:
+    """Yield each log record in ``[start, end)`` as a list of (byte_offset, line) pairs.
+
+    Until the first recognised record start each line is a record of its own,
+    so logs without timestamps or levels (JSON lines, plain text) are read
+    one record per line. Records longer than ``MAX_RECORD_BYTES`` are cut.
+    """
+    record, size, structured = [], 0, False
+    for offset, raw in iter_lines(path, start, end, window_size):
+        line = raw.decode("utf-8", errors="replace")
+        starts = is_record_start(line)
+        if record and (starts or not structured or size >= MAX_RECORD_BYTES):
+            yield record
+            record, size = [], 0
+        structured = structured or starts
+        record.append((offset, line))
+        size += len(raw)
+    if record:
+        yield record
+
+
+def last_record_start(path: Union[str, Path], start: int, end: int, max_scan: int = 256 * 1024) -> int:
+    """Offset of the last record start in ``[start, end)``, looking back at most ``max_scan`` bytes.
+
+    Returns ``end`` if no record start is found, i.e. the range has no
+    structure worth keeping open for continuation lines.
+    """
+    scan_start = max(start, end - max_scan)
+    with open_log_map(path) as mm:
+        window = mm[scan_start:end]
+    if scan_start > start:
+        # Skip the partial line at the start of the scan window
+        newline = window.find(b"\n")
+        if newline == -1:
+            return end
+        scan_start, window = scan_start + newline + 1, window[newline + 1:]
+    found, pos = end, 0
+    for raw in split_lines(window):
+        if is_record_start(raw.decode("utf-8", errors="replace")):
+            found = scan_start + pos
+        pos += len(raw)
+    return found
+
+
+class LogRecordSplitter:
+    """Pack whole log records into chunks of at most ``chunk_size`` characters.
+
+    Unlike a generic character splitter, chunks never overlap and never cut a
+    record in two unless that single record is larger than a chunk, in which
+    case it is split on line boundaries. With ``window`` (seconds), chunks
+    also never mix records from different time windows, so each chunk can be
+    stored in the shard of its window.
+    """
+
+    def __init__(self, chunk_size: int = 2000, window: Optional[int] = None):
+        self.chunk_size = chunk_size
+        self.window = window
+
+    def _split_oversized(self, record: List[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        piece, piece_offset, piece_chars = [], record[0][0], 0
+        for offset, line in record:
+            if piece and piece_chars + len(line) > self.chunk_size:
+                yield piece_offset, "".join(piece)
+                piece, piece_offset, piece_chars = [], offset, 0
+            piece.append(line)
+            piece_chars += len(line)
+        if piece:
+            yield piece_offset, "".join(piece)
+
+    def _window_of(self, timestamp: Optional[float]) -> Optional[int]:
+        if timestamp is None or not self.window:
+            return None
+        return int(timestamp // self.window)
+
+    def iter_timed_chunks(
+        self,
+        path: Union[str, Path],
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[int, str, Optional[float]]]:
+        """Yield (byte_offset, text, timestamp) chunks for ``[start, end)`` of the log.
+
+        ``timestamp`` is that of the chunk's first record; records without a
+        dated timestamp inherit the one before them.
+        """
+        chunk, chunk_offset, chunk_chars, chunk_time = [], start, 0, None
+        last_time = None
+        for record in iter_records(path, start, end):
+            last_time = parse_timestamp(record[0][1]) or last_time
+            text = "".join(line for _, line in record)
+            if chunk and (
+                chunk_chars + len(text) > self.chunk_size
+                or self._window_of(last_time) != self._window_of(chunk_time)
+            ):
+                yield chunk_offset, "".join(chunk), chunk_time
+                chunk, chunk_chars = [], 0
+            if len(text) > self.chunk_size:
+                for offset, piece in self._split_oversized(record):
+                    yield offset, piece, last_time
+                continue
+            if not chunk:
+                chunk_offset, chunk_time = record[0][0], last_time
+            chunk.append(text)
+            chunk_chars += len(text)
+        if chunk:
+            yield chunk_offset, "".join(chunk), chunk_time
+
+    def iter_chunks(
+        self,
+        path: Union[str, Path],
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[int, str]]:
+        """Yield (byte_offset, text) chunks for ``[start, end)`` of the log."""
+        for offset, text, _ in self.iter_timed_chunks(path, start, end):
+            yield offset, text
+
+    def iter_documents(
+        self,
+        path: Union[str, Path],
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Document]:
+        """Yield chunks as Documents with their absolute byte range in ``start_index``/``end_index``.
+
+        Chunks are contiguous, so each one ends where the next begins. The
+        chunk's ``timestamp`` (see ``iter_timed_chunks``) is kept as well.
+        """
+        source = str(path)
+        if end is None:
+            end = Path(path).stat().st_size
+        previous = None
+        for offset, text, timestamp in self.iter_timed_chunks(path, start, end):
+            if previous is not None and previous[1].strip():
+                yield self._document(source, previous, offset)
+            previous = (offset, text, timestamp)
+        if previous is not None and previous[1].strip():
+            yield self._document(source, previous, end)
+
+    @staticmethod
+    def _document(source: str, chunk: Tuple[int, str, Optional[float]], end: int) -> Document:
+        offset, text, timestamp = chunk
+        return Document(
+            page_content=text,
+            metadata={"source": source, "start_index": offset, "end_index": end, "timestamp": timestamp},
+        )
+
+
+def record_aligned_ranges(
+    path: Union[str, Path],
+    start: int,
+    end: int,
+    part_size: int,
+    max_probe: int = 64 * 1024,
+) -> List[Tuple[int, int]]:
+    """Partition ``[start, end)`` into ranges of roughly ``part_size`` bytes.
+
+    Each cut is moved to the next record start within ``max_probe`` bytes of a
+    newline, so partitions can be chunked independently without splitting a
+    stack trace; if none is found the cut falls back to the newline itself.
+    """
+    bounds = [start]
+    with open_log_map(path) as mm:
+        pos = start
+        while pos + part_size < end:
+            newline = mm.find(b"\n", pos + part_size, end)
+            if newline == -1:
+                break
+            cut = probe = newline + 1
+            limit = min(end, cut + max_probe)
+            while probe < limit:
+                line_end = mm.find(b"\n", probe, end)
+                line_end = end if line_end == -1 else line_end + 1
+                if is_record_start(mm[probe:min(line_end, probe + 256)].decode("utf-8", errors="replace")):
+                    cut = probe
+                    break
+                probe = line_end
+            if cut >= end:
+                break
+            bounds.append(cut)
+            pos = cut
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
@@ -0,0 +1,132 @@
+"""
+Retrievers over the log index used by the chat chains
+"""
+import re
+from typing import Any, List, Optional
+
+from pydantic import field_validator
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from .facets import Filters, question_filters
+from .timerange import DEFAULT_AROUND_SECONDS, TimeWindow, question_time_window
+
+
+# /regex/ in a question asks for the lines matching it, e.g. "why do we see /timeout after \d+ms/?"
+GREP_PATTERN = re.compile(r"(?:^|(?<=\s))/(\S(?:.*?\S)?)/(?=\s|[?.,!]*$)")
+
+
+def grep_patterns(query: str) -> List[str]:
+    """Valid regexes written as ``/regex/`` in ``query``."""
+    patterns = []
+    for pattern in GREP_PATTERN.findall(query):
+        try:
+            re.compile(pattern)
+        except re.error:
+            continue
+        patterns.append(pattern)
+    return patterns
+
+
+# Values of ``retrieval.mode`` in config.yaml
+RETRIEVAL_MODES = {
+    "hybrid": "Vector and BM25 search fused by reciprocal rank (default)",
+    "vector": "Embedding similarity only",
+    "lexical": "BM25 over exact tokens only",
+    "fulltext": "SQLite FTS5 over individual records; best for quoted phrases and prefix* terms",
+}
+
+
+class LogRetriever(BaseRetriever):
+    """Retriever that always searches the latest state of a LogIndex.
+
+    Holding the index rather than a vector store means appends and rebuilds
+    made in the background are visible to the very next question.
+    """
+
+    index: Any
+    k: int = 6
+    mode: str = "hybrid"
+    # Matching lines added to the context per /regex/ in the question
+    grep_limit: int = 50
+    # Records added to the context when the question names a time or range,
+    # and the window either side of a single moment ("around 10:32")
+    time_limit: int = 20
+    around_seconds: float = DEFAULT_AROUND_SECONDS
+    # Restrict the search to the levels, services and hosts a question names
+    prefilter: bool = True
+
+    @field_validator("mode")
+    @classmethod
+    def _check_mode(cls, mode: str) -> str:
+        mode = mode.lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode: {mode}. Choose one of: {', '.join(RETRIEVAL_MODES)}")
+        return mode
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        window = question_time_window(query, self.index.time_span(), self.around_seconds)
+        if window is None:
+            return self._grep_documents(query) + self._search(query)
+        records = self._time_documents(window)
+        found = self._search(query, window.since, window.until)
+        # Chunks overlapping the records already quoted add nothing
+        found = [doc for doc in found if not any(_overlaps(doc, record) for record in records)]
+        return self._grep_documents(query) + records + found
+
+    def _time_documents(self, window: TimeWindow) -> List[Document]:
+        """The records of the window the question asks about, found by bisecting the time index."""
+        return self.index.records_between(window.since, window.until, limit=self.time_limit, around=window.anchor)
+
+    def _grep_documents(self, query: str) -> List[Document]:
+        """One document listing the lines matching each /regex/ of the question (trigram-accelerated)."""
+        documents = []
+        for pattern in grep_patterns(query):
+            matches, _, _ = self.index.grep(pattern, limit=self.grep_limit)
+            header = f"Lines matching /{pattern}/"
+            header += f" (first {len(matches)})" if len(matches) >= self.grep_limit else f" ({len(matches)})"
+            documents.append(Document(
+                page_content="\n".join([header + ":"] + [f"line {line}: {text}" for line, _, text in matches]),
+                metadata={"source": str(self.index.log_file_path), "grep": pattern, "matches": len(matches)},
+            ))
+        return documents
+
+    def _filters(self, query: str) -> Optional[Filters]:
+        """Facet filters implied by the question, limited to values present in the log."""
+        if not self.prefilter:
+            return None
+        known = self.index.facet_values()
+        filters = {facet: values & set(known[facet]) for facet, values in question_filters(query, known).items()}
+        # Asking about errors in a log without any is no reason to return nothing
+        return {facet: values for facet, values in filters.items() if values} or None
+
+    def _search(self, query: str, since: Optional[float] = None, until: Optional[float] = None) -> List[Document]:
+        filters = self._filters(query)
+        documents = self._search_filtered(query, since, until, filters)
+        if not documents and filters:
+            documents = self._search_filtered(query, since, until, None)
+        return documents
+
+    def _search_filtered(
+        self, query: str, since: Optional[float], until: Optional[float], filters: Optional[Filters]
+    ) -> List[Document]:
+        if self.mode == "vector":
+            return self.index.similarity_search(query, k=self.k, since=since, until=until, filters=filters)
+        if self.mode == "lexical":
+            return self.index.lexical_search(query, k=self.k, since=since, until=until, filters=filters)
+        if self.mode == "fulltext":
+            # A question rarely has all its words in one record; rank records matching any of them
+            return self.index.fulltext_search(
+                query, k=self.k, since=since, until=until, operator="OR", filters=filters
+            )
+        return self.index.hybrid_search(query, k=self.k, since=since, until=until, filters=filters)
+
+
+def _overlaps(a: Document, b: Document) -> bool:
+    return a.metadata.get("start_index", 0) < b.metadata.get("end_index", 0) and b.metadata.get(
+        "start_index", 0
+    ) < a.metadata.get("end_index", 0)
@@ -0,0 +1,124 @@
+"""
+Times and time ranges mentioned in questions, resolved against the log's time span
+"""
+import calendar
+import re
+from typing import List, Optional, Tuple
+
+# "around 10:32" and bare times select this many seconds either side
+DEFAULT_AROUND_SECONDS = 5 * 60
+
+_DAY = 24 * 3600
+
+# 2024-01-31 10:32[:05] / 2024-01-31T10:32 / 10:32[:05] [pm] / 2024-01-31
+_MOMENT = re.compile(
+    r"""(?<![\d:])(?:
+        (?P<date>\d{4}[-/]\d{2}[-/]\d{2})(?:[T\s](?P<clock>\d{1,2}:\d{2}(?::\d{2})?))?
+      | (?P<time>\d{1,2}:\d{2}(?::\d{2})?)
+    )(?:\s?(?P<meridiem>[ap]\.?m\.?))?(?![\d:])""",
+    re.VERBOSE | re.IGNORECASE,
+)
+_RANGE_JOINER = re.compile(r"^\s*(?:and|to|until|till|through|-|–)\s*$", re.IGNORECASE)
+_SINCE_WORDS = re.compile(r"\b(?:after|since|from|starting)\s*$", re.IGNORECASE)
+_UNTIL_WORDS = re.compile(r"\b(?:before|until|till|by|up to)\s*$", re.IGNORECASE)
+
+
+class TimeWindow:
+    """Epoch-second bounds (either may be None for open ranges) and the moment asked about, if any."""
+
+    def __init__(self, since: Optional[float], until: Optional[float], anchor: Optional[float] = None):
+        self.since = since
+        self.until = until
+        self.anchor = anchor
+
+    def __repr__(self) -> str:
+        return f"TimeWindow(since={self.since}, until={self.until}, anchor={self.anchor})"
+
+
+def _clock_seconds(clock: str, meridiem: Optional[str]) -> Optional[int]:
+    parts = [int(p) for p in clock.split(":")]
+    hours, minutes, seconds = parts[0], parts[1], parts[2] if len(parts) > 2 else 0
+    if meridiem:
+        if not 1 <= hours <= 12:
+            return None
+        hours = hours % 12 + (12 if meridiem.lower().startswith("p") else 0)
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _midnight(date: str) -> Optional[int]:
+    year, month, day = (int(p) for p in re.split(r"[-/]", date))
+    try:
+        return calendar.timegm((year, month, day, 0, 0, 0)) if 1 <= month <= 12 and 1 <= day <= 31 else None
+    except ValueError:
+        return None
+
+
+def _moments(text: str, span: Tuple[Optional[float], Optional[float]]) -> List[Tuple[re.Match, float, float]]:
+    """``(match, start, end)`` of each moment in ``text``; a bare date covers its whole day.
+
+    Times without a date take the date mentioned elsewhere in the question
+    ("at 14:05 on 2024-02-03"), or else the latest day of the log's
+    ``span`` at which they fall inside it (the last day otherwise).
+    """
+    first, last = span
+    matches = list(_MOMENT.finditer(text))
+    days = [m for m in matches if m.group("date") and not m.group("clock") and not m.group("meridiem")]
+    if days and any(m.group("time") for m in matches):
+        # The date qualifies the times rather than being a moment of its own
+        matches = [m for m in matches if m not in days]
+        shared_day = _midnight(days[0].group("date"))
+    else:
+        shared_day = None
+    moments = []
+    for match in matches:
+        clock = match.group("clock") or match.group("time")
+        offset = _clock_seconds(clock, match.group("meridiem")) if clock else 0
+        if offset is None:
+            continue
+        if match.group("date"):
+            midnight = _midnight(match.group("date"))
+            if midnight is None:
+                continue
+        elif shared_day is not None:
+            midnight = shared_day
+        elif last is None:
+            continue
+        else:
+            midnight = last - last % _DAY
+            while midnight + offset > last and midnight - _DAY + offset >= (first if first is not None else last):
+                midnight -= _DAY
+        moment = midnight + offset
+        moments.append((match, float(moment), float(moment + (_DAY if not clock else 0))))
+    return moments
+
+
+def question_time_window(
+    text: str,
+    span: Tuple[Optional[float], Optional[float]] = (None, None),
+    around: float = DEFAULT_AROUND_SECONDS,
+) -> Optional[TimeWindow]:
+    """The time window a question asks about, or None if it mentions no time.
+
+    Understands ranges ("between 10:00 and 10:15", "10:00-10:15"), open
+    ranges ("after 14:00", "before 2024-01-31 08:00"), whole days
+    ("on 2024-01-31") and single moments ("around 10:32", which selects
+    ``around`` seconds either side). ``span`` is the first and last
+    timestamp of the log, used to date times given without a date.
+    """
+    moments = _moments(text, span)
+    if not moments:
+        return None
+    (match, start, end) = moments[0]
+    if len(moments) > 1 and _RANGE_JOINER.match(text[match.end():moments[1][0].start()]):
+        return TimeWindow(start, moments[1][2] if moments[1][2] > moments[1][1] else moments[1][1])
+    before = text[:match.start()]
+    is_day = end > start
+    if _SINCE_WORDS.search(before):
+        return TimeWindow(start, None)
+    if _UNTIL_WORDS.search(before):
+        return TimeWindow(None, start)
+    if is_day:
+        return TimeWindow(start, end)
+    return TimeWindow(start - around, start + around, anchor=start)
@@ -0,0 +1,201 @@
+"""
+Trigram index of log blocks, so regex searches only scan blocks that can match
+"""
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from .ingest import iter_lines, iter_window_bytes
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+TRIGRAM_VERSION = "trigram-blocks-v1"
+
+# Logs are indexed in newline-aligned blocks of about this size; each block
+# stores which trigrams (lowercased, hashed into TRIGRAM_BITS buckets) it
+# contains. A regex query derives the trigrams any match must contain and
+# scans only the blocks having all of them.
+GREP_BLOCK_SIZE = 64 * 1024
+TRIGRAM_HASH_BITS = 15
+TRIGRAM_BITS = 1 << TRIGRAM_HASH_BITS
+# Alternations are expanded into at most this many trigram sets
+_MAX_ALTERNATIVES = 32
+# Signatures are tested this many blocks at a time to bound memory
+_SCAN_BATCH = 4096
+
+# (line number, byte offset, line text) of a matching line
+GrepMatch = Tuple[int, int, str]
+
+
+def _trigram_hashes(data: bytes) -> np.ndarray:
+    """Bucket of every trigram of ``data`` (lowercased)."""
+    if len(data) < 3:
+        return np.zeros(0, dtype=np.int64)
+    raw = np.frombuffer(data.lower(), dtype=np.uint8).astype(np.uint64)
+    trigrams = (raw[:-2] << np.uint64(16)) | (raw[1:-1] << np.uint64(8)) | raw[2:]
+    # Fibonacci hashing spreads the mostly-ASCII trigrams over all buckets
+    hashed = (trigrams * np.uint64(11400714819323198485)) >> np.uint64(64 - TRIGRAM_HASH_BITS)
+    return hashed.astype(np.int64)
+
+
+def block_signature(data: bytes) -> bytes:
+    """Bitmap of the trigram buckets present in ``data``."""
+    bits = np.zeros(TRIGRAM_BITS, dtype=bool)
+    bits[_trigram_hashes(data)] = True
+    return np.packbits(bits).tobytes()
+
+
+def _cross(left: List[Set[bytes]], right: List[Set[bytes]]) -> List[Set[bytes]]:
+    combined = [a | b for a in left for b in right]
+    if len(combined) > _MAX_ALTERNATIVES:
+        # Too many combinations: keep only what every alternative requires
+        return [set.intersection(*combined)]
+    return combined
+
+
+def _alternatives(parsed) -> List[Set[bytes]]:
+    """Sets of literal byte strings, one of which every match must contain (all strings of the set)."""
+    result: List[Set[bytes]] = [set()]
+    run = bytearray()
+
+    def flush():
+        nonlocal result
+        if len(run) >= 3:
+            result = _cross(result, [{bytes(run).lower()}])
+        run.clear()
+
+    for op, value in parsed:
+        if op == sre_parse.LITERAL:
+            run.extend(chr(value).encode("utf-8"))
+            continue
+        flush()
+        if op == sre_parse.SUBPATTERN:
+            result = _cross(result, _alternatives(value[-1]))
+        elif op == sre_parse.BRANCH:
+            branches = [alt for branch in value[1] for alt in _alternatives(branch)]
+            result = _cross(result, branches if len(branches) <= _MAX_ALTERNATIVES else [set.intersection(*branches)])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            result = _cross(result, _alternatives(value[2]))
+    flush()
+    return result
+
+
+def required_literals(pattern: str) -> List[Set[bytes]]:
+    """Alternative sets of literals a match of ``pattern`` must contain; ``[set()]`` if anything can match."""
+    try:
+        return _alternatives(sre_parse.parse(pattern))
+    except Exception:
+        return [set()]
+
+
+def scan_lines(
+    path: Union[str, Path],
+    regex: "re.Pattern",
+    start: int,
+    end: int,
+    first_line: int,
+    limit: int,
+) -> List[GrepMatch]:
+    """Lines of ``[start, end)`` (starting at 1-based line ``first_line``) matching ``regex``.
+
+    The range is read a window at a time, so scanning a whole log takes
+    bounded memory; the scan stops after ``limit`` matches.
+    """
+    matches = []
+    for line, (offset, raw) in enumerate(iter_lines(path, start, end), start=first_line):
+        text = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if regex.search(text):
+            matches.append((line, offset, text))
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+class TrigramIndex:
+    """Trigram signatures of the log's blocks, in tables of the docstore's database."""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock, source: str):
+        self._conn = conn
+        self._lock = lock
+        self.source = source
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS grep_blocks ("
+                "start INTEGER PRIMARY KEY, end INTEGER NOT NULL, line INTEGER NOT NULL, signature BLOB NOT NULL)"
+            )
+
+    def add_range(self, start: int, end: int, first_line: int) -> None:
+        """Index the lines of ``[start, end)``; ``first_line`` is the 1-based number of the first one."""
+        rows = []
+        line = first_line
+        for offset, data in iter_window_bytes(self.source, start, end, window_size=GREP_BLOCK_SIZE):
+            rows.append((offset, offset + len(data), line, block_signature(data)))
+            line += data.count(b"\n")
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO grep_blocks (start, end, line, signature) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def remove_range(self, start: int, end: Optional[int] = None) -> None:
+        with self._lock:
+            if end is None:
+                self._conn.execute("DELETE FROM grep_blocks WHERE start >= ?", (start,))
+            else:
+                self._conn.execute("DELETE FROM grep_blocks WHERE start >= ? AND start < ?", (start, end))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM grep_blocks")
+
+    def candidate_blocks(self, pattern: str) -> Tuple[List[Tuple[int, int, int]], int]:
+        """``(start, end, line)`` of the blocks that may contain a match, and the number of blocks."""
+        alternatives = []
+        for literals in required_literals(pattern):
+            if not literals:
+                alternatives = None
+                break
+            buckets = np.unique(np.concatenate([_trigram_hashes(literal) for literal in literals]))
+            # Byte and bit of each bucket in a signature (np.packbits is big-endian)
+            alternatives.append((buckets >> 3, (7 - (buckets & 7)).astype(np.uint8)))
+        candidates, total = [], 0
+        with self._lock:
+            cursor = self._conn.execute("SELECT start, end, line, signature FROM grep_blocks ORDER BY start")
+            while True:
+                rows = cursor.fetchmany(_SCAN_BATCH)
+                if not rows:
+                    break
+                total += len(rows)
+                if alternatives is None:
+                    candidates += [row[:3] for row in rows]
+                    continue
+                signatures = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.uint8).reshape(len(rows), -1)
+                keep = np.zeros(len(rows), dtype=bool)
+                for byte, bit in alternatives:
+                    keep |= ((signatures[:, byte] >> bit) & 1).all(axis=1)
+                candidates += [rows[i][:3] for i in np.flatnonzero(keep)]
+        return candidates, total
+
+    def grep(self, pattern: str, limit: int = 100, flags: int = 0) -> Tuple[List[GrepMatch], int, int]:
+        """Lines matching the regex ``pattern``, in file order, up to ``limit``.
+
+        Returns the matches, the number of blocks scanned and the number of
+        blocks indexed. Raises ValueError for an invalid pattern.
+        """
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression {pattern!r}: {e}") from e
+        candidates, total = self.candidate_blocks(pattern)
+        matches: List[GrepMatch] = []
+        for start, end, line in candidates:
+            matches += scan_lines(self.source, regex, start, end, line, limit - len(matches))
+            if len(matches) >= limit:
+                break
+        return matches, len(candidates), total
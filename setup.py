@@ -13,6 +13,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/vandan-savla/log-whisperer",
     packages=find_packages(),
+    package_data={"log_whisperer": ["prompts/*.txt"]},
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -46,6 +47,7 @@ setup(
         "anthropic": ["langchain-anthropic"],
         "google": ["langchain-google-genai"],
         "azure": ["langchain-openai"],
+        "fastembed": ["fastembed"],
 
     },
     entry_points={
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from log_whisperer.answer_cache import AnswerCache, answer_scope, normalize_question
+from log_whisperer.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+@pytest.fixture()
+def temp_home(monkeypatch, tmp_path):
+    class _FakeHome(Path):
+        _flavour = Path('.')._flavour
+
+    fake_home = _FakeHome(tmp_path)
+    monkeypatch.setattr("pathlib.Path.home", lambda: fake_home)
+    return tmp_path
+
+
+class _CountingEmbedding(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+def test_query_embeddings_are_cached_across_sessions(tmp_path):
+    underlying = _CountingEmbedding(size=8)
+    embeddings = CachedEmbeddings(underlying, EmbeddingCache(tmp_path / "embeddings.sqlite"))
+    first = embeddings.embed_query("any errors?")
+    assert embeddings.embed_query("any errors?") == first
+    assert underlying.queries == 1
+
+    # A new session reads it back from disk
+    reopened = CachedEmbeddings(underlying, EmbeddingCache(tmp_path / "embeddings.sqlite"))
+    assert reopened.embed_query("any errors?") == pytest.approx(first)
+    assert underlying.queries == 1 and reopened.query_hits == 1
+
+
+def test_answers_are_keyed_by_scope_and_normalized_question(tmp_path):
+    cache = AnswerCache(tmp_path / "answers.sqlite", max_entries=2)
+    docs = [Document(page_content="x", metadata={"start_index": 0, "end_index": 10})]
+    scope = answer_scope("v1", "openai:gpt", docs)
+    assert normalize_question("  Any   ERRORS?! ") == "any errors"
+    assert scope != answer_scope("v2", "openai:gpt", docs)
+    assert scope != answer_scope("v1", "openai:gpt", docs + [Document(page_content="/regex/ matches")])
+    assert scope != answer_scope("v1", "openai:gpt", docs, [HumanMessage(content="what failed?")])
+
+    cache.put(scope, "Any errors?", "Two timeouts.", vector=[1.0, 0.0])
+    assert cache.get(scope, "any errors") == "Two timeouts."
+    assert cache.get(answer_scope("v2", "openai:gpt", docs), "any errors") is None
+    # Near-identical questions match by embedding
+    assert cache.get(scope, "were there errors", vector=[0.99, 0.05]) == "Two timeouts."
+    assert cache.get(scope, "were there errors", vector=[0.0, 1.0]) is None
+
+    cache.put(scope, "b", "B")
+    cache.put(scope, "c", "C")
+    assert cache.count() == 2
+
+
+def test_repeated_conversation_reuses_answers_until_the_index_changes(temp_home, monkeypatch):
+    config_dir = Path(temp_home) / ".log-whisperer"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    (config_dir / "config.yaml").write_text("provider:\n  provider: openai\n  model: gpt-4o-mini\n  api_key: k\n")
+    llm = FakeListChatModel(responses=["first answer", "because", "other answer", "another because", "second answer"])
+    from log_whisperer import llm_factory as llm_factory_module
+    monkeypatch.setattr(llm_factory_module.llm_factory, "create_llm", lambda provider, model, cfg: llm)
+    monkeypatch.setattr(
+        "log_whisperer.index.create_embeddings", lambda backend_name=None: DeterministicFakeEmbedding(size=16)
+    )
+    from log_whisperer.chat import LogAnalyzer
+    monkeypatch.setattr(LogAnalyzer, "_get_system_instructions", lambda self: "Answer from the log.")
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text("".join(f"2024-01-01 00:00:00 ERROR request {i} failed\n" for i in range(50)))
+    analyzer = LogAnalyzer(str(log_file))
+    analyzer._initialize_rag()
+    assert analyzer._answer_with_context("Any errors?") == "first answer"
+    assert analyzer._answer_with_context("why?") == "because"
+    assert llm.i == 2
+
+    # A new session on the same log reuses answers while it repeats the earlier conversation
+    again = LogAnalyzer(str(log_file))
+    again._initialize_rag()
+    assert again._answer_with_context("any errors") == "first answer"
+    assert again._answer_with_context("Why?") == "because"
+    assert llm.i == 2
+    history = again._get_chat_history(again.session_id).messages
+    assert [m.content for m in history[-4:]] == ["any errors", "first answer", "Why?", "because"]
+
+    # A follow-up is not answered from a conversation about something else
+    other = LogAnalyzer(str(log_file))
+    other._initialize_rag()
+    assert other._answer_with_context("Any request failures?") == "other answer"
+    assert other._answer_with_context("why?") == "another because"
+    assert llm.i == 4
+
+    with open(log_file, "a") as f:
+        f.write("2024-01-01 00:00:01 ERROR disk full\n")
+    changed = LogAnalyzer(str(log_file))
+    changed._initialize_rag()
+    assert changed._answer_with_context("Any errors?") == "second answer"
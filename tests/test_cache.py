@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from log_whisperer.cache import IndexCacheManager, parse_size
+from log_whisperer.cli import main as cli_main
+from log_whisperer.config import Config
+
+
+@pytest.fixture()
+def temp_home(monkeypatch, tmp_path):
+    class _FakeHome(Path):
+        _flavour = Path('.')._flavour
+
+    fake_home = _FakeHome(tmp_path)
+    monkeypatch.setattr("pathlib.Path.home", lambda: fake_home)
+    return tmp_path
+
+
+def _fake_index(temp_home, name, size, age, log_path=None):
+    index_dir = Path(temp_home) / ".log-whisperer" / "indexes" / name
+    (index_dir / "shards").mkdir(parents=True)
+    (index_dir / "shards" / "0.faiss").write_bytes(b"\0" * size)
+    (index_dir / "manifest.json").write_text(json.dumps({"log": {"path": str(log_path or temp_home / f"{name}.log")}}))
+    marker = index_dir / ".last_access"
+    marker.touch()
+    stamp = time.time() - age
+    os.utime(marker, (stamp, stamp))
+    return index_dir
+
+
+def test_parse_size():
+    assert parse_size("500MB") == 500 * 1024 ** 2
+    assert parse_size("5 GiB") == 5 * 1024 ** 3
+    assert parse_size(1024) == 1024
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_prune_evicts_least_recently_used_first(temp_home):
+    Config()
+    oldest = _fake_index(temp_home, "oldest", 4000, age=3 * 3600)
+    older = _fake_index(temp_home, "older", 4000, age=2 * 3600)
+    recent = _fake_index(temp_home, "recent", 4000, age=3600)
+    in_use = _fake_index(temp_home, "in-use", 4000, age=60)
+
+    manager = IndexCacheManager(Config(), max_bytes=9000)
+    evicted = manager.prune(keep=[older])
+
+    # "older" is kept explicitly and "in-use" was used within the grace period
+    assert [entry.path.name for entry in evicted] == ["oldest", "recent"]
+    assert not oldest.exists() and not recent.exists()
+    assert older.exists() and in_use.exists()
+
+
+def test_cache_command_lists_and_prunes(temp_home):
+    Config()
+    (Path(temp_home) / "kept.log").write_text("x\n")
+    _fake_index(temp_home, "kept", 2000, age=3600)
+    _fake_index(temp_home, "gone", 2000, age=3600)
+
+    runner = CliRunner()
+    result = runner.invoke(cli_main, ["cache"])
+    assert result.exit_code == 0
+    assert "kept" in result.output and "(missing)" in result.output
+
+    result = runner.invoke(cli_main, ["cache", "--missing"])
+    assert result.exit_code == 0
+    assert "Removed 1 index(es)" in result.output
+    assert [entry.path.name for entry in IndexCacheManager(Config()).entries()] == ["kept"]
+
+    # An index another session has open is never pruned
+    (Path(temp_home) / "open.log").write_text("x\n")
+    _fake_index(temp_home, "open", 2000, age=60)
+    result = runner.invoke(cli_main, ["cache", "--max-size", "1KB"])
+    assert "Removed 1 index(es)" in result.output
+    assert [entry.path.name for entry in IndexCacheManager(Config()).entries()] == ["open"]
+
+
+def test_prune_evicts_shared_cache_entries_in_the_same_lru_order(temp_home):
+    from log_whisperer.embedding_cache import EmbeddingCache
+
+    config_dir = Config().config_dir
+    cache = EmbeddingCache(config_dir / "embeddings.sqlite")
+    cache.put_many((f"key-{i}".encode(), [float(i)] * 64) for i in range(2000))
+    stale = time.time() - 3 * 3600
+    with cache._connect() as conn:
+        conn.execute("UPDATE vectors SET used = ? WHERE CAST(substr(key, 5) AS INTEGER) < 1000", (stale,))
+    older = _fake_index(temp_home, "older", 4000, age=2 * 3600)
+    in_use = _fake_index(temp_home, "in-use", 4000, age=60)
+    size = cache.size_bytes()
+
+    manager = IndexCacheManager(Config(), max_bytes=size // 2 + 5000)
+    evicted = manager.prune()
+
+    # Vectors unused for 3 hours go before the index unused for 2, which goes before anything in use
+    assert manager.evicted_entries["embedding"][0] == 1000
+    assert [entry.path.name for entry in evicted] == ["older"]
+    assert not older.exists() and in_use.exists()
+    assert cache.count() == 1000 and set(cache.get_many([b"key-1999", b"key-0"])) == {b"key-1999"}
+    assert cache.size_bytes() < size
+
+    with cache._connect() as conn:
+        conn.execute("UPDATE vectors SET used = ?", (stale,))
+    result = CliRunner().invoke(cli_main, ["cache", "--max-size", "0"])
+    assert "Evicted 1000 cached embedding(s)" in result.output
+    assert "Embedding cache: 0 vector(s)" in result.output
+    assert in_use.exists()
+
+
+def test_lease_keeps_an_open_index_from_being_evicted(temp_home):
+    from log_whisperer.cache import IndexLease
+
+    Config()
+    index_dir = _fake_index(temp_home, "open", 4000, age=3600)
+    lease = IndexLease(index_dir, interval=0.01)
+    lease.start()
+    try:
+        deadline = time.time() + 5
+        while time.time() - (index_dir / ".last_access").stat().st_mtime > 60 and time.time() < deadline:
+            time.sleep(0.01)
+        assert IndexCacheManager(Config(), max_bytes=0).prune() == []
+    finally:
+        lease.stop()
+    assert index_dir.exists()
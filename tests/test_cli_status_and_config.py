@@ -42,5 +42,26 @@ provider:
     assert "Current Configuration" in result.output
     assert "Provider" in result.output
     assert "Model" in result.output
+    assert "all-mpnet-base-v2" in result.output
+
+
+def test_status_shows_configured_embedding_backend(temp_home):
+    config_dir = Path(temp_home) / ".log-whisperer"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    (config_dir / "config.yaml").write_text(
+        """
+provider:
+  provider: openai
+  model: gpt-4o-mini
+  api_key: test-key
+embedding:
+  backend: bge-small
+        """.strip()
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(cli_main, ["status"])
+    assert result.exit_code == 0
+    assert "BAAI/bge-small-en-v1.5" in result.output
 
 
@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+from log_whisperer.facets import FacetIndex, chunk_facets, question_filters, record_facets
+
+
+def test_record_facets_from_common_formats():
+    assert record_facets("2024-01-31 12:00:00 ERROR [payment-service] charge failed") == {
+        "level": "ERROR", "service": "payment-service",
+    }
+    assert record_facets("2024-01-31 12:00:00 WARNING [main] slow start") == {"level": "WARN"}
+    assert record_facets("Jan 31 12:00:00 web-01 sshd[123]: Accepted key") == {"host": "web-01", "service": "sshd"}
+    assert record_facets('{"level":"error","service":"Auth","host":"db-2","msg":"INFO missing"}') == {
+        "level": "ERROR", "service": "auth", "host": "db-2",
+    }
+    assert record_facets("ts=1 level=warn svc=api host=node-7 msg=retry") == {
+        "level": "WARN", "service": "api", "host": "node-7",
+    }
+
+
+def test_chunk_facets_collect_every_record_but_not_continuations():
+    text = (
+        "2024-01-31 12:00:00 INFO service=api started\n"
+        "2024-01-31 12:00:01 CRITICAL service=db down\n"
+        "  ERROR quoted in a stack frame service=ignored\n"
+    )
+    assert chunk_facets(text) == {"level": {"INFO", "FATAL"}, "service": {"api", "db"}}
+
+
+def test_question_filters():
+    known = {"service": ["api", "payment-service"], "host": ["web-01"]}
+    assert question_filters("What errors do you see?", known) == {"level": {"ERROR", "FATAL"}}
+    assert question_filters("Any warnings from payment-service on web-01?", known) == {
+        "level": {"WARN"}, "service": {"payment-service"}, "host": {"web-01"},
+    }
+    assert question_filters("Summarize main events", known) == {}
+
+
+def test_bitmaps_switch_containers_and_follow_removals():
+    index = FacetIndex(sqlite3.connect(":memory:"), threading.RLock())
+    errors = list(range(0, 20000, 2)) + [70000]
+    index.add(errors, ["2024-01-31 12:00:00 ERROR boom"] * len(errors))
+    index.add([1, 3], ["2024-01-31 12:00:00 INFO ok service=api"] * 2)
+    assert index.values("level") == {"ERROR": len(errors), "INFO": 2}
+    assert np.array_equal(index.select({"level": {"ERROR"}}), errors)
+    assert index.select({"level": {"INFO", "ERROR"}, "service": {"api"}}).tolist() == [1, 3]
+    assert index.select({"level": {"DEBUG"}}).tolist() == []
+
+    index.remove(list(range(0, 19990, 2)) + [3])
+    assert index.select({"level": {"ERROR"}}).tolist() == [19990, 19992, 19994, 19996, 19998, 70000]
+    assert index.values("service") == {"api": 1}
+    assert index.select({}) is None
@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from log_whisperer.fingerprint import IndexRegistry
+
+_REGISTER = """
+import sys
+from pathlib import Path
+from log_whisperer.fingerprint import IndexRegistry
+
+base, worker = Path(sys.argv[1]), sys.argv[2]
+for i in range(40):
+    name = f"{worker}-{i}"
+    (base / name).mkdir()
+    IndexRegistry(base).register(name, base / f"{name}.log", "model", {"size": i})
+"""
+
+
+def test_concurrent_registrations_are_all_kept(tmp_path):
+    workers = [
+        subprocess.Popen([sys.executable, "-c", _REGISTER, str(tmp_path), f"w{n}"])
+        for n in range(4)
+    ]
+    assert all(worker.wait(timeout=120) == 0 for worker in workers)
+
+    with open(tmp_path / "registry.json", "r", encoding="utf-8") as f:
+        indexes = json.load(f)["indexes"]
+    assert len(indexes) == 4 * 40
+    assert IndexRegistry(tmp_path).find_by_path(tmp_path / "w3-39.log", "model") == "w3-39"
+    assert not list(Path(tmp_path).glob("*.tmp"))
@@ -0,0 +1,820 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from log_whisperer.config import Config
+from log_whisperer.index import LogIndex
+
+
+@pytest.fixture()
+def temp_home(monkeypatch, tmp_path):
+    class _FakeHome(Path):
+        _flavour = Path('.')._flavour
+
+    fake_home = _FakeHome(tmp_path)
+    monkeypatch.setattr("pathlib.Path.home", lambda: fake_home)
+    return tmp_path
+
+
+@pytest.fixture()
+def fake_embeddings(monkeypatch):
+    embedded = []
+
+    class _CountingEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            embedded.extend(texts)
+            return super().embed_documents(texts)
+
+    monkeypatch.setattr(
+        "log_whisperer.index.create_embeddings",
+        lambda backend_name=None: _CountingEmbedding(size=16),
+    )
+    return embedded
+
+
+def _hourly_lines(hours, per_hour):
+    return "".join(
+        f"2024-01-01 {hour:02d}:{minute:02d}:00 INFO hour {hour} request {minute} handled\n"
+        for hour in range(hours)
+        for minute in range(per_hour)
+    )
+
+
+def _lines(start, stop):
+    return "".join(f"2024-01-01 00:00:00 INFO request {i} handled\n" for i in range(start, stop))
+
+
+def _all_docs(index):
+    return index.docstore.documents(index.docstore.live_ids())
+
+
+def test_reopen_after_append_indexes_only_tail(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 200))
+
+    LogIndex(log_file, Config()).load_or_build()
+    first_build = len(fake_embeddings)
+    assert first_build > 0
+
+    with open(log_file, "a") as f:
+        f.write(_lines(200, 210))
+    fake_embeddings.clear()
+
+    index = LogIndex(log_file, Config())
+    assert index.load_or_build() == index.chunk_count
+
+    assert 0 < len(fake_embeddings) < first_build
+    # Only the appended lines and the provisional last record are embedded again
+    assert all("request 2" in text or "request 199 " in text for text in fake_embeddings)
+    # Everything is searchable; the last record stays open for continuation lines
+    assert index.line_index.indexed_bytes == log_file.stat().st_size
+    assert index.indexed_bytes < log_file.stat().st_size
+    assert index.line_index.line_count == 210
+
+
+def test_partial_last_line_is_replaced_when_completed(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 5) + "ERROR half writ")
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    with open(log_file, "a") as f:
+        f.write("ten record\n")
+    index.update()
+
+    texts = "".join(doc.page_content for doc in _all_docs(index))
+    assert "ERROR half written record" in texts
+    assert texts.count("ERROR half writ") == 1
+
+
+def test_truncation_forces_rebuild(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 100))
+    LogIndex(log_file, Config()).load_or_build()
+
+    log_file.write_text("2024-01-02 00:00:00 ERROR rotated\n")
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    texts = [doc.page_content for doc in _all_docs(index)]
+    assert texts == ["2024-01-02 00:00:00 ERROR rotated\n"]
+
+
+def test_follower_indexes_appends_in_bounded_steps(temp_home, fake_embeddings):
+    from log_whisperer.follow import LogFollower
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 10))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    with open(log_file, "a") as f:
+        f.write(_lines(10, 100))
+    follower = LogFollower(index, interval=0.1, max_bytes=1024)
+
+    assert 0 < follower.poll() <= 1024 + 64
+    assert "bytes behind" in follower.watermark()
+    while follower.poll():
+        pass
+
+    assert follower.lag_bytes == 0
+    assert "Indexed up to line 100" in follower.watermark()
+    assert [doc.metadata["line"] for doc in index.similarity_search("request 99", k=50)]
+
+
+def test_appends_are_packed_into_the_last_chunk_as_in_a_fresh_build(temp_home, fake_embeddings):
+    import random
+
+    text = _lines(0, 400)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(text[:100])
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    rng = random.Random(0)
+    written = 100
+    while written < len(text):
+        size = rng.randint(20, 400)
+        with open(log_file, "a") as f:
+            f.write(text[written:written + size])
+        written += size
+        while index.update(max_bytes=300):
+            pass
+    replayed = sorted((doc.metadata["start_index"], doc.metadata["end_index"]) for doc in _all_docs(index))
+    # Re-chunked records are not indexed twice
+    assert len(index.fulltext_search('"request 150"', k=10)) == 1
+    index.close()
+
+    fresh = LogIndex(log_file, Config())
+    fresh.load_or_build(force_rebuild=True)
+    assert replayed == sorted((doc.metadata["start_index"], doc.metadata["end_index"]) for doc in _all_docs(fresh))
+
+
+def test_other_processes_read_an_index_between_follower_persists(temp_home, fake_embeddings):
+    import os
+    import subprocess
+    import sys
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 10))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    with open(log_file, "a") as f:
+        f.write(_lines(10, 20) + "2024-01-01 00:00:00 ERROR disk quota exceeded\n" + _lines(20, 30))
+    # A follower cycle: docstore committed, shards and manifest not yet written
+    index.update(persist=False)
+
+    env = dict(os.environ, HOME=str(temp_home), USERPROFILE=str(temp_home))
+    result = subprocess.run(
+        [sys.executable, "-m", "log_whisperer.cli", "find", "quota", "--log-file", str(log_file)],
+        env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "disk quota exceeded" in result.stdout
+
+    # The reader left the index to this process, which keeps indexing and persisting it
+    with open(log_file, "a") as f:
+        f.write(_lines(30, 40))
+    assert index.update() > 0
+    texts = "".join(doc.page_content for doc in _all_docs(index))
+    assert texts.count("disk quota exceeded") == 1 and "request 39 handled" in texts
+
+
+def test_read_only_index_reloads_what_the_writer_persists(temp_home, fake_embeddings):
+    class _HeldElsewhere:
+        def acquire(self, blocking=True, timeout=None):
+            return False
+
+        def release(self):
+            pass
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 10))
+    writer = LogIndex(log_file, Config())
+    writer.load_or_build()
+    reader = LogIndex(log_file, Config())
+    reader._writer = _HeldElsewhere()
+    reader.load_or_build()
+    assert reader.read_only
+
+    with open(log_file, "a") as f:
+        f.write("2024-01-01 00:00:00 ERROR disk quota exceeded\n" + _lines(10, 20))
+    writer.update(persist=False)
+    assert reader.update() == 0 and not reader.refresh()
+    writer.persist()
+
+    reader.update()
+    assert reader.version() == writer.version()
+    docs = reader.similarity_search("disk quota exceeded", k=50)
+    assert any("disk quota exceeded" in doc.page_content for doc in docs)
+
+
+def test_chunks_committed_past_the_manifest_are_not_duplicated(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 100))
+    crashed = LogIndex(log_file, Config())
+    crashed.load_or_build()
+    with open(log_file, "a") as f:
+        f.write(_lines(100, 200))
+    # Committed to the docstore, but the process stops before persisting
+    crashed.update(persist=False)
+    crashed.docstore.close()
+    crashed.close()
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    texts = "".join(doc.page_content for doc in _all_docs(index))
+    assert all(texts.count(f"request {i} handled") == 1 for i in (0, 99, 100, 199))
+    assert index.chunk_count == len(_all_docs(index))
+
+
+def test_builder_indexes_in_background_and_reports_progress(temp_home, fake_embeddings, monkeypatch):
+    from log_whisperer.follow import IndexBuilder
+
+    monkeypatch.setattr("log_whisperer.index.EMBED_BATCH_SIZE", 4)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 2000))
+    index = LogIndex(log_file, Config())
+    builder = IndexBuilder(index, index.load_or_build)
+    assert builder.status() == "Loading index..."
+
+    builder.start()
+    assert builder.wait(timeout=60)
+
+    assert builder.error is None
+    assert builder.status() == "Index ready"
+    done, total, embedded = index.progress()
+    assert done == total == log_file.stat().st_size
+    assert embedded == index.chunk_count
+
+
+def test_cancelled_build_is_not_persisted(temp_home, fake_embeddings, monkeypatch):
+    from log_whisperer.follow import IndexBuilder
+
+    monkeypatch.setattr("log_whisperer.index.EMBED_BATCH_SIZE", 4)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 2000))
+    index = LogIndex(log_file, Config())
+    builder = IndexBuilder(index, index.load_or_build)
+    # Stops after the first batch
+    index.cancel()
+    builder.start()
+    assert builder.wait(timeout=60)
+
+    assert builder.error == "cancelled"
+    assert 0 < index.progress()[0] < log_file.stat().st_size
+    assert not (index.cache_dir / "manifest.json").exists()
+
+
+def test_index_command_prebuilds_logs_matching_globs(temp_home, fake_embeddings):
+    from click.testing import CliRunner
+
+    from log_whisperer.cli import main as cli_main
+
+    logs_dir = Path(temp_home) / "logs"
+    logs_dir.mkdir()
+    for name in ("a.log", "b.log"):
+        (logs_dir / name).write_text(_lines(0, 100).replace("request", f"{name} request"))
+
+    result = CliRunner().invoke(cli_main, ["index", str(logs_dir / "*.log"), "--workers", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert "2 of 2 log(s) indexed" in result.output
+    fake_embeddings.clear()
+    for name in ("a.log", "b.log"):
+        assert LogIndex(logs_dir / name, Config()).load_or_build() > 0
+    assert fake_embeddings == []
+
+    result = CliRunner().invoke(cli_main, ["index", str(logs_dir / "missing*.log")])
+    assert result.exit_code == 1
+    assert "No files match" in result.output
+
+
+def test_hybrid_search_finds_exact_tokens(temp_home, fake_embeddings, monkeypatch):
+    monkeypatch.setattr("log_whisperer.index.CHUNK_SIZE", 200)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 300) + "2024-01-01 00:00:00 ERROR upstream timeout code=E4021\n" + _lines(300, 400))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    assert "E4021" in index.lexical_search("E4021", k=1)[0].page_content
+    assert any("E4021" in doc.page_content for doc in index.hybrid_search("why E4021?", k=3))
+
+    # Appends re-chunk the provisional tail; its postings are replaced, not duplicated
+    with open(log_file, "a") as f:
+        f.write(_lines(400, 410))
+    index.update()
+    assert [doc.metadata["line"] for doc in index.lexical_search("409", k=5)]
+    docs = index.docstore.lexical._conn.execute("SELECT value FROM lexical_stats WHERE key = 'docs'").fetchone()[0]
+    assert docs == index.chunk_count
+
+
+def test_fulltext_search_matches_phrases_and_prefixes_per_record(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(
+        _lines(0, 50)
+        + "2024-01-01 00:00:01 ERROR payment failed for order-8812\n"
+        + "Traceback (most recent call last):\n  File \"pay.py\", line 3\nPaymentTimeoutError: gateway slow\n"
+        + _lines(50, 100)
+    )
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    [record] = index.fulltext_search("PaymentTimeout*")
+    assert record.metadata["line"] == 51 and record.metadata["end_line"] == 54
+    assert record.page_content.startswith("2024-01-01 00:00:01 ERROR payment failed")
+    assert [r.metadata["line"] for r in index.fulltext_search('"order-8812"')] == [51]
+    assert index.fulltext_search('"failed payment"') == []
+    assert [r.metadata["line"] for r in index.fulltext_search("request 7", k=3)] == [8]
+
+    # Re-indexed records are not found twice
+    with open(log_file, "a") as f:
+        f.write(_lines(100, 103))
+    index.update()
+    assert [r.metadata["line"] for r in index.fulltext_search("request 99")] == [104]
+
+
+def test_find_command_prints_matching_lines(temp_home, fake_embeddings):
+    from click.testing import CliRunner
+
+    from log_whisperer.cli import main as cli_main
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 30))
+
+    result = CliRunner().invoke(cli_main, ["find", "request 12", "--log-file", str(log_file)])
+
+    assert result.exit_code == 0, result.output
+    assert f"{log_file}:13: 2024-01-01 00:00:00 INFO request 12 handled" in result.output
+    assert "1 matching record(s)" in result.output
+
+    result = CliRunner().invoke(cli_main, ["find", "NEAR(", "--raw", "--log-file", str(log_file)])
+    assert result.exit_code == 1
+    assert "Invalid search query" in result.output
+
+
+def test_search_command_prints_ranked_excerpts_without_the_llm(temp_home, fake_embeddings):
+    from click.testing import CliRunner
+
+    from log_whisperer.cli import main as cli_main
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 300) + "2024-01-01 00:00:00 ERROR upstream timeout after 3000ms\n")
+
+    result = CliRunner().invoke(cli_main, ["search", "upstream timeout", "--log-file", str(log_file), "--k", "2"])
+    assert result.exit_code == 0, result.output
+    assert "#1 " in result.output and "score " in result.output
+    assert "ERROR upstream timeout after 3000ms" in result.output
+    assert "2 excerpt(s), hybrid retrieval" in result.output
+
+    result = CliRunner().invoke(
+        cli_main, ["search", "upstream /timeout after \\d+ms/", "--log-file", str(log_file), "--mode", "lexical", "--json"]
+    )
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.output)
+    assert data["mode"] == "lexical"
+    grep, best = data["results"][:2]
+    assert grep["kind"] == "grep" and grep["matches"] == 1
+    assert best["rank"] == 2 and best["score"] > 0 and best["end_line"] == 301
+    assert best["text"].endswith("ERROR upstream timeout after 3000ms")
+    scores = [r["score"] for r in data["results"][1:]]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_grep_and_regex_questions_use_the_trigram_index(temp_home, fake_embeddings):
+    from log_whisperer.retrieval import LogRetriever
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 100) + "2024-01-01 00:00:00 ERROR upstream timeout after 3000ms\n")
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    matches, _, _ = index.grep(r"timeout after \d+ms")
+    assert [line for line, _, _ in matches] == [101]
+
+    with open(log_file, "a") as f:
+        f.write(_lines(100, 105) + "2024-01-01 00:00:00 ERROR upstream timeout after 10ms\n")
+    index.update()
+    matches, _, _ = index.grep(r"timeout after \d+ms")
+    assert [line for line, _, _ in matches] == [101, 107]
+
+    documents = LogRetriever(index=index, k=2).invoke("why /timeout after \\d+ms/?")
+    assert documents[0].metadata["grep"] == r"timeout after \d+ms"
+    assert "line 107: 2024-01-01 00:00:00 ERROR upstream timeout after 10ms" in documents[0].page_content
+    assert len(documents) == 3
+
+
+def test_questions_about_a_time_get_the_records_of_that_window(temp_home, fake_embeddings):
+    from log_whisperer.retrieval import LogRetriever
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(4, 60))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    hour = 1704067200  # 2024-01-01 00:00 UTC
+    assert index.time_span() == (hour, hour + 3 * 3600 + 59 * 60)
+
+    records = index.records_between(hour + 3600, hour + 7200, limit=3, around=hour + 3600 + 30 * 60)
+    assert [r.metadata["line"] for r in records] == [90, 91, 92]
+
+    documents = LogRetriever(index=index, k=2, time_limit=5).invoke("what happened around 02:30?")
+    times = [doc.page_content.split()[1] for doc in documents[:5]]
+    assert times == ["02:28:00", "02:29:00", "02:30:00", "02:31:00", "02:32:00"]
+    # The search is scoped to the window too and skips chunks already quoted
+    assert all(" hour 2 request 2" in doc.page_content or " hour 2 request 3" in doc.page_content for doc in documents[5:])
+
+    documents = LogRetriever(index=index, k=2, time_limit=100).invoke("errors between 01:10 and 01:14?")
+    assert [doc.page_content.split()[1] for doc in documents[:5]] == [f"01:{m}:00" for m in range(10, 15)]
+    assert all(doc.page_content.split()[1].startswith("01:") for doc in documents[5:])
+
+
+def test_level_filters_restrict_candidates_before_vector_search(temp_home, fake_embeddings, monkeypatch):
+    from log_whisperer.retrieval import LogRetriever
+
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text("".join(
+        _lines(i * 100, i * 100 + 100) + f"2024-01-01 00:00:00 ERROR service=billing charge {i} failed\n"
+        for i in range(5)
+    ))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    assert index.facet_values()["level"]["ERROR"] == 5
+    assert index.facet_values()["service"] == {"billing": 5}
+
+    errors = {"level": {"ERROR"}}
+    for exact_max in (10_000, 0):
+        monkeypatch.setattr("log_whisperer.index.EXACT_PREFILTER_MAX", exact_max)
+        results = index.similarity_search("request handled", k=10, filters=errors)
+        assert len(results) == 5 and all(" ERROR " in doc.page_content for doc in results)
+    assert len(index.hybrid_search("request 7 handled", k=3, filters=errors)) == 3
+    assert all(" ERROR " in doc.page_content for doc in index.hybrid_search("request 7 handled", k=3, filters=errors))
+    [record] = index.fulltext_search("charge 3", filters=errors, operator="OR", k=1)
+    assert "charge 3 failed" in record.page_content
+
+    documents = LogRetriever(index=index, k=3).invoke("What errors do you see?")
+    assert len(documents) == 3 and all(" ERROR " in doc.page_content for doc in documents)
+    # Nothing in the log is DEBUG: the filter is dropped rather than returning nothing
+    assert len(LogRetriever(index=index, k=3).invoke("any debug output?")) == 3
+
+
+def test_profile_counts_the_whole_log_and_follows_appends(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(3, 50) + "2024-01-01 01:30:00 ERROR payment 17 declined\n")
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    summary = index.profile_summary()
+    assert "Records: 151, from 2024-01-01 00:00:00 to 2024-01-01 02:49:00 UTC" in summary
+    assert "ERROR 1 (first 2024-01-01 01:30:00, last 2024-01-01 01:30:00)" in summary
+    assert '- 1x ERROR "payment <num> declined"' in summary
+    assert index.profile_summary() is summary
+
+    with open(log_file, "a") as f:
+        f.write("2024-01-01 03:15:00 ERROR payment 18 declined\n2024-01-01 03:16:00 INFO done\n")
+    reopened = LogIndex(log_file, Config())
+    reopened.load_or_build()
+    summary = reopened.profile_summary()
+    # The provisional last record is re-indexed without being counted twice
+    assert "Records: 153," in summary
+    assert "ERROR 2 (first 2024-01-01 01:30:00, last 2024-01-01 03:15:00)" in summary
+    assert "- 2024-01-01 03:00: 2 (ERROR 1)" in summary
+
+
+def test_logs_without_timestamps_are_indexed_per_line(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.jsonl"
+    log_file.write_text("".join(
+        f'{{"level": "{"error" if i % 10 == 0 else "info"}", "msg": "request {i} done"}}\n' for i in range(3000)
+    ))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    summary = index.profile_summary()
+    assert "Records: 3,000" in summary
+    assert "ERROR 300" in summary
+    hits = index.fulltext_search('"request 1230"', k=5)
+    assert [hit.page_content for hit in hits] == ['{"level": "error", "msg": "request 1230 done"}\n']
+
+
+def _fake_embeddings_factory():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def test_parallel_build_matches_serial_chunks(temp_home, monkeypatch):
+    monkeypatch.setattr("log_whisperer.index.PARALLEL_MIN_BYTES", 1)
+    monkeypatch.setattr("log_whisperer.index.PARTITION_SIZE", 2048)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 300))
+
+    serial = LogIndex(log_file, Config(), workers=1, embeddings_factory=_fake_embeddings_factory)
+    serial.rebuild()
+    parallel = LogIndex(log_file, Config(), workers=3, embeddings_factory=_fake_embeddings_factory)
+    parallel.rebuild()
+
+    def chunk_set(index):
+        return sorted(
+            (doc.metadata["start_index"], doc.metadata["line"], doc.page_content)
+            for doc in _all_docs(index)
+        )
+
+    parallel_chunks = chunk_set(parallel)
+    assert "".join(text for _, _, text in parallel_chunks) == log_file.read_text()
+    assert len(parallel_chunks) >= len(chunk_set(serial))
+    assert parallel.chunk_count == len(parallel_chunks)
+
+
+def test_cancelled_parallel_build_submits_no_more_partitions(temp_home, monkeypatch):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from log_whisperer.index import IndexingCancelled
+
+    submitted = []
+
+    class _CancellingPool(ProcessPoolExecutor):
+        """Cancels the run as soon as a partition's result is collected."""
+
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args)
+            future = super().submit(fn, *args, **kwargs)
+            result = future.result
+
+            def cancel_on_result(*a, **kw):
+                value = result(*a, **kw)
+                index.cancel()
+                return value
+
+            future.result = cancel_on_result
+            return future
+
+    monkeypatch.setattr("log_whisperer.index.ProcessPoolExecutor", _CancellingPool)
+    monkeypatch.setattr("log_whisperer.index.PARALLEL_MIN_BYTES", 1)
+    monkeypatch.setattr("log_whisperer.index.PARTITION_SIZE", 2048)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 1000))
+    index = LogIndex(log_file, Config(), workers=2, embeddings_factory=_fake_embeddings_factory)
+
+    with pytest.raises(IndexingCancelled):
+        index.rebuild()
+    # Only the two partitions per worker queued up front
+    assert len(submitted) == 4
+    assert index.chunk_count == 0
+
+
+def test_copied_log_reuses_index_by_content(temp_home, fake_embeddings):
+    original = Path(temp_home) / "app.log"
+    original.write_text(_lines(0, 100))
+    first = LogIndex(original, Config())
+    first.load_or_build()
+    assert fake_embeddings
+
+    copy_dir = Path(temp_home) / "copies"
+    copy_dir.mkdir()
+    copy = copy_dir / "app.log"
+    copy.write_text(_lines(0, 100))
+    fake_embeddings.clear()
+
+    index = LogIndex(copy, Config())
+    index.load_or_build()
+
+    assert fake_embeddings == []
+    assert index.reused_from == str(original.resolve())
+    # The original still exists, so the copy gets its own copy of the index
+    assert index.cache_dir != first.cache_dir
+    assert index.chunk_count == first.chunk_count
+    assert all(doc.metadata["source"] == str(copy) for doc in _all_docs(index))
+    # Shards are shared until either index rewrites them; the docstore is a snapshot of its own
+    for shard in (first.cache_dir / "shards").iterdir():
+        assert (index.cache_dir / "shards" / shard.name).stat().st_ino == shard.stat().st_ino
+    docstore = "docstore.sqlite"
+    assert (index.cache_dir / docstore).stat().st_ino != (first.cache_dir / docstore).stat().st_ino
+
+    # A copy that grew since only indexes its tail
+    with open(copy, "a") as f:
+        f.write(_lines(100, 105))
+    index = LogIndex(copy, Config())
+    index.load_or_build()
+
+    # Only the chunk that now includes the extra lines and the provisional last record are new
+    assert len(fake_embeddings) == 2
+    assert all("request 10" in text for text in fake_embeddings)
+
+
+def test_moved_log_takes_over_its_index(temp_home, fake_embeddings):
+    original = Path(temp_home) / "app.log"
+    original.write_text(_lines(0, 100))
+    first = LogIndex(original, Config())
+    first.load_or_build()
+    fake_embeddings.clear()
+
+    moved = Path(temp_home) / "archive.log"
+    original.rename(moved)
+    index = LogIndex(moved, Config())
+    index.load_or_build()
+
+    assert fake_embeddings == []
+    assert index.cache_dir == first.cache_dir
+    assert LogIndex(moved, Config()).cache_dir == first.cache_dir
+
+
+def test_full_hash_tells_apart_logs_differing_outside_sampled_blocks(temp_home, fake_embeddings):
+    Config().save_config({"indexing": {"full_hash": True}})
+    config = Config()
+    first_log = Path(temp_home) / "a.log"
+    first_log.write_text(_lines(0, 6000))
+    second_log = Path(temp_home) / "b.log"
+    # Between the sampled head and middle blocks
+    second_log.write_text(_lines(0, 6000).replace("request 1800 ", "request 18OO "))
+
+    first = LogIndex(first_log, config)
+    first.load_or_build()
+    fake_embeddings.clear()
+    second = LogIndex(second_log, config)
+    second.load_or_build()
+
+    assert second.reused_from is None
+    assert second.cache_dir != first.cache_dir
+    assert fake_embeddings
+
+
+def test_changed_segment_is_repaired_selectively(temp_home, fake_embeddings, monkeypatch):
+    monkeypatch.setattr("log_whisperer.index.PARTITION_SIZE", 2048)
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 300))
+    first = LogIndex(log_file, Config())
+    first.load_or_build()
+    assert len(first.manifest.segments) > 3
+    chunk_count = first.chunk_count
+
+    # Same length, different bytes in the middle of the log
+    log_file.write_text(log_file.read_text().replace("request 150 handled", "request 150 HANDLED"))
+    fake_embeddings.clear()
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    assert index.last_rebuild_reason is None
+    assert index.manifest.data["stats"]["last_build"]["repaired_segments"] == 1
+    # Only the chunks of the changed segment are embedded again
+    assert any("request 150 HANDLED" in text for text in fake_embeddings)
+    assert len(fake_embeddings) < chunk_count // 2
+    docs = sorted(_all_docs(index), key=lambda doc: doc.metadata["start_index"])
+    assert "".join(doc.page_content for doc in docs) == log_file.read_text()
+
+
+def test_incompatible_manifest_forces_rebuild(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 50))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+
+    reopened = LogIndex(log_file, Config())
+    reopened.load_or_build()
+    assert reopened.last_rebuild_reason is None
+
+    manifest_path = index.cache_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["chunker"]["chunk_size"] = 500
+    manifest_path.write_text(json.dumps(manifest))
+
+    rebuilt = LogIndex(log_file, Config())
+    rebuilt.load_or_build()
+    assert "chunk_size" in rebuilt.last_rebuild_reason
+    assert rebuilt.manifest.data["chunker"]["chunk_size"] != 500
+
+
+def test_changing_the_shard_window_forces_rebuild(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(3, 5))
+    LogIndex(log_file, Config()).load_or_build()
+
+    # Unsharded and back again
+    for window, shards in ((0, 1), (3600, 3)):
+        Config().save_config({"indexing": {"shard_window": window}})
+        index = LogIndex(log_file, Config())
+        index.load_or_build()
+        assert "shard_window" in index.last_rebuild_reason
+        assert index.manifest.data["chunker"]["shard_window"] == window
+        assert len(index.manifest.data["shards"]) == shards
+        index.close()
+
+
+def test_time_restricted_search_of_an_unsharded_index(temp_home, fake_embeddings):
+    Config().save_config({"indexing": {"shard_window": 0}})
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(3, 60))
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    assert list(index.manifest.data["shards"]) == ["untimed"]
+
+    assert index.similarity_search("request handled", k=50, since=0, until=2e9)
+    hour_two = 1704074400  # 2024-01-01 02:00:00 UTC
+    docs = index.similarity_search("request handled", k=50, since=hour_two, until=hour_two + 3599)
+    assert docs and all(hour_two <= doc.metadata["timestamp"] < hour_two + 3600 for doc in docs)
+
+
+def test_auto_index_type_switches_to_hnsw_and_tombstones_deletes(temp_home, fake_embeddings):
+    Config().save_config({"indexing": {"flat_max_vectors": 10, "ef_search": 32}})
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 2000))
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    (shard,) = index.manifest.data["shards"].values()
+    ann = shard["ann"]
+    assert ann["type"] == "hnsw" and index.manifest.data["ann"]["index_type"] == "auto"
+    assert ann["tradeoff"] and all(0 <= row["recall"] <= 1 for row in ann["tradeoff"])
+
+    # Re-chunking the provisional last record deletes its old chunk
+    with open(log_file, "a") as f:
+        f.write("    at com.example.Handler.handle(Handler.java:42)\n")
+    index.update()
+    assert len(index.tombstones)
+    results = index.similarity_search("request 1999 handled Handler.java", k=50)
+    assert all(isinstance(doc, Document) for doc in results)
+    assert sum("request 1999 handled" in doc.page_content for doc in results) == 1
+
+    reopened = LogIndex(log_file, Config())
+    reopened.load_or_build()
+    assert list(reopened.tombstones) == list(index.tombstones)
+
+
+def test_configured_ivfpq_index(temp_home, fake_embeddings):
+    Config().save_config({"indexing": {"index_type": "ivfpq", "nprobe": 4}})
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_lines(0, 20000))
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    (shard,) = index.manifest.data["shards"].values()
+    ann = shard["ann"]
+    assert ann["type"] == "ivfpq" and ann["nprobe"] == 4
+    assert [row["nprobe"] for row in ann["tradeoff"]][:2] == [1, 4]
+    assert len(index.similarity_search("request 42 handled", k=5)) == 5
+
+
+def _mapped_files():
+    with open("/proc/self/maps") as f:
+        return {line.split(None, 5)[5].strip() for line in f if len(line.split(None, 5)) == 6}
+
+
+@pytest.mark.skipif(not Path("/proc/self/maps").exists(), reason="needs /proc/self/maps")
+def test_reopened_shards_are_memory_mapped_until_written(temp_home, fake_embeddings):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(3, 50))
+    LogIndex(log_file, Config()).load_or_build()
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    assert not (index.cache_dir / "index.pkl").exists()
+    with sqlite3.connect(str(index.cache_dir / "docstore.sqlite")) as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]
+    # Chunk text is read back from the log, not duplicated in the docstore
+    assert "text" not in columns
+    results = index.similarity_search("hour 1 request 42 handled", k=3)
+    assert len(results) == 3 and all(doc.metadata["line"] >= 1 for doc in results)
+    # Every shard searched has its vectors mapped from its file, not copied into memory
+    paths = [str(index._shard_path(key)) for key in index.shard_keys()]
+    assert len(paths) == 3 and set(paths) <= _mapped_files()
+
+    with open(log_file, "a") as f:
+        f.write("2024-01-01 02:59:30 INFO hour 2 request 99 handled\n")
+    index.update()
+    newest = str(index._shard_path(index.shard_keys()[-1]))
+    # Only the shard written to is read into memory; the others stay mapped
+    assert newest not in _mapped_files() and set(paths[:2]) <= _mapped_files()
+    assert "request 99 handled" in "".join(doc.page_content for doc in _all_docs(index))
+
+
+def test_hourly_shards_limit_time_restricted_search(temp_home, fake_embeddings, monkeypatch):
+    log_file = Path(temp_home) / "app.log"
+    log_file.write_text(_hourly_lines(4, 50))
+
+    index = LogIndex(log_file, Config())
+    index.load_or_build()
+    hour = 1704067200  # 2024-01-01 00:00 UTC
+    assert index.shard_keys() == [str(hour // 3600 + h) for h in range(4)]
+    for doc in _all_docs(index):
+        # Chunks never mix records from different hours
+        hours = {line.split()[1][:2] for line in doc.page_content.splitlines()}
+        assert len(hours) == 1
+
+    searched = []
+    real_shard = index._shard
+    monkeypatch.setattr(index, "_shard", lambda key: searched.append(key) or real_shard(key))
+    results = index.similarity_search("request handled", k=20, since=hour + 3600, until=hour + 2 * 3600 - 1)
+    assert searched == [str(hour // 3600 + 1)]
+    assert results and all(" hour 1 " in doc.page_content for doc in results)
+
+    searched.clear()
+    assert len(index.similarity_search("request handled", k=5)) == 5
+    assert len(searched) == 4
+
+    # Appending to the newest hour rewrites only its shard
+    shard_files = {p.name: p.stat().st_mtime_ns for p in (index.cache_dir / "shards").iterdir()}
+    with open(log_file, "a") as f:
+        f.write("2024-01-01 03:59:00 INFO hour 3 request late handled\n2024-01-01 03:59:30 INFO done\n")
+    index.update()
+    changed = {p.name for p in (index.cache_dir / "shards").iterdir() if p.stat().st_mtime_ns != shard_files.get(p.name)}
+    assert changed == {f"{hour // 3600 + 3}.faiss"}
@@ -0,0 +1,35 @@
+from log_whisperer.ingest import iter_lines, iter_window_bytes
+
+
+def _write_log(tmp_path, lines):
+    log_file = tmp_path / "sample.log"
+    log_file.write_bytes("".join(lines).encode("utf-8"))
+    return log_file
+
+
+def test_windows_end_on_newlines_and_cover_file(tmp_path):
+    lines = [f"2024-01-01 00:00:{i % 60:02d} INFO request {i} ok\n" for i in range(500)]
+    log_file = _write_log(tmp_path, lines)
+
+    windows = list(iter_window_bytes(log_file, window_size=1000))
+
+    assert len(windows) > 1
+    assert all(raw.endswith(b"\n") for _, raw in windows)
+    assert b"".join(raw for _, raw in windows).decode("utf-8") == "".join(lines)
+    offsets = [offset for offset, _ in windows]
+    assert offsets == sorted(offsets)
+
+
+def test_lines_report_byte_offsets(tmp_path):
+    lines = ["INFO start\n", "WARN café closed\n", "ERROR boom\n"]
+    log_file = _write_log(tmp_path, lines)
+    raw = log_file.read_bytes()
+
+    for offset, line in iter_lines(log_file, window_size=8):
+        assert raw[offset:offset + len(line)] == line
+
+
+def test_empty_file_yields_nothing(tmp_path):
+    log_file = _write_log(tmp_path, [])
+    assert list(iter_window_bytes(log_file)) == []
+
@@ -0,0 +1,44 @@
+import sqlite3
+import threading
+
+from log_whisperer.lexical import BM25Index, reciprocal_rank_scores, tokenize
+
+
+def _index():
+    return BM25Index(sqlite3.connect(":memory:"), threading.RLock())
+
+
+def test_tokenize_keeps_compounds_and_their_parts():
+    terms = list(tokenize("ERROR db-01.prod: java.lang.NullPointerException req=ab12-cd34"))
+
+    assert "db-01.prod" in terms
+    assert "db" in terms and "prod" in terms
+    assert "nullpointerexception" in terms
+    assert "java.lang.nullpointerexception" in terms
+    assert "ab12-cd34" in terms
+
+
+def test_bm25_ranks_rare_exact_tokens_first():
+    index = _index()
+    texts = [f"INFO request {i} served by web-{i % 3}" for i in range(50)]
+    texts[17] = "ERROR request 17 failed with E4021 on db-02"
+    index.add(list(range(50)), texts)
+
+    assert index.search("E4021", 5)[0][0] == 17
+    assert index.search("what failed on db-02?", 5)[0][0] == 17
+    assert index.search("unknown-token", 5) == []
+
+
+def test_bm25_remove_keeps_statistics_consistent():
+    index = _index()
+    index.add([0, 1, 2], ["alpha beta", "beta gamma", "gamma delta"])
+    index.remove([1, 2])
+
+    assert [chunk for chunk, _ in index.search("beta gamma", 5)] == [0]
+    docs, length = [value for _, value in index._conn.execute("SELECT key, value FROM lexical_stats ORDER BY key")]
+    assert (docs, length) == (1, 2)
+    assert index._conn.execute("SELECT term FROM terms ORDER BY term").fetchall() == [("alpha",), ("beta",)]
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    assert [item for item, _ in reciprocal_rank_scores([[1, 2, 3], [3, 4, 1]])] == [1, 3, 2, 4]
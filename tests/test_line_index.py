@@ -0,0 +1,49 @@
+from log_whisperer.line_index import LineIndex
+
+
+def test_build_save_load_and_read(tmp_path):
+    lines = [f"line {i} é\n" for i in range(1000)]
+    log_file = tmp_path / "sample.log"
+    log_file.write_text("".join(lines), encoding="utf-8")
+
+    index = LineIndex.build(log_file, window_size=256)
+    assert index.line_count == 1000
+    assert index.indexed_bytes == log_file.stat().st_size
+
+    index.save(tmp_path)
+    loaded = LineIndex.load(tmp_path)
+    assert loaded.line_count == 1000
+    assert loaded.read_lines(log_file, 10, 12) == "".join(lines[10:13])
+
+    offset = len("".join(lines[:500]).encode("utf-8")) + 3
+    assert loaded.line_at_offset(offset) == 500
+
+
+def test_extend_after_append_with_partial_last_line(tmp_path):
+    log_file = tmp_path / "sample.log"
+    log_file.write_text("a\nb\npartial")
+    index = LineIndex.build(log_file)
+    assert index.line_count == 3
+
+    with open(log_file, "a") as f:
+        f.write(" line\nc\n")
+    extended = index.extend(log_file)
+
+    assert extended.line_count == 4
+    assert list(extended.offsets) == list(LineIndex.build(log_file).offsets)
+    assert extended.read_lines(log_file, 2, 2) == "partial line\n"
+
+
+def test_saving_leaves_loaded_copies_intact(tmp_path):
+    log_file = tmp_path / "sample.log"
+    log_file.write_text("a\nb\n")
+    LineIndex.build(log_file).save(tmp_path)
+    loaded = LineIndex.load(tmp_path)
+
+    log_file.write_text("longer line\n" * 10)
+    LineIndex.build(log_file).save(tmp_path)
+
+    # A session that mapped the old file keeps reading it whole
+    assert list(loaded.offsets) == [0, 2, 4]
+    assert LineIndex.load(tmp_path).line_count == 10
+    assert not (tmp_path / "lines.idx.tmp").exists()
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from log_whisperer.profile import NO_LEVEL, LogProfile, message_template
+
+
+def _at(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def _row(start, stamp, message):
+    line = f"{stamp} {message}" if stamp else message
+    return (start, start + len(line) + 1, 1, 1, _at(stamp) if stamp else None, line)
+
+
+def test_message_template_masks_variable_parts():
+    assert message_template(
+        "2024-01-31 10:00:00 ERROR timeout after 3000ms from 10.0.0.7:5432 req=deadbeef42 "
+        "id=123e4567-e89b-12d3-a456-426614174000"
+    ) == "timeout after <num>ms from <ip> req=<hex> id=<uuid>"
+    assert message_template("2024-01-31 10:00:00,123 WARN retry 2 of 5") == message_template(
+        "2024-02-01 11:30:00,999 WARN retry 4 of 5"
+    )
+
+
+def test_message_template_drops_the_service_after_the_level():
+    assert message_template("2024-01-31 12:00:00 ERROR [payment-service] timeout after 30ms") == (
+        "timeout after <num>ms"
+    )
+    assert message_template("2024-01-31 12:00:00 [ERROR] [pool-1-thread-3] - timeout after 12ms") == (
+        "timeout after <num>ms"
+    )
+    # Brackets elsewhere are part of the message
+    assert message_template("2024-01-31 12:00:00 ERROR timeout [payment-service]") == "timeout [payment-service]"
+
+
+def test_profile_counts_levels_templates_and_hours_exactly():
+    profile = LogProfile(sqlite3.connect(":memory:"), threading.RLock())
+    profile.add([
+        _row(0, "2024-01-31 10:00:00", "INFO started"),
+        _row(100, "2024-01-31 10:05:00", "ERROR timeout after 3000ms"),
+        _row(200, "2024-01-31 11:10:00", "ERROR timeout after 12ms"),
+        _row(300, "2024-01-31 11:20:00", "WARN disk 91% full"),
+        _row(400, None, "no timestamp here"),
+    ])
+    assert profile.levels() == {
+        "INFO": (1, _at("2024-01-31 10:00:00"), _at("2024-01-31 10:00:00")),
+        "ERROR": (2, _at("2024-01-31 10:05:00"), _at("2024-01-31 11:10:00")),
+        "WARN": (1, _at("2024-01-31 11:20:00"), _at("2024-01-31 11:20:00")),
+        NO_LEVEL: (1, None, None),
+    }
+    assert profile.templates()[0] == (
+        "ERROR", "timeout after <num>ms", 2, _at("2024-01-31 10:05:00"), _at("2024-01-31 11:10:00"),
+    )
+    hour = _at("2024-01-31 10:00:00")
+    assert profile.buckets() == {hour: {"INFO": 1, "ERROR": 1}, hour + 3600: {"ERROR": 1, "WARN": 1}}
+
+    summary = profile.summary()
+    assert "Records: 5, from 2024-01-31 10:00:00 to 2024-01-31 11:20:00 UTC" in summary
+    assert "ERROR 2 (first 2024-01-31 10:05:00, last 2024-01-31 11:10:00)" in summary
+    assert '- 2x ERROR "timeout after <num>ms"' in summary
+    assert "- 2024-01-31 11:00: 2 (ERROR 1, WARN 1)" in summary
+
+    # Re-indexing the tail recounts its buckets, including first/last seen
+    profile.remove_range(200)
+    assert profile.levels()["ERROR"] == (1, _at("2024-01-31 10:05:00"), _at("2024-01-31 10:05:00"))
+    assert set(profile.levels()) == {"INFO", "ERROR"}
+    assert profile.buckets() == {hour: {"INFO": 1, "ERROR": 1}}
+
+    profile.clear()
+    assert profile.summary() == ""
+
+
+def test_summary_merges_long_spans_into_few_periods():
+    profile = LogProfile(sqlite3.connect(":memory:"), threading.RLock())
+    profile.add([
+        _row(i, f"2024-01-{1 + i // 24:02d} {i % 24:02d}:00:00", "ERROR boom" if i % 24 == 3 else "INFO ok")
+        for i in range(24 * 10)
+    ])
+    summary = profile.summary()
+    assert "Records per day (UTC):" in summary
+    assert "- 2024-01-05 00:00: 24 (ERROR 1)" in summary
+    assert summary.count("\n- 2024-01-") == 10
@@ -0,0 +1,129 @@
+from log_whisperer.records import (
+    MAX_RECORD_BYTES,
+    LogRecordSplitter,
+    is_record_start,
+    iter_records,
+    last_record_start,
+    parse_timestamp,
+)
+
+JAVA_LOG = """2024-03-01 10:00:00,001 INFO  [main] c.e.App - Starting
+2024-03-01 10:00:01,002 ERROR [worker-1] c.e.Job - Job failed
+java.lang.IllegalStateException: boom
+\tat com.example.Job.run(Job.java:42)
+\tat java.lang.Thread.run(Thread.java:750)
+Caused by: java.io.IOException: disk full
+\t... 2 more
+2024-03-01 10:00:02,003 WARN  [main] c.e.App - Retrying
+"""
+
+PYTHON_LOG = """ERROR:root:Unhandled exception
+Traceback (most recent call last):
+  File "app.py", line 3, in <module>
+    main()
+ValueError: bad input
+INFO:root:Shutting down
+"""
+
+
+def test_record_start_detection():
+    assert is_record_start("2024-03-01T10:00:00Z something\n")
+    assert is_record_start("Mar  1 10:00:00 host sshd[1]: Accepted\n")
+    assert is_record_start("[2024-03-01 10:00:00] local.ERROR: oops\n")
+    assert is_record_start("WARNING:root:careful\n")
+    assert not is_record_start("\tat com.example.Job.run(Job.java:42)\n")
+    assert not is_record_start("Caused by: java.io.IOException\n")
+    assert not is_record_start("ValueError: bad input\n")
+
+
+def test_stack_traces_stay_with_their_record(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text(JAVA_LOG + PYTHON_LOG)
+
+    records = ["".join(line for _, line in record) for record in iter_records(log_file)]
+
+    assert len(records) == 5
+    assert records[1].startswith("2024-03-01 10:00:01,002 ERROR")
+    assert records[1].endswith("\t... 2 more\n")
+    assert records[3].endswith("ValueError: bad input\n")
+
+
+def test_lines_without_record_structure_are_records_of_their_own(tmp_path):
+    log_file = tmp_path / "app.jsonl"
+    log_file.write_text("".join(f'{{"level": "error", "msg": "request {i} failed"}}\n' for i in range(50)))
+
+    records = list(iter_records(log_file))
+
+    assert len(records) == 50
+    assert all(len(record) == 1 for record in records)
+
+
+def test_records_are_cut_at_the_size_cap(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text("ERROR once\n" + "plain text line\n" * 10000)
+
+    records = list(iter_records(log_file))
+
+    assert len(records) > 1
+    assert all(sum(len(line) for _, line in record) <= MAX_RECORD_BYTES + 16 for record in records)
+
+
+def test_chunks_pack_whole_records_without_overlap(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text(JAVA_LOG * 20)
+    raw = log_file.read_bytes()
+
+    chunks = list(LogRecordSplitter(chunk_size=600).iter_chunks(log_file))
+
+    assert "".join(text for _, text in chunks) == JAVA_LOG * 20
+    for offset, text in chunks:
+        assert raw[offset:].decode("utf-8").startswith(text)
+        assert is_record_start(text)
+        assert len(text) <= 600
+
+
+def test_oversized_record_is_split_on_lines(tmp_path):
+    log_file = tmp_path / "app.log"
+    record = "2024-03-01 10:00:00 ERROR huge\n" + "".join(f"\tat frame{i}\n" for i in range(200))
+    log_file.write_text(record)
+
+    chunks = list(LogRecordSplitter(chunk_size=300).iter_chunks(log_file))
+
+    assert len(chunks) > 1
+    assert "".join(text for _, text in chunks) == record
+    assert all(text.endswith("\n") for _, text in chunks)
+
+
+def test_last_record_start_points_at_open_record(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text(JAVA_LOG)
+    size = log_file.stat().st_size
+
+    assert last_record_start(log_file, 0, size) == JAVA_LOG.index("2024-03-01 10:00:02")
+
+
+def test_documents_carry_contiguous_byte_ranges(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text(JAVA_LOG * 5 + "2024-03-01 10:00:09 INFO tail without newline")
+    raw = log_file.read_bytes()
+
+    documents = list(LogRecordSplitter(chunk_size=600).iter_documents(log_file))
+
+    assert documents[0].metadata["start_index"] == 0
+    assert documents[-1].metadata["end_index"] == len(raw)
+    for doc, following in zip(documents, documents[1:]):
+        assert doc.metadata["end_index"] == following.metadata["start_index"]
+    for doc in documents:
+        start, end = doc.metadata["start_index"], doc.metadata["end_index"]
+        assert raw[start:end].decode("utf-8") == doc.page_content
+
+
+def test_parse_timestamp_formats():
+    expected = 1709287205.0  # 2024-03-01 10:00:05 UTC
+    assert parse_timestamp("2024-03-01 10:00:05,001 INFO x") == expected
+    assert parse_timestamp("[2024-03-01T10:00:05Z] x") == expected
+    assert parse_timestamp("01/Mar/2024:10:00:05 +0000 GET /") == expected
+    assert parse_timestamp("Mar  1 10:00:05 host sshd[1]: x", default_year=2024) == expected
+    assert parse_timestamp("1709287205 x") == expected
+    assert parse_timestamp("10:00:05.123 no date") is None
+    assert parse_timestamp("INFO:root:no timestamp") is None
@@ -0,0 +1,43 @@
+import calendar
+
+from log_whisperer.timerange import question_time_window
+
+DAY = calendar.timegm((2024, 1, 31, 0, 0, 0))
+SPAN = (DAY - 86400 + 20 * 3600, DAY + 12 * 3600)  # 2024-01-30 20:00 to 2024-01-31 12:00
+
+
+def test_single_moment_selects_a_window_around_it():
+    window = question_time_window("what happened around 10:32?", SPAN)
+    moment = DAY + 10 * 3600 + 32 * 60
+    assert (window.since, window.until, window.anchor) == (moment - 300, moment + 300, moment)
+
+    window = question_time_window("errors at 2:05:10 pm on 2024-02-03", SPAN, around=60)
+    moment = calendar.timegm((2024, 2, 3, 14, 5, 10))
+    assert (window.since, window.until, window.anchor) == (moment - 60, moment + 60, moment)
+
+
+def test_times_without_date_fall_inside_the_log_span():
+    # 22:00 only happened on the first day of the log
+    assert question_time_window("what failed at 22:00", SPAN).anchor == DAY - 2 * 3600
+    assert question_time_window("what failed at 11:00", SPAN).anchor == DAY + 11 * 3600
+    # Without a span there is nothing to date a bare time against
+    assert question_time_window("what failed at 11:00") is None
+
+
+def test_ranges_and_open_ranges():
+    window = question_time_window("errors between 10:00 and 10:15?", SPAN)
+    assert (window.since, window.until, window.anchor) == (DAY + 36000, DAY + 36900, None)
+    window = question_time_window("show 2024-01-31T09:00-2024-01-31 09:30", SPAN)
+    assert (window.since, window.until) == (DAY + 9 * 3600, DAY + 9 * 3600 + 1800)
+
+    window = question_time_window("anything after 11:30?", SPAN)
+    assert (window.since, window.until) == (DAY + 41400, None)
+    window = question_time_window("restarts before 2024-01-31 08:00", SPAN)
+    assert (window.since, window.until) == (None, DAY + 8 * 3600)
+    window = question_time_window("what went wrong on 2024-01-31", SPAN)
+    assert (window.since, window.until) == (DAY, DAY + 86400)
+
+
+def test_questions_without_times():
+    assert question_time_window("why is the payment service slow?", SPAN) is None
+    assert question_time_window("retries in version 10:3x", SPAN) is None
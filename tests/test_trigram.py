@@ -0,0 +1,51 @@
+import re
+import sqlite3
+import threading
+
+from log_whisperer.ingest import iter_lines
+from log_whisperer.trigram import TrigramIndex, required_literals, scan_lines
+
+
+def test_required_literals_follow_regex_structure():
+    assert required_literals(r"ERROR .*timeout after \d+ms") == [{b"error ", b"timeout after "}]
+    assert required_literals(r"(refused|closed) by peer") == [{b"refused", b" by peer"}, {b"closed", b" by peer"}]
+    assert required_literals(r"x?(abc)*\d+") == [set()]
+    assert required_literals(r"(?i)Connection") == [{b"connection"}]
+
+
+def test_grep_scans_only_candidate_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr("log_whisperer.trigram.GREP_BLOCK_SIZE", 1024)
+    lines = [f"2024-01-01 00:00:00 INFO request {i} served in {i % 7}ms\n" for i in range(2000)]
+    lines[1234] = "2024-01-01 00:00:00 ERROR upstream timeout after 3000ms\n"
+    log_file = tmp_path / "app.log"
+    log_file.write_text("".join(lines))
+    index = TrigramIndex(sqlite3.connect(":memory:"), threading.RLock(), str(log_file))
+    index.add_range(0, log_file.stat().st_size, 1)
+
+    matches, scanned, total = index.grep(r"timeout after \d+ms")
+
+    assert [(line, text) for line, _, text in matches] == [(1235, lines[1234].rstrip("\n"))]
+    assert scanned < total / 10
+    # Regexes without required literals fall back to scanning every block
+    matches, scanned, total = index.grep(r"served in [56]ms", limit=1000)
+    assert len(matches) == len([line for line in lines if re.search(r"served in [56]ms", line)])
+    assert scanned == total
+
+
+def test_scan_lines_streams_the_log_and_stops_at_the_limit(tmp_path, monkeypatch):
+    read = []
+
+    def small_windows(path, start, end):
+        for offset, raw in iter_lines(path, start, end, window_size=256):
+            read.append(offset)
+            yield offset, raw
+
+    monkeypatch.setattr("log_whisperer.trigram.iter_lines", small_windows)
+    lines = [f"2024-01-01 00:00:00 {'ERROR' if i % 10 == 9 else 'INFO'} request {i}\n" for i in range(1000)]
+    log_file = tmp_path / "app.log"
+    log_file.write_text("".join(lines))
+
+    matches = scan_lines(log_file, re.compile("ERROR"), 0, log_file.stat().st_size, 1, limit=2)
+
+    assert [(line, offset) for line, offset, _ in matches] == [(10, len("".join(lines[:9]))), (20, len("".join(lines[:19])))]
+    assert len(read) == 20